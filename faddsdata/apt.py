@@ -1,42 +1,251 @@
 # Handle data from APT.txt
 
-from faddsdata.format_definitions import APT_RECORD_MAP
-from faddsdata.parse import parse_line, convert_dashed_dms_to_float, convert_boolean
+from faddsdata.format_definitions import APT_RECORD_MAP, APT_TYPE_MAP, APT_INTERN_MAP, register_format
+from faddsdata.instrument import instrument, for_stream
+from faddsdata.parallel import iter_parallel, CHUNK_SIZE
+from faddsdata.parse import ParseException, LineFilter, compile_layout, iter_lines, open_file, add_derived_fields, if_present, compile_types, convert_types, intern_fields, convert_dashed_dms_to_float, convert_boolean
 
-def parse_apt_line(line):
-    "Parse a single line in the APT file"
+# Compiled layouts for each record type, built once at import
+APT_LAYOUTS = dict((record_type, compile_layout(definition)) for record_type, definition in APT_RECORD_MAP.items())
+
+# Useful values computed from the raw fields of each record type (see parse.add_derived_fields)
+APT_DERIVED_FIELDS = {
+    'APT': (('lat', 'point_latitude_formatted', convert_dashed_dms_to_float, None),
+            ('lon', 'point_longitude_formatted', convert_dashed_dms_to_float, None),
+            ('control_tower', 'control_tower', convert_boolean, None)),
+    'RWY': (('base_end_lat', 'base_end_latitude_physical_runway_end_formatted', convert_dashed_dms_to_float, if_present),
+            ('base_end_lon', 'base_end_longitude_physical_runway_end_formatted', convert_dashed_dms_to_float, if_present),
+            ('base_end_displaced_threshold_lat', 'base_end_latitude_displaced_threshold_formatted', convert_dashed_dms_to_float, if_present),
+            ('base_end_displaced_threshold_lon', 'base_end_longitude_displaced_threshold_formatted', convert_dashed_dms_to_float, if_present),
+            ('reciprocal_end_lat', 'reciprocal_end_latitude_physical_runway_end_formatted', convert_dashed_dms_to_float, if_present),
+            ('reciprocal_end_lon', 'reciprocal_end_longitude_physical_runway_end_formatted', convert_dashed_dms_to_float, if_present),
+            ('reciprocal_end_displaced_threshold_lat', 'reciprocal_end_latitude_physical_runway_end_formatted', convert_dashed_dms_to_float, if_present),
+            ('reciprocal_end_displaced_threshold_lon', 'reciprocal_end_longitude_physical_runway_end_formatted', convert_dashed_dms_to_float, if_present)),
+}
+
+# Converters for the typed fields of each record type (see parse.convert_types)
+APT_CONVERTERS = dict((record_type, compile_types(APT_TYPE_MAP.get(record_type, {}))) for record_type in APT_LAYOUTS)
+
+# Lazily decoded record classes for each record type
+APT_RECORD_CLASSES = dict((record_type, layout.record_class(APT_DERIVED_FIELDS.get(record_type, ()), record_type.title() + 'Record'))
+                          for record_type, layout in APT_LAYOUTS.items())
+APT_TYPED_RECORD_CLASSES = dict((record_type, layout.record_class(APT_DERIVED_FIELDS.get(record_type, ()), 'Typed' + record_type.title() + 'Record', APT_CONVERTERS[record_type]))
+                                for record_type, layout in APT_LAYOUTS.items())
+
+_interned = {}
+
+def apt_interned_fields(record_type, interned):
+    """The fields of a record type to intern: those in format_definitions.APT_INTERN_MAP if interned is
+    True, or else those of the given field names (a tuple) that the record type has"""
+    try:
+        return _interned[record_type, interned]
+    except KeyError:
+        if interned is True:
+            names = APT_INTERN_MAP.get(record_type, ())
+        else:
+            names = tuple(name for name in interned if name in APT_LAYOUTS[record_type].names)
+        _interned[record_type, interned] = names
+        return names
+
+_record_classes = {}
+
+def apt_record_class(record_type, typed=False, interned=()):
+    "The LazyRecord class for a record type, typed or not and interning the given fields"
+    if not interned:
+        return (APT_TYPED_RECORD_CLASSES if typed else APT_RECORD_CLASSES)[record_type]
+    try:
+        return _record_classes[record_type, typed, interned]
+    except KeyError:
+        record_class = _record_classes[record_type, typed, interned] = APT_LAYOUTS[record_type].record_class(
+            APT_DERIVED_FIELDS.get(record_type, ()), ('Typed' if typed else '') + record_type.title() + 'Record',
+            APT_CONVERTERS[record_type] if typed else (), interned)
+        return record_class
+
+_projections = {}
+
+def apt_projection(record_type, fields):
+    "The cached Projection of a record type's layout onto fields, which must be a tuple"
+    try:
+        return _projections[record_type, fields]
+    except KeyError:
+        known = set()
+        for name, layout in APT_LAYOUTS.items():
+            known.update(layout.names)
+            known.update(entry[0] for entry in APT_DERIVED_FIELDS.get(name, ()))
+        unknown = set(fields) - known
+        if unknown:
+            raise KeyError(', '.join(sorted(unknown)))
+        projection = _projections[record_type, fields] = APT_LAYOUTS[record_type].project(fields, APT_DERIVED_FIELDS.get(record_type, ()), strict=False)
+        return projection
+
+def _record_type(line):
     record_type = line[:3]
-    r = parse_line(line, APT_RECORD_MAP[record_type])
-    # Parse out useful coordinates
-    if (record_type == 'APT'):
-        r['lat'] = convert_dashed_dms_to_float(r['point_latitude_formatted'])
-        r['lon'] = convert_dashed_dms_to_float(r['point_longitude_formatted'])
-        r['control_tower'] = convert_boolean(r['control_tower'])
-    if (record_type == 'RWY'):
-        if r.get('base_end_latitude_physical_runway_end_formatted', False):
-            r['base_end_lat'] = convert_dashed_dms_to_float(r['base_end_latitude_physical_runway_end_formatted'])
-        if r.get('base_end_longitude_physical_runway_end_formatted', False):
-            r['base_end_lon'] = convert_dashed_dms_to_float(r['base_end_longitude_physical_runway_end_formatted'])
-        if r.get('base_end_latitude_displaced_threshold_formatted', False):
-            r['base_end_displaced_threshold_lat'] = convert_dashed_dms_to_float(r['base_end_latitude_displaced_threshold_formatted'])
-        if r.get('base_end_longitude_displaced_threshold_formatted', False):
-            r['base_end_displaced_threshold_lon'] = convert_dashed_dms_to_float(r['base_end_longitude_displaced_threshold_formatted'])
-        if r.get('reciprocal_end_latitude_physical_runway_end_formatted', False):
-            r['reciprocal_end_lat'] = convert_dashed_dms_to_float(r['reciprocal_end_latitude_physical_runway_end_formatted'])
-        if r.get('reciprocal_end_longitude_physical_runway_end_formatted', False):
-            r['reciprocal_end_lon'] = convert_dashed_dms_to_float(r['reciprocal_end_longitude_physical_runway_end_formatted'])
-        if r.get('reciprocal_end_latitude_physical_runway_end_formatted', False):
-            r['reciprocal_end_displaced_threshold_lat'] = convert_dashed_dms_to_float(r['reciprocal_end_latitude_physical_runway_end_formatted'])
-        if r.get('reciprocal_end_longitude_physical_runway_end_formatted', False):
-            r['reciprocal_end_displaced_threshold_lon'] = convert_dashed_dms_to_float(r['reciprocal_end_longitude_physical_runway_end_formatted'])
+    if not isinstance(record_type, str):
+        record_type = bytes(record_type).decode('latin-1')
+    return record_type
+
+@instrument('APT.txt', _record_type)
+def parse_apt_line(line, lazy=False, fields=None, typed=False, interned=False):
+    """Parse a single line in the APT file, given as str or as latin-1 bytes.
+    With lazy=True a LazyRecord is returned, which only decodes the fields that are read.
+    fields limits the result to those fields (including derived ones such as lat); the rest aren't
+    extracted at all. Fields that the line's record type doesn't have are left out.
+    With typed=True the fields in format_definitions.APT_TYPE_MAP are converted to numbers, dates and
+    booleans, blank or unreadable values becoming None; otherwise every raw field stays a string.
+    interned=True shares one string per distinct value between records for the fields in
+    format_definitions.APT_INTERN_MAP, which saves a lot of memory when many records are kept;
+    a list of field names interns those instead."""
+    record_type = _record_type(line)
+    if interned:
+        interned = apt_interned_fields(record_type, True if interned is True else tuple(interned))
+    if lazy:
+        if fields is not None:
+            raise ValueError("fields can't be combined with lazy records")
+        return apt_record_class(record_type, typed, interned)(line)
+    if fields is not None:
+        r = apt_projection(record_type, tuple(fields)).parse(line)
+    else:
+        r = APT_LAYOUTS[record_type].parse(line)
+        # Parse out useful coordinates
+        add_derived_fields(r, APT_DERIVED_FIELDS.get(record_type, ()))
+    if interned:
+        intern_fields(r, interned)
+    if typed:
+        convert_types(r, APT_CONVERTERS[record_type])
     return r
 
+def apt_line_filter(conditions):
+    """A test for raw APT.txt lines (see parse.LineFilter). A record type whose layout lacks any of the
+    condition fields never matches, so {'record_type': 'RWY', 'state_post_office_code': 'KS'} keeps only Kansas runways."""
+    known = set()
+    for layout in APT_LAYOUTS.values():
+        known.update(layout.names)
+    unknown = set(conditions) - known
+    if unknown:
+        raise KeyError(', '.join(sorted(unknown)))
+    filters = {}
+    for record_type, layout in APT_LAYOUTS.items():
+        if all(name in layout.names for name in conditions):
+            filters[record_type] = filters[record_type.encode('latin-1')] = LineFilter(layout, conditions)
+    def test(line):
+        line_filter = filters.get(bytes(line[:3]) if isinstance(line, memoryview) else line[:3])
+        return line_filter is not None and line_filter(line)
+    return test
+
+def iter_apt(fp, lazy=False, fields=None, where=None, typed=False, interned=False):
+    """Parse an open APT file one record at a time (see parse_apt_line for lazy, fields, typed and interned).
+    where skips lines before they are parsed: either a dict of conditions for apt_line_filter or any
+    function that takes a raw line and returns True to keep it."""
+    if fields is not None:
+        fields = tuple(fields)
+    if interned and interned is not True:
+        interned = tuple(interned)
+    if isinstance(where, dict):
+        where = apt_line_filter(where)
+    parse = for_stream(parse_apt_line)
+    for line in iter_lines(fp, source='APT.txt'):
+        if where is None or where(line):
+            yield parse(line, lazy, fields, typed, interned)
+
+# The list each kind of child line is attached to on a facility
+FACILITY_CHILDREN = {
+    'ATT': 'attendance',
+    'RWY': 'runways',
+    'ARS': 'arresting_gear',
+    'RMK': 'remarks',
+}
+
+def _new_facility(record):
+    for key in FACILITY_CHILDREN.values():
+        record[key] = []
+    return record
+
+def iter_apt_facilities(fp, presorted=True, typed=False, interned=False):
+    """Parse an open APT file into one dict per facility: the APT record with its ATT, RWY, ARS and RMK
+    records attached as lists under the keys in FACILITY_CHILDREN.
+
+    APT.txt lists each facility's lines together, so by default only one facility is held in memory
+    at a time and a child line that doesn't follow its APT line raises ParseException. With
+    presorted=False the file must be seekable: a first pass from the current position records the
+    offsets of every line by facility_site_number, then each facility is read back from those offsets.
+    In either mode a child line whose facility has no APT line raises ParseException.
+    typed and interned are as for parse_apt_line."""
+    if not presorted:
+        for facility in _iter_unsorted_facilities(fp, typed, interned):
+            yield facility
+        return
+    facility = None
+    for record in iter_apt(fp, typed=typed, interned=interned):
+        record_type = record['record_type']
+        if record_type == 'APT':
+            if facility is not None:
+                yield facility
+            facility = _new_facility(record)
+        elif facility is None or record['facility_site_number'] != facility['facility_site_number']:
+            raise ParseException("%s line for %s is not with its APT line; use presorted=False" % (record_type, record['facility_site_number']))
+        else:
+            facility[FACILITY_CHILDREN[record_type]].append(record)
+    if facility is not None:
+        yield facility
+
+def _iter_unsorted_facilities(fp, typed=False, interned=False):
+    # work on the bytes underneath a text file so line offsets are plain byte counts; text streams
+    # with nothing underneath (StringIO) are read as str with the offsets tell() gives
+    encoding = getattr(fp, 'encoding', None) or 'latin-1'
+    raw = getattr(fp, 'buffer', None)
+    if raw is None:
+        raw = fp
+    else:
+        raw.seek(fp.tell())
+    start = raw.tell()
+    binary = not isinstance(raw.read(0), str)
+    apt = b'APT' if binary else 'APT'
+    site = APT_LAYOUTS['APT'].slices[APT_LAYOUTS['APT'].names.index('facility_site_number')]
+    facilities = []
+    sites = set()
+    children = {}
+    offset = start
+    while True:
+        if not binary:
+            offset = raw.tell()
+        line = raw.readline()
+        if not line:
+            break
+        if line[:3] == apt:
+            facilities.append(offset)
+            sites.add(line[site].strip())
+        else:
+            children.setdefault(line[site].strip(), []).append(offset)
+        if binary:
+            offset += len(line)
+    orphans = sorted(set(children) - sites)
+    if orphans:
+        raise ParseException("No APT line for the lines of %s" % ', '.join(
+            (orphan.decode(encoding) if binary else orphan) or 'blank facility_site_number' for orphan in orphans))
+    for offset in facilities:
+        raw.seek(offset)
+        line = raw.readline()
+        facility = _new_facility(parse_apt_line(line.decode(encoding) if binary else line, typed=typed, interned=interned))
+        for child_offset in children.get(line[site].strip(), ()):
+            raw.seek(child_offset)
+            line = raw.readline()
+            record = parse_apt_line(line.decode(encoding) if binary else line, typed=typed, interned=interned)
+            facility[FACILITY_CHILDREN[record['record_type']]].append(record)
+        yield facility
+
+def iter_apt_parallel(path, workers=None, chunk_size=CHUNK_SIZE):
+    """Parse an APT file across a pool of worker processes, one per core unless workers is given.
+    Records come back in the same order as iter_apt."""
+    return iter_parallel(path, parse_apt_line, workers, chunk_size)
+
+register_format('APT.txt', APT_RECORD_MAP, APT_DERIVED_FIELDS, APT_TYPE_MAP, APT_INTERN_MAP, reader=iter_apt)
+
 if __name__ == '__main__':
     path = '/Users/nelson/Downloads/56DySubscription_November_18__2010_-_January_13__2011/'
-    raw = open(path + 'APT.txt')
+    raw = open_file(path + 'APT.txt')
 
-    for line in raw:
-        val = parse_apt_line(line)
+    for val in iter_apt(raw):
+        pass
         
 import unittest
 # Test data from 56DySubscription_November_18__2010_-_January_13__2011
@@ -76,3 +285,187 @@ class AptTests(unittest.TestCase):
         self.assertEqual('06721.*A', rmk['facility_site_number'])
         self.assertEqual('ACTVT MIRL RYS 01/19 & 15/33; PAPI RYS 01 & 19 AND 15 & 33; REIL RYS 01 & 19; MALSR RY 33 - CTAF.',
                          rmk['element_text'])
+
+    def test_iter_apt(self):
+        from io import StringIO
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS, RMK_RECORDS
+        apt = format_line({'record_type': 'APT', 'facility_site_number': '06721.*A', 'location_identifier': 'LWC',
+                           'point_latitude_formatted': '39-00-40.0000N', 'point_longitude_formatted': '095-12-59.3000W',
+                           'control_tower': 'N'}, APT_RECORDS)
+        rmk = format_line({'record_type': 'RMK', 'facility_site_number': '06721.*A', 'element_text': 'CTAF.'}, RMK_RECORDS)
+        records = iter_apt(StringIO(apt + '\n' + rmk + '\n'))
+        self.assertEqual('LWC', next(records)['location_identifier'])
+        self.assertEqual('CTAF.', next(records)['element_text'])
+        self.assertRaises(StopIteration, next, records)
+
+    def facility_lines(self):
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS, RWY_RECORDS, RMK_RECORDS, ATT_RECORDS
+        lines = []
+        for site in ('00001.*A', '00002.*A'):
+            lines.append(format_line({'record_type': 'APT', 'facility_site_number': site, 'point_latitude_formatted': '39-00-40.0000N',
+                                      'point_longitude_formatted': '095-12-59.3000W', 'control_tower': 'N'}, APT_RECORDS))
+            lines.append(format_line({'record_type': 'ATT', 'facility_site_number': site, 'attendance_schedule': 'ALL/ALL/0800-2000'}, ATT_RECORDS))
+            lines.append(format_line({'record_type': 'RWY', 'facility_site_number': site, 'runway_identification': '01/19'}, RWY_RECORDS))
+            lines.append(format_line({'record_type': 'RWY', 'facility_site_number': site, 'runway_identification': '15/33'}, RWY_RECORDS))
+            lines.append(format_line({'record_type': 'RMK', 'facility_site_number': site, 'element_text': 'CTAF.'}, RMK_RECORDS))
+        return [line + '\n' for line in lines]
+
+    def test_iter_apt_facilities(self):
+        from io import StringIO
+        lines = self.facility_lines()
+        facilities = list(iter_apt_facilities(StringIO(''.join(lines))))
+        self.assertEqual(['00001.*A', '00002.*A'], [f['facility_site_number'] for f in facilities])
+        self.assertEqual(['01/19', '15/33'], [r['runway_identification'] for r in facilities[1]['runways']])
+        self.assertEqual('ALL/ALL/0800-2000', facilities[0]['attendance'][0]['attendance_schedule'])
+        self.assertEqual(1, len(facilities[0]['remarks']))
+        self.assertEqual([], facilities[0]['arresting_gear'])
+        # a runway that wandered away from its airport
+        lines.append(lines.pop(2))
+        self.assertRaises(ParseException, list, iter_apt_facilities(StringIO(''.join(lines))))
+
+    def test_iter_apt_facilities_unsorted(self):
+        import io
+        lines = self.facility_lines()
+        expected = list(iter_apt_facilities(io.StringIO(''.join(lines))))
+        unsorted = sorted(lines, key=lambda line: line[:3] != 'RWY')
+        data = ''.join(unsorted).encode('latin-1')
+        self.assertEqual(expected, list(iter_apt_facilities(io.BytesIO(data), presorted=False)))
+        self.assertEqual(expected, list(iter_apt_facilities(io.TextIOWrapper(io.BytesIO(data), encoding='latin-1'), presorted=False)))
+        self.assertEqual(expected, list(iter_apt_facilities(io.StringIO(''.join(unsorted)), presorted=False)))
+        # reading starts where the stream was left
+        for stream in (io.BytesIO(b'skipped\n' + data), io.StringIO('skipped\n' + ''.join(unsorted))):
+            stream.readline()
+            self.assertEqual(expected, list(iter_apt_facilities(stream, presorted=False)))
+        # a child line without its APT line is an error in both modes
+        orphan = [line for line in lines if line[:3] == 'RWY'][0].replace('00001.*A', '00009.*A', 1)
+        self.assertRaisesRegex(ParseException, 'not with its APT line', list, iter_apt_facilities(io.StringIO(''.join(lines) + orphan)))
+        self.assertRaisesRegex(ParseException, '00009.\\*A', list, iter_apt_facilities(io.BytesIO(data + orphan.encode('latin-1')), presorted=False))
+        self.assertRaisesRegex(ParseException, '00009.\\*A', list, iter_apt_facilities(io.StringIO(''.join(unsorted) + orphan), presorted=False))
+
+    def test_lazy(self):
+        lines = self.facility_lines()
+        for line in lines:
+            self.assertEqual(parse_apt_line(line), parse_apt_line(line, lazy=True).as_dict())
+        apt = parse_apt_line(lines[0], lazy=True)
+        self.assertEqual(False, apt['control_tower'])
+        self.assertAlmostEqual(39.01111111, apt['lat'])
+        self.assertEqual('AptRecord', type(apt).__name__)
+
+    def test_typed(self):
+        import datetime
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS, RWY_RECORDS
+        apt = format_line({'record_type': 'APT', 'facility_site_number': '00001.*A', 'information_effective_date': '10/17/2013',
+                           'point_latitude_formatted': '39-00-40.0000N', 'point_longitude_formatted': '095-12-59.3000W', 'elevation_msl': '833.3', 'singles_based': '42',
+                           'activation_date': '04/1940', 'landing_fees': 'N', 'control_tower': 'N'}, APT_RECORDS) + '\n'
+        rwy = format_line({'record_type': 'RWY', 'facility_site_number': '00001.*A', 'runway_identification': '01/19',
+                           'runway_length': '3901', 'base_end_righthand_traffic': 'Y'}, RWY_RECORDS) + '\n'
+        for record in (parse_apt_line(apt, typed=True), parse_apt_line(apt, lazy=True, typed=True)):
+            self.assertEqual(datetime.date(2013, 10, 17), record['information_effective_date'])
+            self.assertAlmostEqual(39.01111111, record['point_latitude_formatted'])
+            self.assertAlmostEqual(39.01111111, record['lat'])
+            self.assertEqual(833.3, record['elevation_msl'])
+            self.assertEqual(42, record['singles_based'])
+            self.assertEqual(None, record['jets_based'])
+            self.assertEqual(datetime.date(1940, 4, 1), record['activation_date'])
+            self.assertEqual(False, record['landing_fees'])
+            self.assertEqual(None, record['medical_use'])
+            self.assertEqual('00001.*A', record['facility_site_number'])
+        self.assertEqual(parse_apt_line(apt, typed=True), parse_apt_line(apt, lazy=True, typed=True).as_dict())
+        self.assertEqual({'elevation_msl': 833.3, 'lat': parse_apt_line(apt)['lat']}, parse_apt_line(apt, fields=('elevation_msl', 'lat'), typed=True))
+        runway = parse_apt_line(rwy, typed=True)
+        self.assertEqual(3901, runway['runway_length'])
+        self.assertEqual(True, runway['base_end_righthand_traffic'])
+        self.assertEqual(None, runway['base_end_latitude_physical_runway_end_formatted'])
+        self.assertEqual('3901', parse_apt_line(rwy)['runway_length'])
+
+    def test_instrument(self):
+        from io import StringIO
+        from faddsdata.instrument import instrumented
+        lines = self.facility_lines()
+        with instrumented() as stats:
+            records = list(iter_apt(StringIO(''.join(lines))))
+            self.assertRaises(KeyError, parse_apt_line, 'XYZ' + lines[0][3:])
+        self.assertEqual(list(iter_apt(StringIO(''.join(lines)))), records)
+        by_type = stats.by_record_type()
+        self.assertEqual(['APT', 'ATT', 'RMK', 'RWY', 'XYZ'], sorted(by_type))
+        self.assertEqual(4, by_type['RWY']['count'])
+        self.assertEqual(sum(len(line) for line in lines if line.startswith('RWY')), by_type['RWY']['size'])
+        self.assertEqual(1, by_type['XYZ']['errors'])
+        self.assertEqual(0, by_type['APT']['errors'])
+        self.assertEqual(sum(map(len, lines)), stats.totals['APT.txt', 'read', None][1])
+
+    def test_interned(self):
+        from io import StringIO
+        from faddsdata.format_definitions import APT_INTERN_MAP
+        lines = self.facility_lines()
+        for lazy in (False, True):
+            records = list(iter_apt(StringIO(''.join(lines)), lazy=lazy, interned=True))
+            self.assertEqual(list(iter_apt(StringIO(''.join(lines)), lazy=lazy)), records)
+            self.assertTrue(records[0]['facility_site_number'] is records[2]['facility_site_number'])
+            self.assertTrue(records[2]['record_type'] is records[3]['record_type'])
+            self.assertEqual(False, records[0]['control_tower'])
+            self.assertTrue(records[0]['record_type'] is records[5]['record_type'])
+        typed = list(iter_apt(StringIO(''.join(lines)), typed=True, interned=True))
+        self.assertEqual(list(iter_apt(StringIO(''.join(lines)), typed=True)), typed)
+        self.assertTrue('control_tower' in APT_INTERN_MAP['APT'])
+        # only the fields asked for
+        records = list(iter_apt(StringIO(''.join(lines)), interned=['state_post_office_code']))
+        self.assertTrue(records[2]['state_post_office_code'] is records[3]['state_post_office_code'])
+        self.assertFalse(records[2]['facility_site_number'] is records[3]['facility_site_number'])
+
+    def test_fields(self):
+        from io import StringIO
+        lines = self.facility_lines()
+        fields = ('record_type', 'location_identifier', 'lat', 'lon', 'runway_identification', 'control_tower')
+        records = list(iter_apt(StringIO(''.join(lines)), fields=fields))
+        for line, record in zip(lines, records):
+            full = parse_apt_line(line)
+            self.assertEqual(dict((k, v) for k, v in full.items() if k in fields), record)
+        self.assertEqual(['record_type', 'location_identifier', 'control_tower', 'lat', 'lon'], list(records[0]))
+        self.assertEqual({'record_type': 'RWY', 'runway_identification': '01/19'}, records[2])
+        self.assertRaises(KeyError, parse_apt_line, lines[0], fields=['no_such_field'])
+        self.assertRaises(ValueError, parse_apt_line, lines[0], lazy=True, fields=['lat'])
+
+    def test_where(self):
+        from io import StringIO, BytesIO
+        from faddsdata.parse import Prefix
+        lines = self.facility_lines()
+        data = ''.join(lines)
+        runways = list(iter_apt(StringIO(data), where={'record_type': 'RWY', 'facility_site_number': Prefix('00002')}))
+        self.assertEqual([parse_apt_line(lines[7]), parse_apt_line(lines[8])], runways)
+        self.assertEqual(runways, list(iter_apt(BytesIO(data.encode('latin-1')), where={'record_type': 'RWY', 'facility_site_number': Prefix('00002')})))
+        # only APT lines have an associated_state_post_office_code
+        self.assertEqual(['APT', 'APT'], [r['record_type'] for r in iter_apt(StringIO(data), where={'associated_state_post_office_code': ''})])
+        self.assertEqual(2, len(list(iter_apt(StringIO(data), where=lambda line: line.startswith('RMK')))))
+        self.assertRaises(KeyError, apt_line_filter, {'no_such_field': 'KS'})
+
+    def test_bytes(self):
+        from io import BytesIO
+        lines = self.facility_lines()
+        data = ''.join(lines).encode('latin-1')
+        self.assertEqual([parse_apt_line(line) for line in lines], list(iter_apt(BytesIO(data))))
+        self.assertEqual([parse_apt_line(line) for line in lines], [r.as_dict() for r in iter_apt(BytesIO(data), lazy=True)])
+
+    def test_iter_apt_parallel(self):
+        import os, tempfile
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS, RWY_RECORDS
+        lines = []
+        for i in range(50):
+            lines.append(format_line({'record_type': 'APT', 'facility_site_number': '%05d.*A' % i, 'facility_name': 'FIELD \xd1O %d' % i,
+                                      'point_latitude_formatted': '39-00-40.0000N', 'point_longitude_formatted': '095-12-59.3000W',
+                                      'control_tower': 'Y'}, APT_RECORDS))
+            lines.append(format_line({'record_type': 'RWY', 'facility_site_number': '%05d.*A' % i, 'runway_identification': '01/19',
+                                      'base_end_latitude_physical_runway_end_formatted': '39-00-19.0108N'}, RWY_RECORDS))
+        fd, path = tempfile.mkstemp()
+        try:
+            with os.fdopen(fd, 'w', encoding='latin-1') as fp:
+                fp.write('\n'.join(lines) + '\n')
+            with open(path, encoding='latin-1') as fp:
+                serial = [parse_apt_line(line) for line in fp]
+            self.assertEqual(serial, list(iter_apt_parallel(path, workers=3, chunk_size=4096)))
+        finally:
+            os.remove(path)
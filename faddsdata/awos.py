@@ -1,22 +1,102 @@
 # Handle data from AWOS.txt
 
-from parse import parse_line, convert_dashed_dms_to_float
-from format_definitions.awos import AWOS_RECORDS
-
-def parse_awos_line(line):
-    "Parse a single line in the AWOS file"
-    r = parse_line(line, AWOS_RECORDS)
-    # Parse out useful coordinates
-    if r['record_type'] == 'AWOS1':  # only if it's a record type 1
-        if r['latitude']:
-            r['lat'] = convert_dashed_dms_to_float(r['latitude'])
-        if r['longitude']:
-            r['lon'] = convert_dashed_dms_to_float(r['longitude'])
+from faddsdata.parse import LineFilter, compile_layout, iter_lines, open_file, add_derived_fields, compile_types, convert_types, intern_fields, convert_dashed_dms_to_float
+from faddsdata.format_definitions import AWOS_RECORDS, AWOS_TYPES, AWOS_INTERNED, register_format
+from faddsdata.instrument import instrument, for_stream
+
+AWOS_LAYOUT = compile_layout(AWOS_RECORDS)
+
+def _awos1_coordinate(record, value):
+    # only if it's a record type 1
+    return record['record_type'] == 'AWOS1' and bool(value)
+_awos1_coordinate.fields = ('record_type',)
+
+AWOS_DERIVED_FIELDS = (('lat', 'latitude', convert_dashed_dms_to_float, _awos1_coordinate),
+                       ('lon', 'longitude', convert_dashed_dms_to_float, _awos1_coordinate))
+
+AWOS_CONVERTERS = compile_types(AWOS_TYPES)
+
+AwosRecord = AWOS_LAYOUT.record_class(AWOS_DERIVED_FIELDS, 'AwosRecord')
+TypedAwosRecord = AWOS_LAYOUT.record_class(AWOS_DERIVED_FIELDS, 'TypedAwosRecord', AWOS_CONVERTERS)
+
+_interned = {}
+
+def awos_interned_fields(interned):
+    "The fields to intern: AWOS_INTERNED if interned is True, or else those of the given names (a tuple) that AWOS has"
+    try:
+        return _interned[interned]
+    except KeyError:
+        names = _interned[interned] = AWOS_INTERNED if interned is True else tuple(name for name in interned if name in AWOS_LAYOUT.names)
+        return names
+
+_record_classes = {}
+
+def awos_record_class(typed=False, interned=()):
+    "The LazyRecord class for AWOS records, typed or not and interning the given fields"
+    if not interned:
+        return TypedAwosRecord if typed else AwosRecord
+    try:
+        return _record_classes[typed, interned]
+    except KeyError:
+        record_class = _record_classes[typed, interned] = AWOS_LAYOUT.record_class(
+            AWOS_DERIVED_FIELDS, 'TypedAwosRecord' if typed else 'AwosRecord', AWOS_CONVERTERS if typed else (), interned)
+        return record_class
+
+_projections = {}
+
+def _record_type(line):
+    record_type = line[:5]
+    if not isinstance(record_type, str):
+        record_type = bytes(record_type).decode('latin-1')
+    return record_type
+
+@instrument('AWOS.txt', _record_type)
+def parse_awos_line(line, lazy=False, fields=None, typed=False, interned=False):
+    """Parse a single line in the AWOS file, as a LazyRecord if lazy is set.
+    fields limits the result to those fields (including lat and lon); the rest aren't extracted.
+    typed converts the fields in format_definitions.AWOS_TYPES from strings, and interned shares
+    the strings of the fields in AWOS_INTERNED (or of a list of field names) between records."""
+    if interned:
+        interned = awos_interned_fields(True if interned is True else tuple(interned))
+    if lazy:
+        if fields is not None:
+            raise ValueError("fields can't be combined with lazy records")
+        return awos_record_class(typed, interned)(line)
+    if fields is not None:
+        fields = tuple(fields)
+        projection = _projections.get(fields)
+        if projection is None:
+            projection = _projections[fields] = AWOS_LAYOUT.project(fields, AWOS_DERIVED_FIELDS)
+        r = projection.parse(line)
+    else:
+        r = AWOS_LAYOUT.parse(line)
+        # Parse out useful coordinates
+        add_derived_fields(r, AWOS_DERIVED_FIELDS)
+    if interned:
+        intern_fields(r, interned)
+    if typed:
+        convert_types(r, AWOS_CONVERTERS)
     return r
 
+def iter_awos(fp, lazy=False, fields=None, where=None, typed=False, interned=False):
+    """Parse an open AWOS file one record at a time. where is a dict of parse.LineFilter conditions,
+    or a function of the raw line, and lines that don't match aren't parsed."""
+    if fields is not None:
+        fields = tuple(fields)
+    if interned and interned is not True:
+        interned = tuple(interned)
+    if isinstance(where, dict):
+        where = LineFilter(AWOS_LAYOUT, where)
+    parse = for_stream(parse_awos_line)
+    for line in iter_lines(fp, source='AWOS.txt'):
+        if where is None or where(line):
+            yield parse(line, lazy, fields, typed, interned)
+
+register_format('AWOS.txt', AWOS_RECORDS, AWOS_DERIVED_FIELDS, AWOS_TYPES, AWOS_INTERNED, reader=iter_awos)
+
 if __name__ == '__main__':
     path = '/Users/adam/Downloads/56DySubscription_November_18__2010_-_January_13__2011/'
-    raw = open(path + 'AWOS.txt')
+    raw = open_file(path + 'AWOS.txt')
 
-    for line in raw:
-        val = parse_apt_line(line)
+    for val in iter_awos(raw):
+        pass
@@ -0,0 +1,577 @@
+"""Rough throughput benchmarks for the FADDS parsers.
+
+Run with "python -m faddsdata.benchmark". The lines are synthetic but laid out with
+the real format definitions, so the widths and field counts match a subscription.
+
+"python -m faddsdata.benchmark --suite --json results.json" runs the suite on files from
+faddsdata.synthetic and saves lines/s, MB/s and peak memory for each benchmark; pass an
+earlier file with --baseline to have slowdowns reported and the exit status set."""
+
+import time
+
+from faddsdata.format_definitions import APT_RECORD_MAP, AWOS_RECORDS
+from faddsdata.natfix import NATFIX_RECORDS
+from faddsdata.parse import ParseException, format_line, compile_layout, convert_dms_to_float, convert_dashed_dms_to_float
+
+def reference_parse_line(data, definition):
+    "parse_line as it was before compiled layouts, recomputing the offsets on every call"
+    data = data.replace('\r', '').replace('\n', '')
+    splits = []
+    start = 0
+    end = 0
+    for width in list(zip(*definition))[1]:
+        end += width
+        splits.append((start, end))
+        start += width
+    if not (len(data) == end):
+        raise ParseException("Expected length %d, got length %d" % (end, len(data)))
+    r = {}
+    for (name, _), (start, end) in zip(definition, splits):
+        if name is not None:
+            r[name] = data[start:end].strip().replace('\xfa', '').replace('\xd1', 'N').replace('\xbf', '').replace('\xb4', '').replace('\xb0', '')
+    return r
+
+def sample_line(definition):
+    "A line that fills roughly half of every named field"
+    values = {}
+    for name, width in definition:
+        if name is not None:
+            values[name] = 'X' * ((width + 1) // 2)
+    return format_line(values, definition) + '\n'
+
+def lines_per_second(func, lines, seconds=1.0):
+    "Call func on each of the lines repeatedly for about the given time and return the rate"
+    count = 0
+    start = time.perf_counter()
+    elapsed = 0.0
+    while elapsed < seconds:
+        for line in lines:
+            func(line)
+        count += len(lines)
+        elapsed = time.perf_counter() - start
+    return count / elapsed
+
+def run_coordinates(count=200000):
+    "Compare the scalar coordinate converters with the vectorized ones in faddsdata.columnar"
+    from faddsdata import columnar
+    if columnar.np is None:
+        print("numpy is not installed, skipping coordinate conversion")
+        return
+    print("%-16s %14s %14s %8s" % ("coordinates", "scalar /s", "vectorized /s", "speedup"))
+    for label, scalar, vectorized, values in (
+            ('dashed DMS', convert_dashed_dms_to_float, columnar.dashed_dms_to_float_array,
+             ['%02d-%02d-%02d.%04dN' % (i % 90, i % 60, (i // 60) % 60, i % 10000) for i in range(count)]),
+            ('DMS', convert_dms_to_float, columnar.dms_to_float_array,
+             ['%03d%02d%02dW' % (i % 180, i % 60, (i // 60) % 60) for i in range(count)])):
+        start = time.perf_counter()
+        for value in values:
+            scalar(value)
+        before = count / (time.perf_counter() - start)
+        array = columnar.np.array(values, dtype='S')
+        start = time.perf_counter()
+        vectorized(array)
+        after = count / (time.perf_counter() - start)
+        print("%-16s %14d %14d %7.2fx" % (label, before, after, after / before))
+
+def run_spatial(count=20000, queries=200):
+    "Compare SpatialIndex queries with a scan over every record"
+    import random
+    from faddsdata.spatial import SpatialIndex, brute_force_nearest, great_circle_nm
+    generator = random.Random(0)
+    # roughly the continental US, where most airports and fixes are
+    records = [{'lat': generator.uniform(25, 49), 'lon': generator.uniform(-125, -67)} for i in range(count)]
+    points = [(generator.uniform(25, 49), generator.uniform(-125, -67)) for i in range(queries)]
+    start = time.perf_counter()
+    index = SpatialIndex(records)
+    print("built a SpatialIndex over %d records in %.3fs" % (count, time.perf_counter() - start))
+    print("%-16s %14s %14s %8s" % ("spatial", "scan /s", "index /s", "speedup"))
+    for label, scan, query in (
+            ('nearest 5', lambda lat, lon: brute_force_nearest(records, lat, lon, 5), lambda lat, lon: index.nearest(lat, lon, 5)),
+            ('within 25 nm', lambda lat, lon: [r for r in records if great_circle_nm(lat, lon, r['lat'], r['lon']) <= 25],
+             lambda lat, lon: index.within(lat, lon, 25))):
+        start = time.perf_counter()
+        for lat, lon in points[:20]:
+            scan(lat, lon)
+        before = 20 / (time.perf_counter() - start)
+        start = time.perf_counter()
+        for lat, lon in points:
+            query(lat, lon)
+        after = queries / (time.perf_counter() - start)
+        print("%-16s %14d %14d %7.0fx" % (label, before, after, after / before))
+
+def sample_apt_lines(count):
+    "Synthetic APT.txt lines: each facility with an APT, two RWY and a RMK line"
+    from faddsdata.format_definitions import APT_RECORDS, RWY_RECORDS, RMK_RECORDS
+    lines = []
+    for i in range(count // 4):
+        site = '%05d.*A' % i
+        apt = dict((name, 'X' * ((width + 1) // 2)) for name, width in APT_RECORDS if name)
+        apt.update({'record_type': 'APT', 'facility_site_number': site, 'point_latitude_formatted': '39-00-40.0000N',
+                    'point_longitude_formatted': '095-12-59.3000W', 'control_tower': 'Y'})
+        lines.append(format_line(apt, APT_RECORDS) + '\n')
+        for runway in ('01/19', '15/33'):
+            rwy = dict((name, 'X' * ((width + 1) // 2)) for name, width in RWY_RECORDS if name and not name.endswith('formatted'))
+            rwy.update({'record_type': 'RWY', 'facility_site_number': site, 'runway_identification': runway,
+                        'base_end_latitude_physical_runway_end_formatted': '39-00-19.0108N',
+                        'base_end_longitude_physical_runway_end_formatted': '095-13-11.8792W'})
+            lines.append(format_line(rwy, RWY_RECORDS) + '\n')
+        lines.append(format_line({'record_type': 'RMK', 'facility_site_number': site, 'element_text': 'Y' * 200}, RMK_RECORDS) + '\n')
+    return lines
+
+def run_lazy(count=40000):
+    "Compare eager dicts with lazily decoded records from str and bytes lines, reading three fields of each"
+    import gc
+    import tracemalloc
+    from faddsdata.apt import parse_apt_line
+    lines = sample_apt_lines(count)
+    raw = [line.encode('latin-1') for line in lines]
+    print("%-16s %14s %14s" % ("APT.txt records", "lines/s", "peak MB"))
+    for label, source, lazy in (('dict', lines, False), ('lazy', lines, True),
+                                ('bytes dict', raw, False), ('bytes lazy', raw, True)):
+        start = time.perf_counter()
+        for line in source:
+            record = parse_apt_line(line, lazy)
+            record['record_type'], record['facility_site_number'], record.get('lat')
+        rate = len(source) / (time.perf_counter() - start)
+        gc.collect()
+        tracemalloc.start()
+        records = [parse_apt_line(line, lazy) for line in source]
+        for record in records:
+            record['record_type'], record['facility_site_number'], record.get('lat')
+        peak = tracemalloc.get_traced_memory()[1]
+        tracemalloc.stop()
+        del records
+        print("%-16s %14d %14.1f" % (label, rate, peak / 1e6))
+
+def run_projection(count=40000):
+    "Compare parsing every field with parsing a few through fields="
+    from faddsdata.apt import parse_apt_line
+    lines = sample_apt_lines(count)
+    print("%-24s %14s %8s" % ("APT.txt projection", "lines/s", "speedup"))
+    baseline = None
+    for label, fields in (('all fields', None),
+                          ('5 fields', ('location_identifier', 'facility_name', 'lat', 'lon', 'elevation_msl')),
+                          ('2 raw fields', ('record_type', 'facility_site_number'))):
+        rate = lines_per_second(lambda line: parse_apt_line(line, fields=fields), lines)
+        baseline = baseline or rate
+        print("%-24s %14d %7.2fx" % (label, rate, rate / baseline))
+
+TYPED_SAMPLES = {'int': '1234', 'float': '833.3', 'date': '10/17/2013', 'month_year': '04/1940',
+                 'compact_date': '05242013', 'yes_no': 'Y', 'dashed_dms': '39-00-40.0000N'}
+
+def run_typed(count=40000):
+    "Compare the default string records with typed=True, on lines with every typed field filled in"
+    from faddsdata.apt import APT_LAYOUTS, parse_apt_line
+    from faddsdata.format_definitions import APT_RECORD_MAP, APT_TYPE_MAP
+    lines = []
+    for line in sample_apt_lines(count):
+        record_type = line[:3]
+        definition = APT_RECORD_MAP[record_type]
+        widths = dict(definition)
+        record = APT_LAYOUTS[record_type].parse(line)
+        for name, kind in APT_TYPE_MAP.get(record_type, {}).items():
+            # narrow numeric fields get the leading digits
+            record[name] = TYPED_SAMPLES[kind][:widths[name]]
+        lines.append(format_line(record, definition) + '\n')
+    print("%-24s %14s %8s" % ("APT.txt types", "lines/s", "speedup"))
+    baseline = None
+    for label, typed, lazy in (('strings', False, False), ('typed', True, False), ('lazy strings', False, True), ('lazy typed', True, True)):
+        def parse(line):
+            record = parse_apt_line(line, lazy, typed=typed)
+            record['record_type'], record.get('elevation_msl'), record.get('runway_length'), record.get('information_effective_date')
+        rate = lines_per_second(parse, lines)
+        baseline = baseline or rate
+        print("%-24s %14d %7.2fx" % (label, rate, rate / baseline))
+
+def run_interning(facilities=2000):
+    "Compare the memory held by a list of every record of a synthetic APT.txt, with and without interned=True"
+    import gc
+    import io
+    import tracemalloc
+    from faddsdata.apt import iter_apt
+    from faddsdata.synthetic import write_apt
+    out = io.StringIO(newline='')
+    write_apt(out, facilities)
+    text = out.getvalue()
+    print("%-24s %14s %14s" % ("APT.txt interning", "lines/s", "retained MB"))
+    for label, options in (('dicts', {}), ('dicts interned', {'interned': True}),
+                           ('typed', {'typed': True}), ('typed interned', {'typed': True, 'interned': True}),
+                           ('lazy', {'lazy': True}), ('lazy interned', {'lazy': True, 'interned': True})):
+        gc.collect()
+        tracemalloc.start()
+        start = time.perf_counter()
+        records = list(iter_apt(io.StringIO(text), **options))
+        if options.get('lazy'):
+            # decode every field, as a reader of the whole record would
+            for record in records:
+                record.as_dict()
+        seconds = time.perf_counter() - start
+        retained = tracemalloc.get_traced_memory()[0]
+        tracemalloc.stop()
+        print("%-24s %14d %14.1f" % (label, len(records) / seconds, retained / 1e6))
+        del records
+
+def run_geodesy(scale=1.0):
+    """Compare scalar great_circle_nm loops with faddsdata.geodesy on the airports, runways and fixes
+    of a synthetic cycle (a full subscription by default)"""
+    import os
+    import shutil
+    import tempfile
+    from faddsdata import geodesy, synthetic
+    from faddsdata.columnar import load_apt_columns, load_natfix_columns
+    from faddsdata.parse import open_file
+    from faddsdata.spatial import great_circle_nm, initial_bearing
+    if geodesy.np is None:
+        print("geodesy: numpy is not installed")
+        return
+    directory = tempfile.mkdtemp()
+    try:
+        synthetic.write_cycle(directory, scale)
+        with open_file(os.path.join(directory, 'APT.txt'), binary=True) as fp:
+            apt = load_apt_columns(fp)
+        with open_file(os.path.join(directory, 'NATFIX.txt'), binary=True) as fp:
+            natfix = load_natfix_columns(fp)
+    finally:
+        shutil.rmtree(directory)
+    np = geodesy.np
+    lats = np.concatenate((apt['APT']['lat'], natfix['lat']))
+    lons = np.concatenate((apt['APT']['lon'], natfix['lon']))
+    runways = apt['RWY']
+    ends = [runways[name] for name in ('base_end_lat', 'base_end_lon', 'reciprocal_end_lat', 'reciprocal_end_lon')]
+    print("%d airports and fixes, %d runways" % (len(lats), len(runways)))
+    print("%-34s %12s %12s %8s" % ("geodesy", "scalar s", "numpy s", "speedup"))
+
+    def compare(label, scalar, vectorized, repeat=3):
+        start = time.perf_counter()
+        scalar()
+        before = time.perf_counter() - start
+        after = None
+        for _ in range(repeat):
+            start = time.perf_counter()
+            vectorized()
+            elapsed = time.perf_counter() - start
+            after = elapsed if after is None else min(after, elapsed)
+        print("%-34s %12.4f %12.4f %7.0fx" % (label, before, after, before / after))
+
+    point_lats, point_lons = lats.tolist(), lons.tolist()
+    compare("one point to every airport and fix",
+            lambda: [great_circle_nm(39.0, -95.2, lat, lon) for lat, lon in zip(point_lats, point_lons)],
+            lambda: geodesy.distance_to_many(39.0, -95.2, lats, lons))
+    points = geodesy.Points(lats, lons)
+    compare("  with the points converted once", lambda: [great_circle_nm(39.0, -95.2, lat, lon) for lat, lon in zip(point_lats, point_lons)],
+            lambda: geodesy.distance_to_many(39.0, -95.2, points))
+    end_lists = [values.tolist() for values in ends]
+    compare("runway length and bearing",
+            lambda: [(great_circle_nm(*end), initial_bearing(*end)) for end in zip(*end_lists)],
+            lambda: (geodesy.pairwise_distance(*ends), geodesy.pairwise_bearing(*ends)))
+    # each airport's nearest fix: the scalar loop is timed on a sample of airports and scaled up
+    airports = apt['APT']
+    sample = min(20, len(airports))
+    start = time.perf_counter()
+    for lat, lon in zip(airports['lat'][:sample].tolist(), airports['lon'][:sample].tolist()):
+        min(great_circle_nm(lat, lon, fix_lat, fix_lon) for fix_lat, fix_lon in zip(natfix['lat'].tolist(), natfix['lon'].tolist()))
+    before = (time.perf_counter() - start) * len(airports) / sample
+    start = time.perf_counter()
+    geodesy.nearest(airports['lat'], airports['lon'], natfix['lat'], natfix['lon'])
+    after = time.perf_counter() - start
+    print("%-34s %12.1f %12.4f %7.0fx" % ("nearest fix to every airport (est.)", before, after, before / after))
+
+def run_search(scale=1.0):
+    "Time building, loading and querying faddsdata.search on a synthetic cycle, against a substring scan of the records"
+    import os
+    import shutil
+    import tempfile
+    from faddsdata import synthetic
+    from faddsdata.search import SearchIndex, build_search_index
+    directory = tempfile.mkdtemp()
+    try:
+        synthetic.write_cycle(directory, scale)
+        start = time.perf_counter()
+        index = build_search_index(directory)
+        print("indexed %d records in %.2fs" % (len(index), time.perf_counter() - start))
+        path = os.path.join(directory, 'search.idx')
+        index.save(path)
+        start = time.perf_counter()
+        index = SearchIndex.load(path)
+        print("loaded the saved index (%.1f MB) in %.3fs" % (os.path.getsize(path) / 1e6, time.perf_counter() - start))
+    finally:
+        shutil.rmtree(directory)
+    documents = [index.document(number) for number in range(len(index))]
+    print("%-24s %12s %12s" % ("search query", "scan ms", "index ms"))
+    for query in ('L', 'LWC', 'LAWRENCE', 'LAWRNCE MUNI', 'KANSAS CITY', 'CANON VALLEY AIRPARK'):
+        start = time.perf_counter()
+        [d for d in documents if any(query in value for value in d.identifiers + d.names)]
+        scan = time.perf_counter() - start
+        repeat = 100
+        start = time.perf_counter()
+        for _ in range(repeat):
+            index.search(query)
+        print("%-24s %12.3f %12.3f" % (query, scan * 1000, (time.perf_counter() - start) / repeat * 1000))
+
+def run_index(count=40000):
+    "Time single facility lookups through the on-disk identifier index"
+    import os
+    import shutil
+    import tempfile
+    from faddsdata.index import FileIndex
+    directory = tempfile.mkdtemp()
+    try:
+        path = os.path.join(directory, 'APT.txt')
+        with open(path, 'w', encoding='latin-1') as fp:
+            fp.writelines(sample_apt_lines(count))
+        start = time.perf_counter()
+        FileIndex(path).close()
+        print("indexed %d APT.txt lines in %.3fs" % (count, time.perf_counter() - start))
+        start = time.perf_counter()
+        index = FileIndex(path)
+        print("loaded the saved index in %.3fs" % (time.perf_counter() - start))
+        sites = ['%05d.*A' % i for i in range(0, count // 4, 7)]
+        start = time.perf_counter()
+        for site in sites:
+            index.facility(site)
+        print("facility lookup: %.1f us each" % ((time.perf_counter() - start) / len(sites) * 1e6))
+        index.close()
+    finally:
+        shutil.rmtree(directory)
+
+def measure(name, func, lines, size, repeat=3):
+    """Run func (which does the work for the given number of lines and bytes) repeat times for the best
+    time, then once more under tracemalloc for the peak memory, and return a result dict for the suite"""
+    import gc
+    import tracemalloc
+    seconds = None
+    for _ in range(repeat):
+        gc.collect()
+        start = time.perf_counter()
+        func()
+        elapsed = time.perf_counter() - start
+        seconds = elapsed if seconds is None else min(seconds, elapsed)
+    gc.collect()
+    tracemalloc.start()
+    func()
+    peak = tracemalloc.get_traced_memory()[1]
+    tracemalloc.stop()
+    return {'name': name, 'lines': lines, 'bytes': size, 'seconds': seconds,
+            'lines_per_second': lines / seconds, 'mb_per_second': size / seconds / 1e6, 'peak_mb': peak / 1e6}
+
+def run_suite(scale=0.1, directory=None):
+    """Benchmark parse_line, the file parsers, coordinate conversion and ingesting a whole cycle on
+    files from faddsdata.synthetic, sized as scale times a subscription. Returns a list of result dicts."""
+    import os
+    import shutil
+    import tempfile
+    from faddsdata import synthetic
+    from faddsdata.apt import iter_apt
+    from faddsdata.awos import iter_awos
+    from faddsdata.cache import write_cache, CycleCache
+    from faddsdata.instrument import instrumented
+    from faddsdata.natfix import iter_natfix
+    from faddsdata.parse import open_file, parse_line
+    cleanup = directory is None
+    if cleanup:
+        directory = tempfile.mkdtemp()
+    try:
+        counts = synthetic.write_cycle(directory, scale)
+        paths = dict((name, os.path.join(directory, name)) for name in counts)
+        sizes = dict((name, os.path.getsize(path)) for name, path in paths.items())
+
+        def consume(reader, name, binary=False, **options):
+            def work():
+                with open_file(paths[name], binary) as fp:
+                    for record in reader(fp, **options):
+                        pass
+            return work
+
+        with open_file(paths['APT.txt']) as fp:
+            apt_lines = fp.readlines()
+        results = []
+        results.append(measure('parse_line APT.txt', lambda: [parse_line(line, APT_RECORD_MAP[line[:3]]) for line in apt_lines],
+                               len(apt_lines), sizes['APT.txt']))
+        for label, reader, name, binary, options in (
+                ('iter_apt', iter_apt, 'APT.txt', False, {}),
+                ('iter_apt binary', iter_apt, 'APT.txt', True, {}),
+                ('iter_apt lazy', iter_apt, 'APT.txt', False, {'lazy': True}),
+                ('iter_apt typed', iter_apt, 'APT.txt', False, {'typed': True}),
+                ('iter_awos', iter_awos, 'AWOS.txt', False, {}),
+                ('iter_natfix', iter_natfix, 'NATFIX.txt', False, {})):
+            lines = counts[name] if name != 'NATFIX.txt' else counts[name] + 3
+            results.append(measure(label, consume(reader, name, binary, **options), lines, sizes[name]))
+        with instrumented():
+            results.append(measure('iter_apt instrumented', consume(iter_apt, 'APT.txt'), counts['APT.txt'], sizes['APT.txt']))
+
+        layout = compile_layout(APT_RECORD_MAP['APT'])
+        coordinates = [line[layout.slices[layout.names.index(name)]] for name in ('point_latitude_formatted', 'point_longitude_formatted')
+                       for line in apt_lines if line[:3] == 'APT']
+        size = sum(len(value) for value in coordinates)
+        results.append(measure('convert_dashed_dms_to_float', lambda: [convert_dashed_dms_to_float(value.strip()) for value in coordinates],
+                               len(coordinates), size))
+        from faddsdata import columnar
+        if columnar.np is not None:
+            array = columnar.np.array(coordinates, dtype='S')
+            results.append(measure('dashed_dms_to_float_array', lambda: columnar.dashed_dms_to_float_array(array), len(coordinates), size))
+            from faddsdata import geodesy
+            with open_file(paths['APT.txt'], binary=True) as fp:
+                apt_columns = columnar.load_apt_columns(fp)
+            airports = apt_columns['APT']
+            runways = apt_columns['RWY']
+            ends = [runways[name] for name in ('base_end_lat', 'base_end_lon', 'reciprocal_end_lat', 'reciprocal_end_lon')]
+            results.append(measure('geodesy runway lengths', lambda: geodesy.pairwise_distance(*ends), len(runways), 32 * len(runways)))
+            results.append(measure('geodesy nearest airport', lambda: geodesy.nearest(airports['lat'], airports['lon'], airports['lat'], airports['lon'], k=2),
+                                   len(airports), 16 * len(airports)))
+
+        total_lines = sum(counts.values())
+        total_size = sum(sizes.values())
+        def ingest():
+            for name, reader in (('APT.txt', iter_apt), ('AWOS.txt', iter_awos), ('NATFIX.txt', iter_natfix)):
+                with open_file(paths[name]) as fp:
+                    list(reader(fp))
+        results.append(measure('ingest cycle', ingest, total_lines, total_size))
+        def ingest_interned():
+            for name, reader in (('APT.txt', iter_apt), ('AWOS.txt', iter_awos), ('NATFIX.txt', iter_natfix)):
+                with open_file(paths[name]) as fp:
+                    list(reader(fp, interned=True))
+        results.append(measure('ingest cycle interned', ingest_interned, total_lines, total_size))
+        import zipfile
+        from faddsdata.subscription import open_subscription
+        archive_path = os.path.join(directory, 'subscription.zip')
+        with zipfile.ZipFile(archive_path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name, path in paths.items():
+                archive.write(path, name)
+        def ingest_zip(workers):
+            def work():
+                with open_subscription(archive_path, workers) as subscription:
+                    for name in subscription.names():
+                        for record in subscription.records(name):
+                            pass
+            return work
+        results.append(measure('ingest zip', ingest_zip(0), total_lines, total_size))
+        results.append(measure('ingest zip, %d workers' % len(paths), ingest_zip(len(paths)), total_lines, total_size))
+        from faddsdata.schedule import parse_directory, count_records
+        results.append(measure('parse_directory', lambda: parse_directory(directory, 0, count_records), total_lines, total_size))
+        results.append(measure('parse_directory, %d workers' % len(paths), lambda: parse_directory(directory, len(paths), count_records), total_lines, total_size))
+        from faddsdata.validate import validate_cycle
+        def parse_checked():
+            # what checking a cycle took before: parse everything, giving up on a file at its first bad line
+            for name, reader in (('APT.txt', iter_apt), ('AWOS.txt', iter_awos), ('NATFIX.txt', iter_natfix)):
+                with open_file(paths[name], binary=True) as fp:
+                    try:
+                        for record in reader(fp):
+                            pass
+                    except ParseException:
+                        pass
+        results.append(measure('check by parsing', parse_checked, total_lines, total_size))
+        results.append(measure('validate_cycle', lambda: validate_cycle(directory, 0), total_lines, total_size))
+        results.append(measure('validate_cycle, pool', lambda: validate_cycle(directory, chunk_size=1024 * 1024), total_lines, total_size))
+        from faddsdata.diff import diff_cycles
+        changed = os.path.join(directory, 'next')
+        os.mkdir(changed)
+        # a column inside a text field of each file
+        columns = {'APT.txt': 20, 'AWOS.txt': 125, 'NATFIX.txt': 28}
+        for name, path in paths.items():
+            with open(path, 'rb') as fp:
+                lines = fp.readlines()
+            # touch every hundredth record
+            column = columns[name]
+            for i in range(3, len(lines) - 1, 100):
+                lines[i] = lines[i][:column] + (b'Z' if lines[i][column:column + 1] != b'Z' else b'Y') + lines[i][column + 1:]
+            with open(os.path.join(changed, name), 'wb') as fp:
+                fp.writelines(lines)
+        def parse_both():
+            for name, reader in (('APT.txt', iter_apt), ('AWOS.txt', iter_awos), ('NATFIX.txt', iter_natfix)):
+                for folder in (directory, changed):
+                    with open_file(os.path.join(folder, name)) as fp:
+                        list(reader(fp))
+        results.append(measure('diff by parsing both cycles', parse_both, 2 * total_lines, 2 * total_size))
+        results.append(measure('diff_cycles', lambda: list(diff_cycles(directory, changed)), 2 * total_lines, 2 * total_size))
+        from faddsdata.export import export_cycle
+        database = os.path.join(directory, 'benchmark.sqlite')
+        results.append(measure('export_cycle to SQLite', lambda: export_cycle(directory, database), total_lines, total_size, repeat=1))
+        cache_path = os.path.join(directory, 'benchmark.cache')
+        results.append(measure('write_cache', lambda: write_cache(cache_path, directory), total_lines, total_size, repeat=1))
+        def load():
+            with CycleCache(cache_path) as cache:
+                for name in cache.names():
+                    for record in cache.records(name):
+                        pass
+        results.append(measure('load cached cycle', load, total_lines, total_size))
+        return results
+    finally:
+        if cleanup:
+            shutil.rmtree(directory)
+
+def print_suite(results, baseline=None):
+    "Print suite results as a table, with the change in lines/s against an earlier run if one is given"
+    previous = dict((result['name'], result) for result in (baseline or ()))
+    print("%-28s %12s %10s %10s %8s" % ("benchmark", "lines/s", "MB/s", "peak MB", "change"))
+    for result in results:
+        change = ''
+        if result['name'] in previous:
+            change = '%+.0f%%' % ((result['lines_per_second'] / previous[result['name']]['lines_per_second'] - 1) * 100)
+        print("%-28s %12d %10.1f %10.1f %8s" % (result['name'], result['lines_per_second'], result['mb_per_second'], result['peak_mb'], change))
+
+def regressions(results, baseline, tolerance=0.1):
+    "The names of benchmarks whose lines/s fell by more than tolerance against baseline"
+    previous = dict((result['name'], result['lines_per_second']) for result in baseline)
+    return [result['name'] for result in results
+            if result['name'] in previous and result['lines_per_second'] < previous[result['name']] * (1 - tolerance)]
+
+def run():
+    definitions = [('APT.txt %s' % record_type, definition) for record_type, definition in sorted(APT_RECORD_MAP.items())]
+    definitions.append(('AWOS.txt', AWOS_RECORDS))
+    definitions.append(('NATFIX.txt', NATFIX_RECORDS))
+    print("%-16s %14s %14s %8s" % ("layout", "before lines/s", "after lines/s", "speedup"))
+    for label, definition in definitions:
+        lines = [sample_line(definition)] * 1000
+        layout = compile_layout(definition)
+        before = lines_per_second(lambda line: reference_parse_line(line, definition), lines)
+        after = lines_per_second(layout.parse, lines)
+        print("%-16s %14d %14d %7.2fx" % (label, before, after, after / before))
+    run_coordinates()
+    run_spatial()
+    run_lazy()
+    run_projection()
+    run_typed()
+    run_interning()
+    run_geodesy()
+    run_search()
+    run_index()
+
+def main(argv=None):
+    import argparse
+    import json
+    import platform
+    import sys
+    parser = argparse.ArgumentParser(description="Benchmark the FADDS parsers")
+    parser.add_argument('--suite', action='store_true', help="run the suite on synthetic cycle files instead of the comparisons")
+    parser.add_argument('--scale', type=float, default=0.1, help="size of the synthetic cycle, as a fraction of a subscription")
+    parser.add_argument('--json', help="write the suite results to this file, - for stdout")
+    parser.add_argument('--baseline', help="suite results from an earlier run to compare against")
+    parser.add_argument('--tolerance', type=float, default=0.1, help="slowdown against the baseline that counts as a regression")
+    args = parser.parse_args(argv)
+    if not args.suite:
+        run()
+        return 0
+    results = run_suite(args.scale)
+    baseline = None
+    if args.baseline:
+        with open(args.baseline) as fp:
+            baseline = json.load(fp)['results']
+    if args.json != '-':
+        print_suite(results, baseline)
+    if args.json:
+        report = {'python': platform.python_version(), 'platform': platform.platform(), 'scale': args.scale, 'results': results}
+        if args.json == '-':
+            json.dump(report, sys.stdout, indent=2)
+        else:
+            with open(args.json, 'w') as fp:
+                json.dump(report, fp, indent=2)
+    if baseline:
+        slower = regressions(results, baseline, args.tolerance)
+        if slower:
+            print("slower than the baseline: %s" % ', '.join(slower), file=sys.stderr)
+            return 1
+    return 0
+
+if __name__ == '__main__':
+    import sys
+    sys.exit(main())
@@ -0,0 +1,241 @@
+"""Cache the parsed records of a subscription cycle in a binary file that loads almost instantly.
+
+The cache holds the records of each file as marshal encoded batches. It is memory mapped on
+load and batches are only decoded as they are iterated. It records the size and mtime (and
+optionally a SHA-1) of every source file along with a fingerprint of the format definitions
+and of the Python version (marshal's format can change between versions), and load_cycle
+rebuilds it whenever any of those change."""
+
+import hashlib
+import json
+import marshal
+import mmap
+import os
+import struct
+import sys
+
+from faddsdata.apt import iter_apt, APT_DERIVED_FIELDS
+from faddsdata.awos import iter_awos, AWOS_DERIVED_FIELDS
+from faddsdata.format_definitions import APT_RECORD_MAP, APT_TYPE_MAP, APT_INTERN_MAP, AWOS_RECORDS, AWOS_TYPES, AWOS_INTERNED
+from faddsdata.natfix import iter_natfix, NATFIX_RECORDS, NATFIX_DERIVED_FIELDS, NATFIX_INTERNED
+
+# Bump when the cache file format or the post-processing done by the readers changes in a way the
+# fingerprint can't see, such as the code of a converter; the tables themselves are fingerprinted
+CACHE_VERSION = 1
+MAGIC = b'FADDSDATA CACHE\n'
+BATCH_SIZE = 10000
+CACHE_NAME = '.faddsdata.cache'
+
+# The reader used for each file of a subscription
+READERS = {
+    'APT.txt': iter_apt,
+    'AWOS.txt': iter_awos,
+    'NATFIX.txt': iter_natfix,
+}
+
+_TRAILER = struct.Struct('<Q')
+
+class StaleCache(Exception): pass
+
+def _describe(value):
+    # a repr that is the same from one run to the next: functions by name rather than address
+    if callable(value):
+        return '%s.%s' % (value.__module__, value.__qualname__)
+    if isinstance(value, dict):
+        return sorted((key, _describe(item)) for key, item in value.items())
+    if isinstance(value, (tuple, list)):
+        return tuple(_describe(item) for item in value)
+    return value
+
+def layout_fingerprint():
+    """A digest of every layout and the derived fields, types and interned fields applied to them, and
+    of the marshal and Python versions, so that a change to any of those invalidates old caches"""
+    layouts = (CACHE_VERSION, marshal.version, tuple(sys.version_info[:2]),
+               APT_RECORD_MAP, APT_DERIVED_FIELDS, APT_TYPE_MAP, APT_INTERN_MAP,
+               AWOS_RECORDS, AWOS_DERIVED_FIELDS, AWOS_TYPES, AWOS_INTERNED,
+               NATFIX_RECORDS, NATFIX_DERIVED_FIELDS, NATFIX_INTERNED)
+    return hashlib.sha1(repr(_describe(layouts)).encode('utf-8')).hexdigest()
+
+def source_key(path, hash=False):
+    "What identifies this version of a source file: its size and mtime, and its SHA-1 if hash is set"
+    stat = os.stat(path)
+    key = {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+    if hash:
+        digest = hashlib.sha1()
+        with open(path, 'rb') as fp:
+            for block in iter(lambda: fp.read(1024 * 1024), b''):
+                digest.update(block)
+        key['sha1'] = digest.hexdigest()
+    return key
+
+def source_keys(directory, hash=False):
+    "source_key for each file in READERS that exists in directory"
+    return dict((name, source_key(os.path.join(directory, name), hash))
+                for name in sorted(READERS) if os.path.exists(os.path.join(directory, name)))
+
+def write_cache(cache_path, directory, hash=False, batch_size=BATCH_SIZE):
+    """Parse every known file in a subscription directory and write the records to cache_path.
+    The file is written under a temporary name and renamed into place, so readers never see half a cache."""
+    sources = source_keys(directory, hash)
+    sections = {}
+    counts = {}
+    temporary = cache_path + '.%d.tmp' % os.getpid()
+    try:
+        with open(temporary, 'wb') as out:
+            out.write(MAGIC)
+            for name in sources:
+                batches = sections[name] = []
+                counts[name] = 0
+                with open(os.path.join(directory, name), encoding='latin-1') as fp:
+                    batch = []
+                    # marshal writes an interned string once per batch and interns it again on loading,
+                    # so the cache is smaller and the records loaded from it share their strings
+                    for record in READERS[name](fp, interned=True):
+                        batch.append(record)
+                        if len(batch) == batch_size:
+                            counts[name] += _write_batch(out, batch, batches)
+                            batch = []
+                    if batch:
+                        counts[name] += _write_batch(out, batch, batches)
+            header_offset = out.tell()
+            out.write(json.dumps({'version': CACHE_VERSION, 'layouts': layout_fingerprint(), 'hash': hash,
+                                  'sources': sources, 'sections': sections, 'counts': counts}).encode('utf-8'))
+            out.write(_TRAILER.pack(header_offset))
+        os.replace(temporary, cache_path)
+    finally:
+        if os.path.exists(temporary):
+            os.remove(temporary)
+
+def _write_batch(out, batch, batches):
+    data = marshal.dumps(batch)
+    batches.append((out.tell(), len(data)))
+    out.write(data)
+    return len(batch)
+
+class CycleCache(object):
+    "A memory mapped cache file written by write_cache"
+
+    def __init__(self, cache_path):
+        self.path = cache_path
+        with open(cache_path, 'rb') as fp:
+            self._map = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ)
+        if self._map[:len(MAGIC)] != MAGIC or len(self._map) < len(MAGIC) + _TRAILER.size:
+            self.close()
+            raise StaleCache("%s is not a faddsdata cache" % cache_path)
+        header_offset, = _TRAILER.unpack(self._map[-_TRAILER.size:])
+        self.header = json.loads(self._map[header_offset:-_TRAILER.size].decode('utf-8'))
+
+    def is_current(self, directory):
+        "True if the cache was built from the files now in directory with the current layouts"
+        header = self.header
+        return (header['version'] == CACHE_VERSION and header['layouts'] == layout_fingerprint() and
+                header['sources'] == source_keys(directory, header['hash']))
+
+    def names(self):
+        return sorted(self.header['sections'])
+
+    def count(self, name):
+        return self.header['counts'][name]
+
+    def records(self, name):
+        "Yield the cached records of one file (for example 'APT.txt') in their original order"
+        for offset, length in self.header['sections'][name]:
+            for record in marshal.loads(self._map[offset:offset + length]):
+                yield record
+
+    def close(self):
+        self._map.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def load_cycle(directory, cache_path=None, hash=False):
+    """Return a CycleCache for a subscription directory, building or rebuilding the cache file first
+    if it is missing or stale. The cache goes in the directory itself unless cache_path is given."""
+    if cache_path is None:
+        cache_path = os.path.join(directory, CACHE_NAME)
+    if os.path.exists(cache_path):
+        try:
+            cache = CycleCache(cache_path)
+        except (StaleCache, ValueError):
+            pass
+        else:
+            if cache.header['hash'] == hash and cache.is_current(directory):
+                return cache
+            cache.close()
+    write_cache(cache_path, directory, hash)
+    return CycleCache(cache_path)
+
+import unittest
+import shutil
+import tempfile
+class CacheTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS
+        self.directory = tempfile.mkdtemp()
+        with open(os.path.join(self.directory, 'APT.txt'), 'w', encoding='latin-1') as fp:
+            for i in range(25):
+                fp.write(format_line({'record_type': 'APT', 'facility_site_number': '%05d.*A' % i, 'facility_name': 'FIELD %d' % i,
+                                      'point_latitude_formatted': '39-00-40.0000N', 'point_longitude_formatted': '095-12-59.3000W',
+                                      'control_tower': 'N'}, APT_RECORDS) + '\n')
+        with open(os.path.join(self.directory, 'NATFIX.txt'), 'w', encoding='latin-1') as fp:
+            fp.write("NATFIX\n'20101118\n")
+            fp.write(format_line({"id": "00A", "latitude_string": "400415N", "longitude_string": "0745601W"}, NATFIX_RECORDS) + '\n$\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parsed(self, name):
+        with open(os.path.join(self.directory, name), encoding='latin-1') as fp:
+            return list(READERS[name](fp))
+
+    def test_round_trip(self):
+        path = os.path.join(self.directory, CACHE_NAME)
+        write_cache(path, self.directory, batch_size=10)
+        with load_cycle(self.directory) as cache:
+            self.assertEqual(['APT.txt', 'NATFIX.txt'], cache.names())
+            self.assertEqual(25, cache.count('APT.txt'))
+            self.assertEqual(3, len(cache.header['sections']['APT.txt']))
+            self.assertEqual(self.parsed('APT.txt'), list(cache.records('APT.txt')))
+            self.assertEqual(self.parsed('NATFIX.txt'), list(cache.records('NATFIX.txt')))
+            records = list(cache.records('APT.txt'))
+            self.assertTrue(records[0]['record_type'] is records[-1]['record_type'])
+
+    def test_invalidation(self):
+        with load_cycle(self.directory) as cache:
+            self.assertTrue(cache.is_current(self.directory))
+        with open(os.path.join(self.directory, 'NATFIX.txt'), 'a') as fp:
+            fp.write('\n')
+        with CycleCache(os.path.join(self.directory, CACHE_NAME)) as cache:
+            self.assertFalse(cache.is_current(self.directory))
+        with load_cycle(self.directory, hash=True) as cache:
+            self.assertTrue(cache.is_current(self.directory))
+            self.assertTrue('sha1' in cache.header['sources']['APT.txt'])
+            cache.header['layouts'] = 'something else'
+            self.assertFalse(cache.is_current(self.directory))
+
+    def test_fingerprint(self):
+        from unittest import mock
+        fingerprint = layout_fingerprint()
+        self.assertEqual(fingerprint, layout_fingerprint())
+        # marshal data written by another Python isn't trusted
+        with mock.patch.object(marshal, 'version', marshal.version + 1):
+            self.assertNotEqual(fingerprint, layout_fingerprint())
+        with mock.patch.object(sys, 'version_info', (2, 7, 18)):
+            self.assertNotEqual(fingerprint, layout_fingerprint())
+        # nor are records post-processed differently
+        with mock.patch.dict(AWOS_TYPES, {'elevation': 'int'}):
+            self.assertNotEqual(fingerprint, layout_fingerprint())
+        self.assertEqual(fingerprint, layout_fingerprint())
+
+    def test_not_a_cache(self):
+        path = os.path.join(self.directory, 'garbage')
+        with open(path, 'wb') as fp:
+            fp.write(b'x' * 100)
+        self.assertRaises(StaleCache, CycleCache, path)
+        with load_cycle(self.directory, cache_path=path) as cache:
+            self.assertEqual(1, cache.count('NATFIX.txt'))
@@ -0,0 +1,318 @@
+"""Load FADDS files into NumPy structured arrays instead of lists of dicts.
+
+Every named field of a layout becomes an S<width> column holding the stripped value, with
+the widths taken from faddsdata.format_definitions and the same cleanup of stray non-ASCII
+characters as parse_line. Coordinates are added as float64 columns (NaN where the source field
+is blank). numpy is only needed for this module."""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from faddsdata.format_definitions import APT_RECORD_MAP, AWOS_RECORDS
+from faddsdata.natfix import NATFIX_RECORDS
+from faddsdata.parse import ParseException, CLEANUP_TABLE, CLEANUP_DELETE, compile_layout, iter_lines
+
+def _byte_matrix(values):
+    "View a sequence of short ASCII strings as a 2D uint8 array, one padded row per value"
+    array = np.asarray(values)
+    if array.dtype.kind != 'S':
+        array = array.astype('S')
+    array = np.ascontiguousarray(array.reshape(-1))
+    width = max(array.dtype.itemsize, 1)
+    return np.frombuffer(array.tobytes(), dtype=np.uint8).reshape(len(array), width) if len(array) else np.zeros((0, width), np.uint8)
+
+def _invalid(values, bad):
+    raise ValueError("Invalid coordinate %r" % (np.asarray(values).reshape(-1)[np.argmax(bad)],))
+
+def _shapes(matrix, *markers):
+    """Group rows by where their first and last non-blank bytes, and the first and last of each marker byte, fall.
+    Returns the blank row mask, the list of distinct position tuples and the index of each row's tuple.
+    A marker that doesn't occur has both positions -1; one that occurs more than twice has a last position of -2."""
+    rows, width = matrix.shape
+    nonblank = (matrix != 0) & (matrix != 32)
+    blank = ~nonblank.any(axis=1)
+    positions = [np.argmax(nonblank, axis=1), width - 1 - np.argmax(nonblank[:, ::-1], axis=1)]
+    for marker in markers:
+        found = matrix == marker
+        count = found.sum(axis=1)
+        positions.append(np.where(count == 0, -1, np.argmax(found, axis=1)))
+        positions.append(np.where(count == 0, -1, np.where(count > 2, -2, width - 1 - np.argmax(found[:, ::-1], axis=1))))
+    # Pack the positions into one integer per row so grouping is a 1D unique rather than a row-wise one;
+    # ten bits each is plenty for coordinate fields and fits three markers in an int64
+    if width > 1000:
+        raise ValueError("Coordinates can't be %d characters wide" % width)
+    key = np.zeros(rows, np.int64)
+    for position in positions:
+        key = (key << 10) | (position + 2)
+    keys, group = np.unique(key, return_inverse=True)
+    shapes = [[(int(k) >> (10 * shift)) % 1024 - 2 for shift in range(len(positions) - 1, -1, -1)] for k in keys]
+    return blank, shapes, group.reshape(-1)
+
+def _group_rows(group, index, blank, groups):
+    "Index for the non-blank rows in a group, a plain slice when every row is in it, or None if it is empty"
+    if groups == 1 and not blank.any():
+        return slice(None)
+    rows = np.flatnonzero((group == index) & ~blank)
+    return rows if len(rows) else None
+
+def _number(digits, columns):
+    "The integer spelled out by the digit columns of every row"
+    if not len(columns):
+        return np.zeros(len(digits), np.int64)
+    weights = 10 ** np.arange(len(columns) - 1, -1, -1, dtype=np.int64)
+    return digits[:, columns] @ weights
+
+def dms_to_float_array(values):
+    """Vectorized convert_dms_to_float: turn a sequence or array of coordinates like 0844402W or 335303N
+    into a float64 array with the same values. Blank entries become NaN; malformed ones raise ValueError."""
+    _require_numpy()
+    matrix = _byte_matrix(values)
+    blank, shapes, group = _shapes(matrix)
+    result = np.full(len(matrix), np.nan)
+    bad = np.zeros(len(matrix), bool)
+    # Every row with the same first and last column has its fields at the same offsets
+    for index, (first, last) in enumerate(shapes):
+        rows = _group_rows(group, index, blank, len(shapes))
+        if rows is None:
+            continue
+        block = matrix[rows]
+        hemisphere = block[:, last]
+        if last - first + 1 == 8:
+            ok = (hemisphere == ord('E')) | (hemisphere == ord('W'))
+        elif last - first + 1 == 7:
+            ok = (hemisphere == ord('N')) | (hemisphere == ord('S'))
+        else:
+            ok = np.zeros(len(block), bool)
+        digits = block[:, first:last].astype(np.int64) - 48
+        ok &= ((digits >= 0) & (digits <= 9)).all(axis=1)
+        bad[rows] = ~ok
+        if not ok.all():
+            continue
+        size = last - first
+        degrees = _number(digits, np.arange(size - 4))
+        minutes = _number(digits, np.arange(size - 4, size - 2))
+        seconds = _number(digits, np.arange(size - 2, size))
+        sign = np.where((hemisphere == ord('W')) | (hemisphere == ord('S')), -1.0, 1.0)
+        result[rows] = sign * (degrees.astype(np.float64) + (minutes * 60 + seconds) / 3600.0)
+    if bad.any():
+        _invalid(values, bad)
+    return result
+
+def dashed_dms_to_float_array(values):
+    """Vectorized convert_dashed_dms_to_float: turn a sequence or array of coordinates like 37-32-29.770N
+    into a float64 array with the same values. Blank entries become NaN; malformed ones raise ValueError."""
+    _require_numpy()
+    matrix = _byte_matrix(values)
+    blank, shapes, group = _shapes(matrix, ord('-'), ord('.'))
+    result = np.full(len(matrix), np.nan)
+    bad = np.zeros(len(matrix), bool)
+    # Rows that share where the dashes and the decimal point are have their digits at the same offsets
+    for index, (first, last, dash, second_dash, dot, second_dot) in enumerate(shapes):
+        rows = _group_rows(group, index, blank, len(shapes))
+        if rows is None:
+            continue
+        block = matrix[rows]
+        hemisphere = block[:, last]
+        seconds_end = dot if dot >= 0 else last
+        ok = dash >= 0 and second_dash > dash and dot == second_dot and (dot < 0 or dot > second_dash)
+        if ok:
+            degree_columns = np.arange(first, dash)
+            minute_columns = np.arange(dash + 1, second_dash)
+            second_columns = np.arange(second_dash + 1, seconds_end)
+            fraction_columns = np.arange(dot + 1, last) if dot >= 0 else np.arange(0)
+            columns = np.concatenate([degree_columns, minute_columns, second_columns, fraction_columns])
+            digits = block[:, columns].astype(np.int64) - 48
+            ok = np.isin(hemisphere, np.frombuffer(b'NSEW', np.uint8)) & ((digits >= 0) & (digits <= 9)).all(axis=1)
+        else:
+            ok = np.zeros(len(block), bool)
+        bad[rows] = ~ok
+        if not ok.all():
+            continue
+        # digits holds just the selected columns, in order
+        split = np.cumsum([len(degree_columns), len(minute_columns)])
+        degrees = _number(digits, np.arange(split[0]))
+        minutes = _number(digits, np.arange(split[0], split[1]))
+        seconds = _number(digits, np.arange(split[1], len(columns)))
+        sign = np.where((hemisphere == ord('W')) | (hemisphere == ord('S')), -1.0, 1.0)
+        # dividing the exact integer reproduces float() of the decimal seconds bit for bit
+        result[rows] = sign * (degrees + (minutes * 60 + seconds / 10.0 ** len(fraction_columns)) / 3600.0)
+    if bad.any():
+        _invalid(values, bad)
+    return result
+
+# Float columns derived from text columns, per layout: (column, source field, converter)
+APT_COORDINATE_COLUMNS = {
+    'APT': (('lat', 'point_latitude_formatted', dashed_dms_to_float_array),
+            ('lon', 'point_longitude_formatted', dashed_dms_to_float_array)),
+    'RWY': (('base_end_lat', 'base_end_latitude_physical_runway_end_formatted', dashed_dms_to_float_array),
+            ('base_end_lon', 'base_end_longitude_physical_runway_end_formatted', dashed_dms_to_float_array),
+            ('reciprocal_end_lat', 'reciprocal_end_latitude_physical_runway_end_formatted', dashed_dms_to_float_array),
+            ('reciprocal_end_lon', 'reciprocal_end_longitude_physical_runway_end_formatted', dashed_dms_to_float_array)),
+}
+AWOS_COORDINATE_COLUMNS = (('lat', 'latitude', dashed_dms_to_float_array),
+                           ('lon', 'longitude', dashed_dms_to_float_array))
+NATFIX_COORDINATE_COLUMNS = (('lat', 'latitude_string', dms_to_float_array),
+                             ('lon', 'longitude_string', dms_to_float_array))
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("faddsdata.columnar requires numpy (pip install faddsdata[numpy])")
+
+def layout_dtype(definition):
+    "A structured dtype that views a raw line of the layout in place, one S<width> column per named field"
+    _require_numpy()
+    layout = compile_layout(definition)
+    return np.dtype({'names': list(layout.names),
+                     'formats': ['S%d' % (s.stop - s.start) for s in layout.slices],
+                     'offsets': [s.start for s in layout.slices],
+                     'itemsize': layout.length})
+
+def _raw_line(line, length):
+    if not isinstance(line, bytes):
+        line = line.encode('latin-1')
+    # only the replacements here; deleting characters would move the fields after them
+    line = line.replace(b'\r', b'').replace(b'\n', b'').translate(CLEANUP_TABLE)
+    if len(line) != length:
+        raise ParseException("Expected length %d, got length %d" % (length, len(line)))
+    return line
+
+def lines_to_array(lines, definition, coordinates=(), coordinates_where=None):
+    """Build a structured array from raw lines that all share one layout.
+    coordinates is a sequence of (column, source field, array converter) float64 columns to add. If
+    coordinates_where is a (field, value) pair, they are only converted on rows where that field matches."""
+    _require_numpy()
+    layout = compile_layout(definition)
+    data = b''.join(_raw_line(line, layout.length) for line in lines)
+    raw = np.frombuffer(data, dtype=layout_dtype(definition))
+    stripped = [np.char.strip(raw[name]) for name in layout.names]
+    if len(data.translate(None, CLEANUP_DELETE)) != len(data):
+        # the few values holding characters parse_line deletes are cleaned one by one, after stripping as it does
+        for name, column in zip(layout.names, stripped):
+            rows = np.zeros(len(raw), bool)
+            for character in CLEANUP_DELETE:
+                rows |= np.char.find(raw[name], bytes((character,))) >= 0
+            for row in np.flatnonzero(rows):
+                column[row] = raw[name][row].strip().translate(None, CLEANUP_DELETE)
+    fields = [(name, 'S%d' % (s.stop - s.start)) for name, s in zip(layout.names, layout.slices)]
+    fields.extend((column, np.float64) for column, _, _ in coordinates)
+    result = np.empty(len(raw), dtype=fields)
+    for name, column in zip(layout.names, stripped):
+        result[name] = column
+    if coordinates_where is None:
+        rows = slice(None)
+    else:
+        field, value = coordinates_where
+        rows = result[field] == value
+    for column, source, converter in coordinates:
+        result[column] = np.nan
+        result[column][rows] = converter(result[source][rows])
+    return result
+
+def load_apt_columns(fp):
+    "Load an open APT file into a dictionary of structured arrays keyed by record type"
+    lines = dict((record_type, []) for record_type in APT_RECORD_MAP)
+    for line in iter_lines(fp):
+        record_type = line[:3]
+        if isinstance(record_type, bytes):
+            record_type = record_type.decode('latin-1')
+        lines[record_type].append(line)
+    return dict((record_type, lines_to_array(lines[record_type], definition, APT_COORDINATE_COLUMNS.get(record_type, ())))
+                for record_type, definition in APT_RECORD_MAP.items())
+
+def load_awos_columns(fp):
+    "Load an open AWOS file into a structured array; lat/lon are only filled for AWOS1 records"
+    return lines_to_array(list(iter_lines(fp)), AWOS_RECORDS, AWOS_COORDINATE_COLUMNS, ('record_type', b'AWOS1'))
+
+def load_natfix_columns(fp):
+    "Load an open NATFIX file into a structured array, skipping the preamble and the $ terminator"
+    fp.readline()
+    fp.readline()
+    lines = []
+    for line in iter_lines(fp):
+        if line[:1] in ('$', b'$'):
+            break
+        lines.append(line)
+    return lines_to_array(lines, NATFIX_RECORDS, NATFIX_COORDINATE_COLUMNS)
+
+import unittest
+@unittest.skipIf(np is None, "numpy is not installed")
+class ColumnarTests(unittest.TestCase):
+    def test_layout_dtype(self):
+        dtype = layout_dtype((("first", 2), (None, 1), ("second", 3)))
+        self.assertEqual(6, dtype.itemsize)
+        self.assertEqual(('first', 'second'), dtype.names)
+        self.assertEqual(3, dtype.fields['second'][1])
+
+    def test_lines_to_array(self):
+        definition = (("id", 4), (None, 1), ("lat", 8))
+        array = lines_to_array(["AB   335303N \n", b"\xd1X   335303S \r\n", "C            \n"], definition,
+                               (("lat_float", "lat", dms_to_float_array),))
+        self.assertEqual([b'AB', b'NX', b'C'], list(array['id']))
+        self.assertAlmostEqual(33.884166666, array['lat_float'][0])
+        self.assertAlmostEqual(-33.884166666, array['lat_float'][1])
+        self.assertTrue(np.isnan(array['lat_float'][2]))
+        self.assertRaises(ParseException, lines_to_array, ["too short\n"], definition)
+        # characters parse_line deletes are deleted here too, wherever they are in the value
+        from faddsdata.parse import parse_line
+        lines = ["K\xfaLW 335303N \n", b"\xb0AB\xbf 335303N \n", "\xb4 C" + " " * 10 + "\n"]
+        array = lines_to_array(lines, definition)
+        self.assertEqual([b'KLW', b'AB', b' C'], list(array['id']))
+        self.assertEqual([parse_line(line, definition)['id'].encode('latin-1') for line in lines], list(array['id']))
+        self.assertEqual([b'335303N'] * 2 + [b''], list(array['lat']))
+
+    def test_dms_to_float_array(self):
+        from faddsdata.parse import convert_dms_to_float
+        values = ['335303N', '335303S', '0844402W', '0844402E', '000000N', '1795959W', '895959N']
+        self.assertEqual([convert_dms_to_float(v) for v in values], list(dms_to_float_array(values)))
+        self.assertEqual([convert_dms_to_float(v) for v in values], list(dms_to_float_array(np.array(values, dtype='S8'))))
+        self.assertTrue(np.isnan(dms_to_float_array(['', '335303N'])[0]))
+        self.assertRaises(ValueError, dms_to_float_array, ['335303W'])
+        self.assertRaises(ValueError, dms_to_float_array, ['33A303N'])
+        self.assertEqual((0,), dms_to_float_array([]).shape)
+
+    def test_dashed_dms_to_float_array(self):
+        from faddsdata.parse import convert_dashed_dms_to_float
+        values = ['33-53-03.000N', '33-53-03.000S', '084-44-02.000W', '084-44-02.000E', '01-01-01.110N',
+                  '37-32-29.770N', '39-00-40.0000N', '095-12-59.3000W', '39-00-19.0108N', '5-6-7N', '00-00-00.0001S']
+        self.assertEqual([convert_dashed_dms_to_float(v) for v in values], list(dashed_dms_to_float_array(values)))
+        self.assertTrue(np.isnan(dashed_dms_to_float_array([b'               '])[0]))
+        self.assertRaises(ValueError, dashed_dms_to_float_array, ['33-53-03.000X'])
+        self.assertRaises(ValueError, dashed_dms_to_float_array, ['33-53.000N'])
+        self.assertRaises(ValueError, dashed_dms_to_float_array, ['33-5A-03.000N'])
+
+    def test_load_natfix_columns(self):
+        from io import StringIO
+        from faddsdata.parse import format_line
+        lines = ["NATFIX", "'20101118"]
+        lines.append(format_line({"id": "00A", "latitude_string": "400415N", "longitude_string": "0745601W", "artcc_id": "'ZDC"}, NATFIX_RECORDS))
+        lines.append(format_line({"id": "00AK", "latitude_string": "595122N", "longitude_string": "1514147W", "artcc_id": "'ZAN"}, NATFIX_RECORDS))
+        lines.append("$")
+        natfix = load_natfix_columns(StringIO("\n".join(lines) + "\n"))
+        self.assertEqual([b'00A', b'00AK'], list(natfix['id']))
+        self.assertEqual(np.float64, natfix['lat'].dtype)
+        self.assertAlmostEqual(-151.6963888888, natfix['lon'][1])
+
+    def test_load_apt_columns(self):
+        from io import StringIO
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS, RWY_RECORDS
+        apt = format_line({'record_type': 'APT', 'location_identifier': 'LWC', 'point_latitude_formatted': '39-00-40.0000N',
+                           'point_longitude_formatted': '095-12-59.3000W'}, APT_RECORDS)
+        rwy = format_line({'record_type': 'RWY', 'runway_identification': '01/19'}, RWY_RECORDS)
+        columns = load_apt_columns(StringIO(apt + '\n' + rwy + '\n'))
+        self.assertEqual([b'LWC'], list(columns['APT']['location_identifier']))
+        self.assertAlmostEqual(39.01111111, columns['APT']['lat'][0])
+        self.assertEqual(50, columns['APT'].dtype['facility_name'].itemsize)
+        self.assertTrue(np.isnan(columns['RWY']['base_end_lat'][0]))
+        self.assertEqual(0, len(columns['RMK']))
+
+    def test_load_awos_columns(self):
+        from io import StringIO
+        from faddsdata.parse import format_line
+        awos1 = format_line({'record_type': 'AWOS1', 'id': 'LWC', 'latitude': '39-00-40.000N', 'longitude': '095-12-59.300W'}, AWOS_RECORDS)
+        awos2 = format_line({'record_type': 'AWOS2', 'id': 'LWC', 'latitude': 'REMARK TEXT'}, AWOS_RECORDS)
+        awos = load_awos_columns(StringIO(awos1 + '\n' + awos2 + '\n'))
+        self.assertAlmostEqual(-95.21647222, awos['lon'][0])
+        self.assertTrue(np.isnan(awos['lat'][1]))
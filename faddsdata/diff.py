@@ -0,0 +1,216 @@
+"""Find what changed between two subscription cycles.
+
+Records are matched between the cycles by a key made from a few fields of each file (DIFF_KEYS).
+Lines are compared by a 128-bit BLAKE2 digest of their raw text first, so only added, removed and
+changed lines are ever parsed. The old file is indexed as key -> (digest, byte offset), which is all
+that is held in memory; the records themselves are read back from their offsets when they are needed.
+
+    for change in diff_cycles('cycle_2010_11_18/', 'cycle_2011_01_13/'):
+        print(change.kind, change.key, change.fields)"""
+
+import hashlib
+import os
+from collections import namedtuple
+
+from faddsdata.apt import APT_LAYOUTS, parse_apt_line
+from faddsdata.awos import AWOS_LAYOUT, parse_awos_line
+from faddsdata.natfix import NATFIX_LAYOUT, parse_natfix_line
+
+# The fields that identify a record from one cycle to the next, by file and, for APT.txt, by record type
+DIFF_KEYS = {
+    'APT.txt': {
+        'APT': ('record_type', 'facility_site_number'),
+        'ATT': ('record_type', 'facility_site_number', 'attendace_schedule_sequence'),
+        'RWY': ('record_type', 'facility_site_number', 'runway_identification'),
+        'ARS': ('record_type', 'facility_site_number', 'runway_identification', 'runway_end_identifier', 'aircraft_arresting_device_type'),
+        'RMK': ('record_type', 'facility_site_number', 'element_name'),
+    },
+    'AWOS.txt': ('record_type', 'id', 'sensor_type'),
+    'NATFIX.txt': ('id',),
+}
+
+PARSERS = {
+    'APT.txt': parse_apt_line,
+    'AWOS.txt': parse_awos_line,
+    'NATFIX.txt': parse_natfix_line,
+}
+
+# kind is 'added', 'removed' or 'changed'. key is a tuple of the DIFF_KEYS values; when several
+# lines share a key, a count of the earlier ones is added to the end. old and new are the parsed
+# records (None for an added or removed one) and fields the sorted names of the fields that differ.
+Change = namedtuple('Change', 'file kind key old new fields')
+
+def _slices(layout, names):
+    return tuple(layout.slices[layout.names.index(name)] for name in names)
+
+def key_function(name):
+    "A function returning the key of a raw line (bytes) of the given file, as a tuple of bytes"
+    keys = DIFF_KEYS[name]
+    if name == 'APT.txt':
+        slices = dict((record_type.encode('latin-1'), _slices(APT_LAYOUTS[record_type], fields)) for record_type, fields in keys.items())
+        def key(line):
+            return tuple(line[s].strip() for s in slices[line[:3]])
+        return key
+    slices = _slices(AWOS_LAYOUT if name == 'AWOS.txt' else NATFIX_LAYOUT, keys)
+    def key(line):
+        return tuple(line[s].strip() for s in slices)
+    return key
+
+def iter_raw_lines(fp, name):
+    "Yield (byte offset, line) for each record line of an open binary file, skipping the NATFIX preamble and end marker"
+    offset = 0
+    if name == 'NATFIX.txt':
+        for _ in range(2):
+            offset += len(fp.readline())
+    for line in fp:
+        if name == 'NATFIX.txt' and line[:1] == b'$':
+            return
+        yield offset, line
+        offset += len(line)
+
+def _keyed_lines(fp, name):
+    # (key, digest of the line, offset, line), numbering the lines that share a key. The digest is
+    # the only comparison made between unchanged lines, so it has to be one that won't collide.
+    key = key_function(name)
+    seen = {}
+    for offset, line in iter_raw_lines(fp, name):
+        k = key(line)
+        count = seen.get(k)
+        if count is None:
+            seen[k] = 1
+        else:
+            seen[k] = count + 1
+            k = k + (b'%d' % count,)
+        yield k, hashlib.blake2b(line.rstrip(b'\r\n'), digest_size=16).digest(), offset, line
+
+def _decode(key):
+    return tuple(part.decode('latin-1') for part in key)
+
+def _changed_fields(old, new):
+    return tuple(sorted(name for name in set(old) | set(new) if old.get(name) != new.get(name)))
+
+def diff_files(old_path, new_path, name):
+    """Yield a Change for every record added, removed or changed between two versions of a file.
+    Added and changed records come in the order of the new file, then the removed ones in the order of the old."""
+    parse = PARSERS[name]
+    with open(old_path, 'rb') as old_fp:
+        index = {}
+        for key, digest, offset, line in _keyed_lines(old_fp, name):
+            index[key] = (digest, offset)
+        with open(new_path, 'rb') as new_fp:
+            for key, digest, offset, line in _keyed_lines(new_fp, name):
+                old = index.pop(key, None)
+                if old is None:
+                    yield Change(name, 'added', _decode(key), None, parse(line), ())
+                elif old[0] != digest:
+                    old_fp.seek(old[1])
+                    old_record = parse(old_fp.readline())
+                    new_record = parse(line)
+                    fields = _changed_fields(old_record, new_record)
+                    # lines can differ only in padding, which parsing strips
+                    if fields:
+                        yield Change(name, 'changed', _decode(key), old_record, new_record, fields)
+        for key, (digest, offset) in sorted(index.items(), key=lambda item: item[1][1]):
+            old_fp.seek(offset)
+            yield Change(name, 'removed', _decode(key), parse(old_fp.readline()), None, ())
+
+def diff_cycles(old_directory, new_directory, names=None):
+    "diff_files for each file (all of PARSERS by default) that exists in both subscription directories"
+    for name in names or sorted(PARSERS):
+        old_path = os.path.join(old_directory, name)
+        new_path = os.path.join(new_directory, name)
+        if os.path.exists(old_path) and os.path.exists(new_path):
+            for change in diff_files(old_path, new_path, name):
+                yield change
+
+def summarize(changes):
+    "Count changes by file and kind: {'APT.txt': {'added': 3, 'changed': 10, 'removed': 0}, ...}"
+    summary = {}
+    for change in changes:
+        counts = summary.setdefault(change.file, {'added': 0, 'changed': 0, 'removed': 0})
+        counts[change.kind] += 1
+    return summary
+
+if __name__ == '__main__':
+    import sys
+    changes = []
+    for change in diff_cycles(sys.argv[1], sys.argv[2]):
+        changes.append(change)
+        print("%s %-7s %s %s" % (change.file, change.kind, '/'.join(change.key), ', '.join(change.fields)))
+    for name, counts in sorted(summarize(changes).items()):
+        print("%s: %d added, %d changed, %d removed" % (name, counts['added'], counts['changed'], counts['removed']))
+
+import unittest
+import shutil
+import tempfile
+
+class DiffTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.synthetic import write_cycle
+        self.old = tempfile.mkdtemp()
+        self.new = tempfile.mkdtemp()
+        write_cycle(self.old, 0.002)
+        write_cycle(self.new, 0.002)
+
+    def tearDown(self):
+        shutil.rmtree(self.old)
+        shutil.rmtree(self.new)
+
+    def edit(self, name, edit):
+        path = os.path.join(self.new, name)
+        with open(path, 'rb') as fp:
+            lines = fp.readlines()
+        lines = edit(lines)
+        with open(path, 'wb') as fp:
+            fp.writelines(lines)
+
+    def test_unchanged(self):
+        self.assertEqual([], list(diff_cycles(self.old, self.new)))
+
+    def test_apt(self):
+        elevation = APT_LAYOUTS['APT'].slices[APT_LAYOUTS['APT'].names.index('elevation_msl')]
+        runways = []
+        def edit(lines):
+            apt = lines[0]
+            lines[0] = apt[:elevation.start] + b'12345.6' + apt[elevation.stop:]
+            # drop the first runway, and add a facility at the end
+            runways.append([line for line in lines if line[:3] == b'RWY'][0])
+            lines.remove(runways[0])
+            lines.append(b'APT' + b'99999.*A'.ljust(11) + apt[14:])
+            return lines
+        self.edit('APT.txt', edit)
+        changes = list(diff_files(os.path.join(self.old, 'APT.txt'), os.path.join(self.new, 'APT.txt'), 'APT.txt'))
+        self.assertEqual(['changed', 'added', 'removed'], [change.kind for change in changes])
+        changed, added, removed = changes
+        with open(os.path.join(self.old, 'APT.txt'), 'rb') as fp:
+            self.assertEqual(('APT', parse_apt_line(fp.readline())['facility_site_number']), changed.key)
+        self.assertEqual(('elevation_msl',), changed.fields)
+        self.assertEqual('12345.6', changed.new['elevation_msl'])
+        self.assertEqual(('APT', '99999.*A'), added.key)
+        self.assertEqual(None, added.old)
+        self.assertEqual(parse_apt_line(runways[0]), removed.old)
+        self.assertEqual('RWY', removed.key[0])
+        self.assertEqual({'APT.txt': {'added': 1, 'changed': 1, 'removed': 1}}, summarize(changes))
+
+    def test_natfix_and_awos(self):
+        def natfix(lines):
+            # swap two fixes: a reordering is not a change
+            lines[2], lines[3] = lines[3], lines[2]
+            return lines
+        self.edit('NATFIX.txt', natfix)
+        self.edit('AWOS.txt', lambda lines: lines[1:])
+        changes = list(diff_cycles(self.old, self.new))
+        self.assertEqual([('AWOS.txt', 'removed')], [(change.file, change.kind) for change in changes])
+        self.assertEqual(3, len(changes[0].key))
+
+    def test_duplicate_keys(self):
+        from faddsdata.format_definitions import RMK_RECORDS
+        from faddsdata.parse import format_line
+        def remarks(text):
+            return [(format_line({'record_type': 'RMK', 'facility_site_number': '00001.*A', 'element_name': 'A81', 'element_text': t}, RMK_RECORDS) + '\r\n').encode('latin-1')
+                    for t in text]
+        with open(os.path.join(self.old, 'APT.txt'), 'wb') as fp:
+            fp.writelines(remarks(['ONE', 'TWO']))
+        self.edit('APT.txt', lambda lines: remarks(['ONE', 'TWO', 'THREE']))
+        changes = list(diff_files(os.path.join(self.old, 'APT.txt'), os.path.join(self.new, 'APT.txt'), 'APT.txt'))
+        self.assertEqual([('added', ('RMK', '00001.*A', 'A81', '2'))], [(change.kind, change.key) for change in changes])
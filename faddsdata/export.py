@@ -0,0 +1,264 @@
+"""Export a subscription cycle to an SQLite database.
+
+Every layout gets a table with a column per field (and per derived field such as lat/lon), typed
+from the field types in format_definitions: numbers and flags are INTEGER or REAL and dates are
+ISO 8601 TEXT. Records are streamed from the parsers and inserted in large executemany batches.
+Once everything is loaded, identifier indexes and an R-tree over lat/lon are built, so spatial
+queries run entirely in SQLite:
+
+    SELECT apt.location_identifier, apt.facility_name FROM apt_rtree JOIN apt ON apt.rowid = apt_rtree.id
+    WHERE apt_rtree.max_lat >= 38.5 AND apt_rtree.min_lat <= 39.5
+      AND apt_rtree.max_lon >= -96 AND apt_rtree.min_lon <= -95
+      AND apt.lat BETWEEN 38.5 AND 39.5 AND apt.lon BETWEEN -96 AND -95
+
+(An R-tree stores its bounds as 32 bit floats rounded outwards, so it finds a superset near the
+edges of the box; the last line filters on the exact coordinates.)
+
+Run "python -m faddsdata.export SOURCE DATABASE", where SOURCE is a subscription directory or ZIP."""
+
+import os
+import sqlite3
+
+from faddsdata.apt import APT_LAYOUTS, APT_DERIVED_FIELDS
+from faddsdata.awos import AWOS_LAYOUT, AWOS_DERIVED_FIELDS
+from faddsdata.cache import READERS
+from faddsdata.format_definitions import APT_TYPE_MAP, AWOS_TYPES
+from faddsdata.natfix import NATFIX_LAYOUT, NATFIX_DERIVED_FIELDS
+from faddsdata.parse import open_file, convert_boolean
+
+BATCH_SIZE = 20000
+
+# The table for each file, and for APT.txt each record type: (table, layout, derived fields, field types)
+TABLES = {
+    'APT.txt': dict((record_type, ('apt' if record_type == 'APT' else 'apt_' + record_type.lower(), layout,
+                                   APT_DERIVED_FIELDS.get(record_type, ()), APT_TYPE_MAP.get(record_type, {})))
+                    for record_type, layout in APT_LAYOUTS.items()),
+    'AWOS.txt': ('awos', AWOS_LAYOUT, AWOS_DERIVED_FIELDS, AWOS_TYPES),
+    'NATFIX.txt': ('natfix', NATFIX_LAYOUT, NATFIX_DERIVED_FIELDS, {}),
+}
+
+# Indexed columns of each table, and the tables that get an R-tree over their lat and lon
+INDEXES = {
+    'apt': ('facility_site_number', 'location_identifier', 'icao_identifier'),
+    'apt_att': ('facility_site_number',),
+    'apt_rwy': ('facility_site_number',),
+    'apt_ars': ('facility_site_number',),
+    'apt_rmk': ('facility_site_number',),
+    'awos': ('id', 'landing_facility_site_number'),
+    'natfix': ('id',),
+}
+RTREE_TABLES = ('apt', 'awos', 'natfix')
+
+# The column type for each field type in format_definitions
+SQL_TYPES = {
+    'int': 'INTEGER',
+    'float': 'REAL',
+    'yes_no': 'INTEGER',
+    'dms': 'REAL',
+    'dashed_dms': 'REAL',
+    'date': 'TEXT',
+    'month_year': 'TEXT',
+    'compact_date': 'TEXT',
+}
+DATE_TYPES = ('date', 'month_year', 'compact_date')
+
+# Speed over durability while loading: the database is rebuilt from scratch if a load fails
+LOAD_PRAGMAS = (
+    'PRAGMA journal_mode = OFF',
+    'PRAGMA synchronous = OFF',
+    'PRAGMA temp_store = MEMORY',
+    'PRAGMA cache_size = -262144',
+    'PRAGMA locking_mode = EXCLUSIVE',
+)
+
+def quote(name):
+    "Quote an SQL identifier; a few field names have spaces in them"
+    return '"%s"' % name.replace('"', '""')
+
+def table_columns(layout, derived, types):
+    "(column, SQL type) for each field of a layout and each derived field"
+    columns = []
+    for name in layout.names:
+        columns.append((name, SQL_TYPES.get(types.get(name), 'TEXT')))
+    names = set(layout.names)
+    for key, source, convert, condition in derived:
+        sql_type = 'INTEGER' if convert is convert_boolean else 'REAL'
+        if key in names:
+            # converted in place
+            columns[layout.names.index(key)] = (key, sql_type)
+        else:
+            columns.append((key, sql_type))
+            names.add(key)
+    return columns
+
+def _tables():
+    for name in sorted(TABLES):
+        tables = TABLES[name]
+        for table in (tables.values() if isinstance(tables, dict) else (tables,)):
+            yield table
+
+def create_tables(connection):
+    "Drop and recreate the table for every layout"
+    for table, layout, derived, types in _tables():
+        connection.execute('DROP TABLE IF EXISTS %s' % quote(table))
+        connection.execute('CREATE TABLE %s (%s)' % (quote(table), ', '.join('%s %s' % (quote(column), sql_type)
+                                                                         for column, sql_type in table_columns(layout, derived, types))))
+
+class _TableWriter(object):
+    # buffers the rows of one table and inserts them batch_size at a time
+    def __init__(self, connection, table, layout, derived, types, batch_size):
+        self.connection = connection
+        self.table = table
+        self.columns = tuple(column for column, _ in table_columns(layout, derived, types))
+        self.dates = tuple(name for name, kind in types.items() if kind in DATE_TYPES)
+        self.sql = 'INSERT INTO %s VALUES (%s)' % (quote(table), ', '.join('?' * len(self.columns)))
+        self.batch_size = batch_size
+        self.rows = []
+        self.count = 0
+
+    def add(self, record):
+        for name in self.dates:
+            value = record.get(name)
+            if value is not None:
+                record[name] = value.isoformat()
+        self.rows.append(tuple(map(record.get, self.columns)))
+        if len(self.rows) >= self.batch_size:
+            self.flush()
+
+    def flush(self):
+        if self.rows:
+            self.connection.executemany(self.sql, self.rows)
+            self.count += len(self.rows)
+            self.rows = []
+
+def export_records(connection, name, records, batch_size=BATCH_SIZE):
+    """Insert the typed records of one file (parsed with typed=True) into its tables, and return
+    the number of rows inserted into each table"""
+    tables = TABLES[name]
+    if isinstance(tables, dict):
+        writers = dict((record_type, _TableWriter(connection, *(table + (batch_size,)))) for record_type, table in tables.items())
+        for record in records:
+            writers[record['record_type']].add(record)
+        writers = writers.values()
+    else:
+        writer = _TableWriter(connection, *(tables + (batch_size,)))
+        for record in records:
+            writer.add(record)
+        writers = (writer,)
+    counts = {}
+    for writer in writers:
+        writer.flush()
+        counts[writer.table] = writer.count
+    return counts
+
+def build_indexes(connection):
+    "Create the INDEXES and an R-tree named <table>_rtree for each of RTREE_TABLES"
+    for table, columns in sorted(INDEXES.items()):
+        for column in columns:
+            connection.execute('CREATE INDEX %s ON %s (%s)' % (quote('%s_%s' % (table, column)), quote(table), quote(column)))
+    for table in RTREE_TABLES:
+        rtree = quote(table + '_rtree')
+        connection.execute('DROP TABLE IF EXISTS %s' % rtree)
+        connection.execute('CREATE VIRTUAL TABLE %s USING rtree(id, min_lat, max_lat, min_lon, max_lon)' % rtree)
+        connection.execute('INSERT INTO %s SELECT rowid, lat, lat, lon, lon FROM %s WHERE lat IS NOT NULL AND lon IS NOT NULL'
+                           % (rtree, quote(table)))
+
+def _sources(source):
+    # (file name, typed record stream) for each file of a subscription directory or ZIP
+    if os.path.isdir(source):
+        for name in sorted(READERS):
+            path = os.path.join(source, name)
+            if os.path.exists(path):
+                with open_file(path, binary=True) as fp:
+                    yield name, READERS[name](fp, typed=True)
+    else:
+        from faddsdata.subscription import open_subscription
+        with open_subscription(source, typed=True) as subscription:
+            for name in subscription.names():
+                yield name, subscription.records(name)
+
+def export_cycle(source, database, batch_size=BATCH_SIZE):
+    """Load a subscription directory or ZIP into the SQLite database at the path database,
+    replacing any earlier export in it. Returns the number of rows in each table."""
+    connection = sqlite3.connect(database)
+    try:
+        for pragma in LOAD_PRAGMAS:
+            connection.execute(pragma)
+        counts = {}
+        with connection:
+            create_tables(connection)
+            for name, records in _sources(source):
+                counts.update(export_records(connection, name, records, batch_size))
+            build_indexes(connection)
+        connection.execute('ANALYZE')
+        return counts
+    finally:
+        connection.close()
+
+if __name__ == '__main__':
+    import sys
+    import time
+    start = time.perf_counter()
+    for table, count in sorted(export_cycle(sys.argv[1], sys.argv[2]).items()):
+        print("%s: %d rows" % (table, count))
+    print("%.1fs" % (time.perf_counter() - start))
+
+import unittest
+import shutil
+import tempfile
+
+class ExportTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.synthetic import write_cycle
+        self.directory = tempfile.mkdtemp()
+        write_cycle(self.directory, 0.002)
+        self.database = os.path.join(self.directory, 'cycle.sqlite')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parsed(self, name, **options):
+        with open_file(os.path.join(self.directory, name)) as fp:
+            return list(READERS[name](fp, **options))
+
+    def test_export(self):
+        counts = export_cycle(self.directory, self.database, batch_size=7)
+        records = self.parsed('APT.txt', typed=True)
+        self.assertEqual(len([r for r in records if r['record_type'] == 'RWY']), counts['apt_rwy'])
+        self.assertEqual(len(self.parsed('NATFIX.txt')), counts['natfix'])
+        # exporting again replaces the tables
+        self.assertEqual(counts, export_cycle(self.directory, self.database))
+        connection = sqlite3.connect(self.database)
+        self.addCleanup(connection.close)
+        self.assertEqual(counts['apt'], connection.execute('SELECT count(*) FROM apt').fetchone()[0])
+        apt = records[0]
+        row = connection.execute('SELECT information_effective_date, elevation_msl, lat, lon, control_tower, "reciprocal_end_takeoff distance_available_feet" '
+                                 'FROM apt LEFT JOIN apt_rwy USING (facility_site_number) WHERE apt.facility_site_number = ?',
+                                 (apt['facility_site_number'],)).fetchone()
+        self.assertEqual(apt['information_effective_date'].isoformat() if apt['information_effective_date'] else None, row[0])
+        self.assertEqual((apt['elevation_msl'], apt['lat'], apt['lon'], int(apt['control_tower'])), row[1:5])
+        self.assertEqual('real', connection.execute("SELECT typeof(lat) FROM natfix LIMIT 1").fetchone()[0])
+
+    def test_rtree(self):
+        export_cycle(self.directory, self.database)
+        connection = sqlite3.connect(self.database)
+        self.addCleanup(connection.close)
+        for table, name in (('apt', 'APT.txt'), ('awos', 'AWOS.txt'), ('natfix', 'NATFIX.txt')):
+            expected = sorted(r['id' if table != 'apt' else 'location_identifier'] for r in self.parsed(name)
+                              if 'lat' in r and 30 <= r["lat"] <= 45 and -115 <= r["lon"] <= -80)
+            self.assertTrue(expected)
+            found = connection.execute('SELECT t.%s FROM %s_rtree r JOIN %s t ON t.rowid = r.id '
+                                       'WHERE r.max_lat >= 30 AND r.min_lat <= 45 AND r.max_lon >= -115 AND r.min_lon <= -80 '
+                                       'AND t.lat BETWEEN 30 AND 45 AND t.lon BETWEEN -115 AND -80'
+                                       % ('id' if table != 'apt' else 'location_identifier', table, table)).fetchall()
+            self.assertEqual(expected, sorted(value for value, in found))
+        plan = ' '.join(row[-1] for row in connection.execute('EXPLAIN QUERY PLAN SELECT * FROM natfix WHERE id = ?', ('ABC',)))
+        self.assertTrue('natfix_id' in plan)
+
+    def test_zip(self):
+        import zipfile
+        archive_path = os.path.join(self.directory, 'subscription.zip')
+        with zipfile.ZipFile(archive_path, 'w') as archive:
+            for name in READERS:
+                archive.write(os.path.join(self.directory, name), name)
+        self.assertEqual(export_cycle(self.directory, self.database), export_cycle(archive_path, self.database + '2'))
@@ -1,2 +1,3 @@
-from faddsdata.format_definitions.apt import APT_RECORDS, ATT_RECORDS, RWY_RECORDS, RMK_RECORDS, APT_RECORD_MAP
-from faddsdata.format_definitions.awos import AWOS_RECORDS
+from faddsdata.format_definitions.apt import APT_RECORDS, ATT_RECORDS, RWY_RECORDS, RMK_RECORDS, APT_RECORD_MAP, APT_TYPE_MAP, APT_INTERN_MAP
+from faddsdata.format_definitions.awos import AWOS_RECORDS, AWOS_TYPES, AWOS_INTERNED
+from faddsdata.format_definitions.registry import FileFormat, register_format, registered_formats, get_format
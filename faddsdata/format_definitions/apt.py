@@ -277,6 +277,98 @@ RMK_RECORDS = (
     ('element_text', 1500),
 )
 
+# Field types for the typed parsing mode, by field name; fields not listed stay text.
+# The type names are the keys of faddsdata.parse.CONVERTERS.
+APT_TYPES = {
+    'information_effective_date': 'date',
+    'point_latitude_formatted': 'dashed_dms',
+    'point_longitude_formatted': 'dashed_dms',
+    'elevation_msl': 'float',
+    'magnetic_variation_epoch_year': 'int',
+    'traffic_pattern_agl': 'int',
+    'distance_to_central_business_district': 'int',
+    'land_area_covered_acres': 'int',
+    'tie_in_fss_on_airport': 'yes_no',
+    'notam_d_available': 'yes_no',
+    'activation_date': 'month_year',
+    'customs_airport_of_entry': 'yes_no',
+    'customs_landing_rights': 'yes_no',
+    'military_civil_joint_use': 'yes_no',
+    'military_landing_rights': 'yes_no',
+    'last_physical_inspection_date': 'compact_date',
+    'last_information_date': 'compact_date',
+    'landing_fees': 'yes_no',
+    'medical_use': 'yes_no',
+    'singles_based': 'int',
+    'multis_based': 'int',
+    'jets_based': 'int',
+    'helicopters_based': 'int',
+    'gliders_based': 'int',
+    'military_based': 'int',
+    'ultralights_based': 'int',
+    'commercial_services_operations': 'int',
+    'commuter_services_operations': 'int',
+    'air_taxi_operations': 'int',
+    'ga_local_operations': 'int',
+    'ga_itinerant_operations': 'int',
+    'military_operations': 'int',
+    'operations_ending_date': 'date',
+    'position_source_date': 'date',
+    'elevation_source_date': 'date',
+    'contract_fuel_available': 'yes_no',
+    'minimum_operational_network': 'yes_no',
+}
+
+ATT_TYPES = {
+    'attendace_schedule_sequence': 'int',
+}
+
+RWY_TYPES = {
+    'runway_length': 'int',
+    'runway_width': 'int',
+    'runway_length_source_date': 'date',
+    'runway_weight_bearing_single_wheel': 'float',
+    'runway_weight_bearing_dual_wheel': 'float',
+    'runway_weight_bearing_two_dual_wheels': 'float',
+    'runway_weight_bearing_two_dual_wheels_tandem': 'float',
+}
+# Each runway end has the same set of fields
+for _end in ('base_end_', 'reciprocal_end_'):
+    RWY_TYPES.update({
+        _end + 'true_alignment': 'int',
+        _end + 'righthand_traffic': 'yes_no',
+        _end + 'latitude_physical_runway_end_formatted': 'dashed_dms',
+        _end + 'longitude_physical_runway_end_formatted': 'dashed_dms',
+        _end + 'elevation_physical_runway_end': 'float',
+        _end + 'threshold_crossing_height_agl': 'int',
+        _end + 'visual_glide_path_angle_degrees': 'float',
+        _end + 'latitude_displaced_threshold_formatted': 'dashed_dms',
+        _end + 'longitude_displaced_threshold_formatted': 'dashed_dms',
+        _end + 'elevation_displaced_threshold': 'float',
+        _end + 'displaced_threshold_length_from_end': 'int',
+        _end + 'elevation_touchdown_zone': 'float',
+        _end + 'controlling_object_clearance_slope': 'int',
+        _end + 'controlling_object_height_above_runway': 'int',
+        _end + 'controlling_object_distance_runway_end': 'int',
+        _end + 'runway_end_gradient': 'float',
+        _end + 'runway_end_position_source_date': 'date',
+        _end + 'runway_end_elevation_source_date': 'date',
+        _end + 'displaced_threshold_position_source_date': 'date',
+        _end + 'displaced_threshold_elevation_source_date': 'date',
+        _end + 'touchdown_zone_elevation_source_date': 'date',
+        _end + 'takeoff_run_available_feet': 'int',
+        _end + 'aclt_stop_distance_available_feet': 'int',
+        _end + 'landing_distance_available_feet': 'int',
+        _end + 'available_landing_distance_lahso_feet': 'int',
+        _end + 'latitude_lahso_point_formatted': 'dashed_dms',
+        _end + 'longitude_lahso_point_formatted': 'dashed_dms',
+        _end + 'lahso_point_source_date': 'date',
+    })
+del _end
+RWY_TYPES['base_end_takeoff_distance_available_feet'] = 'int'
+# sic, the field name has a space in it
+RWY_TYPES['reciprocal_end_takeoff distance_available_feet'] = 'int'
+
 # Maps the first field of APT.txt to the record type
 APT_RECORD_MAP = {
     'APT': APT_RECORDS,
@@ -285,3 +377,62 @@ APT_RECORD_MAP = {
     'RWY': RWY_RECORDS,
     'RMK': RMK_RECORDS
 }
+
+# Maps the first field of APT.txt to the field types of the record type
+APT_TYPE_MAP = {
+    'APT': APT_TYPES,
+    'ATT': ATT_TYPES,
+    'RWY': RWY_TYPES,
+}
+
+# Fields that repeat a small set of values across the file, by record type. In interning mode the
+# parsers share one string per distinct value of these. facility_site_number isn't low-cardinality
+# but every line of a facility repeats it.
+APT_INTERNED = (
+    'record_type', 'facility_site_number', 'facility_type', 'information_effective_date', 'faa_region_code',
+    'faa_district_office_code', 'associated_state_post_office_code', 'associated_state_name', 'county_name',
+    'county_state_post_office_code', 'associated_city', 'ownership_type', 'use_type', 'point_determination_method',
+    'elevation_determination_method', 'magnetic_variation', 'magnetic_variation_epoch_year', 'sectional',
+    'direction_to_central_business_district', 'boundary_artcc_identifier', 'boundary_artcc_computer_identifier',
+    'boundary_artcc_name', 'responsible_artcc_identifier', 'responsible_artcc_computer_identifier',
+    'responsible_artcc_name', 'tie_in_fss_on_airport', 'tie_in_fss_identifier', 'tie_in_fss_name',
+    'alternate_fss_identifier', 'alternate_fss_name', 'notam_issuing_fss_identifier', 'notam_d_available',
+    'status_code', 'arff_certifcation_type_and_date', 'npias_federal_agreements_code',
+    'airport_airspace_analysis_determination', 'customs_airport_of_entry', 'customs_landing_rights',
+    'military_civil_joint_use', 'military_landing_rights', 'airport_inspection_method',
+    'agency_group_performing_inspection', 'available_fuels', 'airframe_repair', 'powerplant_repair',
+    'bottled_oxygen_available', 'bulk_oxygen_available', 'lighting_schedule', 'beacon_lighting_schedule',
+    'control_tower', 'segmented_circle', 'beacon_color', 'landing_fees', 'medical_use', 'position_source',
+    'elevation_source', 'contract_fuel_available', 'transient_storage', 'wind_indicator', 'minimum_operational_network',
+)
+
+ATT_INTERNED = ('record_type', 'facility_site_number', 'state_post_office_code', 'attendace_schedule_sequence', 'attendance_schedule')
+
+RWY_INTERNED = ['record_type', 'facility_site_number', 'state_post_office_code', 'runway_identification',
+                'surface_type_condition', 'surface_treatment', 'lights_edge_intensity', 'runway_length_source',
+                'base_end_identifier', 'base_end_runway_markings_type', 'reciprocal_end_identifer', 'reciprocal_end_runway_markings']
+for _end in ('base_end_', 'reciprocal_end_'):
+    RWY_INTERNED.extend(_end + name for name in (
+        'ils_type', 'righthand_traffic', 'runway_markings_condition',
+        'visual_glide_slope_indicators', 'runway_visual_range_equipment_locations', 'runway_visual_range_equipment',
+        'approach_light_system', 'runway_end_identifer_lights', 'runway_centerline_lights', 'runway_end_touchdown_lights',
+        'controlling_object_description', 'controlling_object_marked_lighted', 'runway_category',
+        'runway_end_gradient_direction', 'runway_end_position_source', 'runway_end_elevation_source',
+        'displaced_threshold_position_source', 'displaced_threshold_elevation_source', 'touchdown_zone_elevation_source',
+        'lahso_point_source'))
+del _end
+RWY_INTERNED = tuple(RWY_INTERNED)
+
+ARRESTING_INTERNED = ('record_type', 'facility_site_number', 'state_post_office_code', 'runway_identification',
+                      'runway_end_identifier', 'aircraft_arresting_device_type')
+
+RMK_INTERNED = ('record_type', 'facility_site_number', 'state_post_office_code', 'element_name')
+
+# Maps the first field of APT.txt to the interned fields of the record type
+APT_INTERN_MAP = {
+    'APT': APT_INTERNED,
+    'ARS': ARRESTING_INTERNED,
+    'ATT': ATT_INTERNED,
+    'RWY': RWY_INTERNED,
+    'RMK': RMK_INTERNED,
+}
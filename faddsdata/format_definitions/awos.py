@@ -19,3 +19,14 @@ AWOS_RECORDS = (
     ('information_effective', 10),
     ('filler', 82),
 )
+
+# Field types for the typed parsing mode (see faddsdata.parse.CONVERTERS)
+AWOS_TYPES = {
+    'commissioning_date': 'date',
+    'elevation': 'float',
+    'information_effective': 'date',
+}
+
+# Fields with few distinct values, shared between records in interning mode
+AWOS_INTERNED = ('record_type', 'sensor_type', 'commissioning_status', 'commissioning_date', 'navaid', 'survey_method',
+                 'landing_facility_site_number', 'city', 'state_post_office_code', 'information_effective')
@@ -0,0 +1,105 @@
+"""The FADDS files faddsdata knows how to read, by file name.
+
+Each file is registered with its layouts, keyed by the record type that starts its lines, and the
+post-processing applied to its records: derived fields, field types and interned fields. That is
+enough to parse a file; the parser modules register their own readers as well, which add lazy
+records, projections and line filters. A new file only needs its layouts:
+
+    register_format('FIX.txt', {'FIX1': FIX1_RECORDS, 'FIX2': FIX2_RECORDS, ...})
+
+The built-in formats are registered when faddsdata.apt, faddsdata.awos and faddsdata.natfix are
+imported, which get_format and registered_formats take care of."""
+
+import importlib
+
+from faddsdata.parse import ParseException, compile_layout, compile_types, add_derived_fields, intern_fields, \
+    convert_types, iter_lines
+
+# Modules registering the formats faddsdata comes with
+BUILTIN_MODULES = ('faddsdata.apt', 'faddsdata.awos', 'faddsdata.natfix')
+
+FORMATS = {}
+
+class FileFormat(object):
+    """How to parse one FADDS file. layouts maps each record type, the text its lines start with, to
+    its definition; a file with a single kind of line can give just the definition. derived, types
+    and interned map the same record types to derived fields (see parse.add_derived_fields), field
+    types (see parse.CONVERTERS) and the names of fields to intern, or are given directly for a single
+    definition. skip lines are ignored at the start of the file and parsing stops at a line starting
+    with end. reader, if given, is used by records instead of parsing the lines here."""
+
+    def __init__(self, name, layouts, derived=None, types=None, interned=None, reader=None, skip=0, end=None):
+        self.name = name
+        if not isinstance(layouts, dict):
+            layouts, derived, types, interned = {'': layouts}, {'': derived or ()}, {'': types or {}}, {'': interned or ()}
+        self.layouts = dict((record_type, compile_layout(definition)) for record_type, definition in layouts.items())
+        self.derived = dict((record_type, tuple((derived or {}).get(record_type, ()))) for record_type in self.layouts)
+        self.converters = dict((record_type, compile_types((types or {}).get(record_type, {}))) for record_type in self.layouts)
+        self.interned = dict((record_type, tuple((interned or {}).get(record_type, ()))) for record_type in self.layouts)
+        self.reader = reader
+        self.skip = skip
+        self.end = end
+        # longest first, so that a record type isn't mistaken for a shorter one it starts with
+        self._prefix_lengths = sorted(set(map(len, self.layouts)), reverse=True)
+
+    def __repr__(self):
+        return '<FileFormat %s: %s>' % (self.name, ', '.join(sorted(self.layouts)) or 'one layout')
+
+    def record_type(self, line):
+        "The registered record type of a line, given as str or as latin-1 bytes"
+        for length in self._prefix_lengths:
+            prefix = line[:length]
+            if not isinstance(prefix, str):
+                prefix = bytes(prefix).decode('latin-1')
+            if prefix in self.layouts:
+                return prefix
+        raise ParseException("Unknown record type in %s: %r" % (self.name, line[:max(self._prefix_lengths) or 10]))
+
+    def parse_line(self, line, typed=False, interned=False):
+        "Parse one line with its record type's layout and post-processing, like the parse_*_line functions"
+        record_type = self.record_type(line)
+        r = self.layouts[record_type].parse(line)
+        add_derived_fields(r, self.derived[record_type])
+        if interned:
+            intern_fields(r, self.interned[record_type] if interned is True else interned)
+        if typed:
+            convert_types(r, self.converters[record_type])
+        return r
+
+    def parse_lines(self, fp, typed=False, interned=False):
+        "Parse an open file one line at a time with parse_line, without the registered reader"
+        for _ in range(self.skip):
+            fp.readline()
+        end = self.end
+        end_bytes = end.encode('latin-1') if end is not None else None
+        for line in iter_lines(fp, source=self.name):
+            if end is not None and line.startswith(end if isinstance(line, str) else end_bytes):
+                break
+            yield self.parse_line(line, typed, interned)
+
+    def records(self, fp, **options):
+        "Iterate over the records of an open file with the registered reader, or else parse_lines"
+        if self.reader is not None:
+            return self.reader(fp, **options)
+        return self.parse_lines(fp, **options)
+
+def register_format(name, layouts, derived=None, types=None, interned=None, reader=None, skip=0, end=None):
+    "Register a FileFormat (see its arguments) for the file called name, replacing any registered before"
+    file_format = FORMATS[name] = FileFormat(name, layouts, derived, types, interned, reader, skip, end)
+    return file_format
+
+def registered_formats():
+    "A dict of every registered FileFormat by file name, built-in ones included"
+    for module in BUILTIN_MODULES:
+        importlib.import_module(module)
+    return dict(FORMATS)
+
+def get_format(name):
+    "The FileFormat registered for a file name, ignoring case"
+    formats = registered_formats()
+    if name in formats:
+        return formats[name]
+    for registered in formats:
+        if registered.lower() == name.lower():
+            return formats[registered]
+    raise KeyError(name)
@@ -0,0 +1,243 @@
+"""Great circle distances and bearings over whole arrays of coordinates.
+
+The functions take latitudes and longitudes in decimal degrees as NumPy arrays (or anything
+np.asarray accepts): the lat/lon columns of faddsdata.columnar, or coordinate_arrays() of parsed
+records. Distances are haversine nautical miles on the same sphere as faddsdata.spatial and
+bearings are true courses from 0 to 360. Missing coordinates are NaN, and so is anything
+computed from them.
+
+    lats, lons = coordinate_arrays(airports, 'lat', 'lon')
+    distances = distance_to_many(39.0, -95.2, lats, lons)
+    base_lats, base_lons, end_lats, end_lons = coordinate_arrays(runways, 'base_end_lat', 'base_end_lon',
+                                                                 'reciprocal_end_lat', 'reciprocal_end_lon')
+    lengths = pairwise_distance(base_lats, base_lons, end_lats, end_lons)
+
+Many-to-many queries (nearest, within) work through the matrix between the two sets a block of
+rows at a time, so memory is bounded by BLOCK_SIZE however large both sets are. They rank pairs
+by the dot product of the points as unit vectors, which orders them exactly as the great circle
+distance does and comes out of a single matrix multiplication per block; the haversine distance
+is then worked out only for the pairs that are kept. numpy is only needed for this module."""
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from faddsdata.spatial import EARTH_RADIUS_NM
+
+# Most distances held at once by the many-to-many functions (8 bytes each, and a few temporaries)
+BLOCK_SIZE = 1 << 22
+
+def _require_numpy():
+    if np is None:
+        raise ImportError("faddsdata.geodesy requires numpy (pip install faddsdata[numpy])")
+
+def coordinate_arrays(records, *keys):
+    "A float64 array of the values of each key over the records, NaN where a record doesn't have one"
+    _require_numpy()
+    arrays = []
+    for key in keys:
+        values = [record.get(key) for record in records]
+        arrays.append(np.array([np.nan if value is None else value for value in values], dtype=np.float64))
+    return tuple(arrays)
+
+class Points(object):
+    """Coordinates converted to radians once, with their sines and cosines, for reuse across queries"""
+
+    def __init__(self, lats, lons):
+        _require_numpy()
+        self.lats = np.radians(np.asarray(lats, dtype=np.float64))
+        self.lons = np.radians(np.asarray(lons, dtype=np.float64))
+        if self.lats.shape != self.lons.shape:
+            raise ValueError("%d latitudes but %d longitudes" % (self.lats.size, self.lons.size))
+        self.sin_lats = np.sin(self.lats)
+        self.cos_lats = np.cos(self.lats)
+        self._vectors = None
+
+    def __len__(self):
+        return len(self.lats)
+
+    def __getitem__(self, rows):
+        "The points of a slice or index array, without converting them again"
+        points = Points.__new__(Points)
+        points.lats = self.lats[rows]
+        points.lons = self.lons[rows]
+        points.sin_lats = self.sin_lats[rows]
+        points.cos_lats = self.cos_lats[rows]
+        points._vectors = None if self._vectors is None else self._vectors[rows]
+        return points
+
+    @property
+    def vectors(self):
+        "The points as (n, 3) unit vectors from the center of the earth"
+        if self._vectors is None:
+            self._vectors = np.column_stack((self.cos_lats * np.cos(self.lons), self.cos_lats * np.sin(self.lons), self.sin_lats))
+        return self._vectors
+
+def _points(lats, lons):
+    return lats if isinstance(lats, Points) else Points(lats, lons)
+
+def _haversine(lat1, cos1, lon1, lat2, cos2, lon2):
+    a = np.sin((lat2 - lat1) * 0.5) ** 2 + cos1 * cos2 * np.sin((lon2 - lon1) * 0.5) ** 2
+    return 2 * EARTH_RADIUS_NM * np.arcsin(np.sqrt(np.minimum(a, 1.0)))
+
+def _bearing(sin1, cos1, lon1, sin2, cos2, lon2):
+    delta = lon2 - lon1
+    y = np.sin(delta) * cos2
+    x = cos1 * sin2 - sin1 * cos2 * np.cos(delta)
+    return np.degrees(np.arctan2(y, x)) % 360.0
+
+def distance_to_many(lat, lon, lats, lons=None):
+    """Distance in nm from one point to each of many. lats and lons are arrays, or lats is a Points
+    (and lons left out) when the same points are queried again and again."""
+    _require_numpy()
+    points = _points(lats, lons)
+    lat, lon = np.radians(lat), np.radians(lon)
+    return _haversine(lat, np.cos(lat), lon, points.lats, points.cos_lats, points.lons)
+
+def bearing_to_many(lat, lon, lats, lons=None):
+    "Initial true bearing from one point to each of many (see distance_to_many)"
+    _require_numpy()
+    points = _points(lats, lons)
+    lat, lon = np.radians(lat), np.radians(lon)
+    return _bearing(np.sin(lat), np.cos(lat), lon, points.sin_lats, points.cos_lats, points.lons)
+
+def pairwise_distance(lats1, lons1, lats2, lons2):
+    "Distance in nm from each point of the first arrays to the point at the same index of the second"
+    _require_numpy()
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=np.float64)) for values in (lats1, lons1, lats2, lons2))
+    return _haversine(lat1, np.cos(lat1), lon1, lat2, np.cos(lat2), lon2)
+
+def pairwise_bearing(lats1, lons1, lats2, lons2):
+    "Initial true bearing from each point of the first arrays to the point at the same index of the second"
+    _require_numpy()
+    lat1, lon1, lat2, lon2 = (np.radians(np.asarray(values, dtype=np.float64)) for values in (lats1, lons1, lats2, lons2))
+    return _bearing(np.sin(lat1), np.cos(lat1), lon1, np.sin(lat2), np.cos(lat2), lon2)
+
+def _blocks(first, second, block_size):
+    rows = max(1, block_size // max(1, len(second)))
+    for start in range(0, len(first), rows):
+        yield start, first[start:start + rows]
+
+def distance_blocks(first, second, block_size=BLOCK_SIZE):
+    """Yield (start, distances) for consecutive blocks of rows of the distance matrix between two
+    Points, each block holding the distances from first[start:start + rows] to all of second"""
+    for start, block in _blocks(first, second, block_size):
+        yield start, _haversine(block.lats[:, None], block.cos_lats[:, None], block.lons[:, None],
+                                second.lats, second.cos_lats, second.lons)
+
+def _pair_distances(first, rows, second, columns):
+    return _haversine(first.lats[rows], first.cos_lats[rows], first.lons[rows],
+                      second.lats[columns], second.cos_lats[columns], second.lons[columns])
+
+def nearest(lats1, lons1, lats2, lons2, k=1, block_size=BLOCK_SIZE):
+    """For each point of the first set, the indexes into the second set of its k nearest points and
+    their distances, as two (len(first), k) arrays sorted nearest first. Points without coordinates
+    are never nearest; rows without coordinates get NaN distances."""
+    _require_numpy()
+    first, second = Points(lats1, lons1), Points(lats2, lons2)
+    k = min(k, len(second))
+    indexes = np.empty((len(first), k), dtype=np.intp)
+    distances = np.empty((len(first), k), dtype=np.float64)
+    for start, block in _blocks(first, second, block_size):
+        # the nearest points have the largest dot products, so rank by its negation
+        ranks = -(block.vectors @ second.vectors.T)
+        ranks[np.isnan(ranks)] = np.inf
+        if k < ranks.shape[1]:
+            candidates = np.argpartition(ranks, k - 1, axis=1)[:, :k]
+        else:
+            candidates = np.broadcast_to(np.arange(k), ranks.shape)
+        found = np.take_along_axis(ranks, candidates, axis=1)
+        order = np.argsort(found, axis=1, kind='stable')
+        candidates = np.take_along_axis(candidates, order, axis=1)
+        end = start + len(block)
+        indexes[start:end] = candidates
+        distances[start:end] = _pair_distances(block, np.arange(len(block))[:, None], second, candidates)
+    return indexes, distances
+
+def within(lats1, lons1, lats2, lons2, radius_nm, block_size=BLOCK_SIZE):
+    """Every pair of a point of the first set and a point of the second set within radius_nm of each
+    other, as three arrays: the indexes into the first set, the indexes into the second and the distances"""
+    _require_numpy()
+    first, second = Points(lats1, lons1), Points(lats2, lons2)
+    rows, columns, distances = [], [], []
+    # a little slack for the rounding of the dot products; the candidates are checked exactly
+    threshold = np.cos(min(radius_nm / EARTH_RADIUS_NM, np.pi)) - 1e-9
+    for start, block in _blocks(first, second, block_size):
+        row, column = np.nonzero(block.vectors @ second.vectors.T >= threshold)
+        found = _pair_distances(block, row, second, column)
+        keep = found <= radius_nm
+        rows.append(row[keep] + start)
+        columns.append(column[keep])
+        distances.append(found[keep])
+    if not rows:
+        return np.empty(0, dtype=np.intp), np.empty(0, dtype=np.intp), np.empty(0, dtype=np.float64)
+    return np.concatenate(rows), np.concatenate(columns), np.concatenate(distances)
+
+import unittest
+import random
+@unittest.skipIf(np is None, "numpy is not installed")
+class GeodesyTests(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(22)
+        self.lats = np.array([generator.uniform(-89, 89) for _ in range(300)])
+        self.lons = np.array([generator.uniform(-180, 180) for _ in range(300)])
+        self.lats[7] = np.nan
+
+    def test_to_many(self):
+        from faddsdata.spatial import great_circle_nm, initial_bearing
+        points = Points(self.lats, self.lons)
+        for lat, lon in ((39.0, -95.2), (0.0, 179.9), (-60.0, 10.0)):
+            distances = distance_to_many(lat, lon, self.lats, self.lons)
+            bearings = bearing_to_many(lat, lon, points)
+            self.assertTrue(np.isnan(distances[7]) and np.isnan(bearings[7]))
+            for i in (0, 1, 150, 299):
+                self.assertAlmostEqual(great_circle_nm(lat, lon, self.lats[i], self.lons[i]), distances[i], 6)
+                self.assertAlmostEqual(initial_bearing(lat, lon, self.lats[i], self.lons[i]), bearings[i], 6)
+            self.assertTrue(np.array_equal(distances, distance_to_many(lat, lon, points), equal_nan=True))
+        self.assertRaises(ValueError, Points, [1.0, 2.0], [1.0])
+
+    def test_pairwise(self):
+        from faddsdata.spatial import great_circle_nm, initial_bearing
+        runways = [{'base_end_lat': 39.0, 'base_end_lon': -95.2, 'reciprocal_end_lat': 39.01, 'reciprocal_end_lon': -95.19},
+                   {'base_end_lat': 40.0, 'base_end_lon': -100.0}]
+        base_lats, base_lons, end_lats, end_lons = coordinate_arrays(runways, 'base_end_lat', 'base_end_lon',
+                                                                     'reciprocal_end_lat', 'reciprocal_end_lon')
+        distances = pairwise_distance(base_lats, base_lons, end_lats, end_lons)
+        self.assertAlmostEqual(great_circle_nm(39.0, -95.2, 39.01, -95.19), distances[0])
+        self.assertTrue(np.isnan(distances[1]))
+        bearings = pairwise_bearing(self.lats[:-1], self.lons[:-1], self.lats[1:], self.lons[1:])
+        self.assertAlmostEqual(initial_bearing(self.lats[0], self.lons[0], self.lats[1], self.lons[1]), bearings[0])
+
+    def test_nearest(self):
+        queries_lats, queries_lons = self.lats[:40], self.lons[:40]
+        for block_size in (1, 1000, BLOCK_SIZE):
+            indexes, distances = nearest(queries_lats, queries_lons, self.lats, self.lons, k=3, block_size=block_size)
+            for row in (0, 5, 39):
+                expected = distance_to_many(queries_lats[row], queries_lons[row], self.lats, self.lons)
+                order = np.argsort(np.where(np.isnan(expected), np.inf, expected), kind='stable')[:3]
+                self.assertEqual(list(order), list(indexes[row]))
+                self.assertTrue(np.allclose(expected[order], distances[row]))
+            # a point is nearest to itself
+            self.assertEqual(0, indexes[0][0])
+            self.assertTrue(np.isnan(distances[7]).all())
+        indexes, distances = nearest(self.lats[:2], self.lons[:2], self.lats[:5], self.lons[:5], k=10)
+        self.assertEqual((2, 5), indexes.shape)
+
+    def test_distance_blocks(self):
+        points = Points(self.lats, self.lons)
+        blocks = list(distance_blocks(points[:10], points, block_size=1000))
+        self.assertEqual([0, 3, 6, 9], [start for start, _ in blocks])
+        self.assertTrue(np.allclose(distance_to_many(self.lats[4], self.lons[4], self.lats, self.lons), blocks[1][1][1], equal_nan=True))
+        self.assertTrue(np.allclose(points.vectors[5:9], points[5:9].vectors, equal_nan=True))
+
+    def test_within(self):
+        rows, columns, distances = within(self.lats, self.lons, self.lats[:50], self.lons[:50], 600, block_size=100)
+        expected = set()
+        for i in range(len(self.lats)):
+            for j, distance in enumerate(distance_to_many(self.lats[i], self.lons[i], self.lats[:50], self.lons[:50])):
+                if distance <= 600:
+                    expected.add((i, j))
+        self.assertEqual(expected, set(zip(rows.tolist(), columns.tolist())))
+        self.assertTrue((distances <= 600).all())
+        self.assertEqual(0, len(within([], [], self.lats, self.lons, 10)[0]))
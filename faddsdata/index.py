@@ -0,0 +1,202 @@
+"""Look up single airports, AWOS stations and fixes by identifier without parsing whole files.
+
+build_index scans a file once, recording the byte offset of every line under the identifiers it
+carries, and saves that next to the file (APT.txt.idx). A lookup then seeks straight to those
+lines and parses only them with the usual layouts."""
+
+import marshal
+import os
+
+from faddsdata.apt import APT_LAYOUTS, FACILITY_CHILDREN, parse_apt_line
+from faddsdata.awos import AWOS_LAYOUT, parse_awos_line
+from faddsdata.cache import layout_fingerprint
+from faddsdata.natfix import NATFIX_LAYOUT, parse_natfix_line
+
+INDEX_VERSION = 1
+INDEX_SUFFIX = '.idx'
+
+def _field_slice(layout, name):
+    return layout.slices[layout.names.index(name)]
+
+_APT_SITE = _field_slice(APT_LAYOUTS['APT'], 'facility_site_number')
+_APT_IDENTIFIERS = (('facility_site_number', _APT_SITE),
+                    ('location_identifier', _field_slice(APT_LAYOUTS['APT'], 'location_identifier')),
+                    ('icao_identifier', _field_slice(APT_LAYOUTS['APT'], 'icao_identifier')))
+# facility_site_number is at the same place on every APT.txt record type
+assert all(_field_slice(layout, 'facility_site_number') == _APT_SITE for layout in APT_LAYOUTS.values())
+
+def _apt_keys(line):
+    if line[:3] == b'APT':
+        return [(field, line[where]) for field, where in _APT_IDENTIFIERS]
+    # child lines are only found through their facility
+    return [('facility_site_number', line[_APT_SITE])]
+
+def _awos_keys(line, _id=_field_slice(AWOS_LAYOUT, 'id')):
+    return [('id', line[_id])]
+
+def _natfix_keys(line, _id=_field_slice(NATFIX_LAYOUT, 'id')):
+    return [('id', line[_id])]
+
+# For each file: the function giving the (field, raw value) pairs of a line, the line parser,
+# how many preamble lines to skip, and the line that ends the data, if any
+INDEXED_FILES = {
+    'APT.txt': (_apt_keys, parse_apt_line, 0, None),
+    'AWOS.txt': (_awos_keys, parse_awos_line, 0, None),
+    'NATFIX.txt': (_natfix_keys, parse_natfix_line, 2, b'$'),
+}
+
+def index_path(path):
+    return path + INDEX_SUFFIX
+
+def _source(path):
+    stat = os.stat(path)
+    return {'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+def _kind(path, kind):
+    kind = kind or os.path.basename(path)
+    if kind not in INDEXED_FILES:
+        raise ValueError("Don't know how to index %s" % kind)
+    return kind
+
+def build_index(path, kind=None):
+    """Scan a file and write its identifier index next to it, returning the index data.
+    kind is one of the INDEXED_FILES names and defaults to the file's name."""
+    kind = _kind(path, kind)
+    keys, _, preamble, terminator = INDEXED_FILES[kind]
+    fields = {}
+    offset = 0
+    with open(path, 'rb') as fp:
+        for number, line in enumerate(fp):
+            if number >= preamble:
+                if terminator is not None and line.startswith(terminator):
+                    break
+                for field, value in keys(line):
+                    value = value.strip().decode('latin-1')
+                    if value:
+                        fields.setdefault(field, {}).setdefault(value, []).append(offset)
+            offset += len(line)
+    data = {'version': INDEX_VERSION, 'kind': kind, 'layouts': layout_fingerprint(), 'source': _source(path), 'fields': fields}
+    temporary = index_path(path) + '.%d.tmp' % os.getpid()
+    with open(temporary, 'wb') as out:
+        marshal.dump(data, out)
+    os.replace(temporary, index_path(path))
+    return data
+
+class FileIndex(object):
+    """The identifier index of one APT.txt, AWOS.txt or NATFIX.txt file. The saved index is used if it
+    matches the file's size and mtime and the current layouts; otherwise it is rebuilt first."""
+
+    def __init__(self, path, kind=None):
+        self.path = path
+        self.kind = _kind(path, kind)
+        data = None
+        try:
+            with open(index_path(path), 'rb') as fp:
+                data = marshal.load(fp)
+        except (IOError, EOFError, ValueError, TypeError):
+            pass
+        if not (isinstance(data, dict) and data.get('version') == INDEX_VERSION and data.get('kind') == self.kind and
+                data.get('layouts') == layout_fingerprint() and data.get('source') == _source(path)):
+            data = build_index(path, self.kind)
+        self.fields = data['fields']
+        self._parse = INDEXED_FILES[self.kind][1]
+        self._fp = open(path, 'rb')
+
+    def close(self):
+        self._fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def offsets(self, field, value):
+        "Byte offsets of the lines with that value of field, in file order"
+        return self.fields.get(field, {}).get(value, [])
+
+    def _read(self, offset):
+        self._fp.seek(offset)
+        return self._fp.readline()
+
+    def records(self, field, value, lazy=False):
+        """Parse the lines with that value of field. For APT.txt, looking up a facility_site_number
+        returns the APT line and all of its child lines."""
+        return [self._parse(self._read(offset), lazy) for offset in self.offsets(field, value)]
+
+    def facility(self, identifier):
+        """The APT.txt facility with that location identifier, ICAO identifier or site number, grouped
+        like apt.iter_apt_facilities, or None if there isn't one."""
+        if self.kind != 'APT.txt':
+            raise ValueError("Facilities are only in APT.txt")
+        for field in ('location_identifier', 'icao_identifier', 'facility_site_number'):
+            for offset in self.offsets(field, identifier):
+                line = self._read(offset)
+                if line[:3] == b'APT':
+                    site = line[_APT_SITE].strip().decode('latin-1')
+                    records = self.records('facility_site_number', site)
+                    facility = [r for r in records if r['record_type'] == 'APT'][0]
+                    for key in FACILITY_CHILDREN.values():
+                        facility[key] = []
+                    for record in records:
+                        if record['record_type'] != 'APT':
+                            facility[FACILITY_CHILDREN[record['record_type']]].append(record)
+                    return facility
+        return None
+
+import unittest
+import shutil
+import tempfile
+class IndexTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions import APT_RECORDS, RWY_RECORDS, RMK_RECORDS, AWOS_RECORDS
+        from faddsdata.natfix import NATFIX_RECORDS
+        self.directory = tempfile.mkdtemp()
+        self.apt = os.path.join(self.directory, 'APT.txt')
+        with open(self.apt, 'w', encoding='latin-1') as fp:
+            for i, identifier in enumerate(('LWC', 'MCI', 'OJC')):
+                site = '%05d.*A' % i
+                fp.write(format_line({'record_type': 'APT', 'facility_site_number': site, 'location_identifier': identifier,
+                                      'icao_identifier': 'K' + identifier, 'point_latitude_formatted': '39-00-40.0000N',
+                                      'point_longitude_formatted': '095-12-59.3000W', 'control_tower': 'N'}, APT_RECORDS) + '\n')
+                fp.write(format_line({'record_type': 'RWY', 'facility_site_number': site, 'runway_identification': '01/19'}, RWY_RECORDS) + '\n')
+                fp.write(format_line({'record_type': 'RMK', 'facility_site_number': site, 'element_text': identifier}, RMK_RECORDS) + '\n')
+        self.natfix = os.path.join(self.directory, 'NATFIX.txt')
+        with open(self.natfix, 'w', encoding='latin-1') as fp:
+            fp.write("NATFIX\n'20101118\n")
+            fp.write(format_line({"id": "SUNOL", "latitude_string": "373620N", "longitude_string": "1214837W"}, NATFIX_RECORDS) + '\n$\n')
+        self.awos = os.path.join(self.directory, 'AWOS.txt')
+        with open(self.awos, 'w', encoding='latin-1') as fp:
+            fp.write(format_line({'record_type': 'AWOS1', 'id': 'LWC', 'latitude': '39-00-40.000N', 'longitude': '095-12-59.300W'}, AWOS_RECORDS) + '\n')
+            fp.write(format_line({'record_type': 'AWOS2', 'id': 'LWC', 'latitude': 'REMARK'}, AWOS_RECORDS) + '\n')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_apt(self):
+        with FileIndex(self.apt) as index:
+            self.assertTrue(os.path.exists(self.apt + INDEX_SUFFIX))
+            facility = index.facility('MCI')
+            self.assertEqual('00001.*A', facility['facility_site_number'])
+            self.assertEqual(['01/19'], [r['runway_identification'] for r in facility['runways']])
+            self.assertEqual('MCI', facility['remarks'][0]['element_text'])
+            self.assertEqual(facility, index.facility('KMCI'))
+            self.assertEqual(None, index.facility('XXX'))
+            self.assertEqual(['APT', 'RWY', 'RMK'], [r['record_type'] for r in index.records('facility_site_number', '00002.*A')])
+
+    def test_natfix_and_awos(self):
+        with FileIndex(self.natfix) as index:
+            self.assertAlmostEqual(37.605555555, index.records('id', 'SUNOL')[0]['lat'])
+        with FileIndex(self.awos) as index:
+            self.assertEqual(['AWOS1', 'AWOS2'], [r['record_type'] for r in index.records('id', 'LWC', lazy=True)])
+
+    def test_stale(self):
+        FileIndex(self.natfix).close()
+        with open(self.natfix, 'a') as fp:
+            fp.write('\n')
+        os.utime(self.natfix, ns=(0, 0))
+        with FileIndex(self.natfix) as index:
+            self.assertEqual(1, len(index.records('id', 'SUNOL')))
+        with open(self.natfix + INDEX_SUFFIX, 'rb') as fp:
+            self.assertEqual(0, marshal.load(fp)['source']['mtime_ns'])
@@ -0,0 +1,162 @@
+"""Optional counters for the parsers.
+
+Nothing is measured until an observer is added: a function called with a ParseEvent for every
+line parsed and every block of lines read from a file. ParseStats is an observer that totals the
+events by file and record type:
+
+    with instrumented() as stats:
+        for record in iter_apt(open_file('APT.txt')):
+            pass
+    print(stats)
+
+The file readers (iter_apt and friends) check for observers once, when they start, so without
+any they run the bare parsers. Events come from the process doing the parsing, so the worker
+processes of iter_parallel aren't seen."""
+
+import functools
+import time
+from collections import namedtuple
+
+# stage is 'parse' for a line handed to a parser, or 'read' for a block of lines read from the file
+# (record_type is None then). error is the exception a parser raised, or None.
+ParseEvent = namedtuple('ParseEvent', 'source record_type stage size seconds error')
+
+_observers = []
+
+def add_observer(callback):
+    "Start calling callback with a ParseEvent for each line parsed and block read"
+    _observers.append(callback)
+
+def remove_observer(callback):
+    _observers.remove(callback)
+
+def enabled():
+    return bool(_observers)
+
+def notify(event):
+    for callback in _observers:
+        callback(event)
+
+def instrument(source, record_type=None):
+    """Decorator reporting each call of a line parser to the observers. record_type is the record
+    type of every line, or a function that works it out from the line. Without observers the
+    parser is called straight through."""
+    def decorate(parse):
+        @functools.wraps(parse)
+        def wrapper(line, *args, **kwargs):
+            if not _observers:
+                return parse(line, *args, **kwargs)
+            kind = record_type(line) if callable(record_type) else record_type
+            start = time.perf_counter()
+            try:
+                result = parse(line, *args, **kwargs)
+            except Exception as e:
+                notify(ParseEvent(source, kind, 'parse', len(line), time.perf_counter() - start, e))
+                raise
+            notify(ParseEvent(source, kind, 'parse', len(line), time.perf_counter() - start, None))
+            return result
+        return wrapper
+    return decorate
+
+def for_stream(parse):
+    """The parser to use for a whole file: the instrumented one if anything is observing when the file
+    is started, or else the bare parser, so streams pay nothing per line for the check"""
+    return parse if _observers else parse.__wrapped__
+
+class ParseStats(object):
+    """Counts, size, cumulative seconds and errors per file, stage and record type, built up from
+    ParseEvents. Add one with add_observer, or use the instrumented() context manager."""
+
+    def __init__(self):
+        # (source, stage, record_type) -> [count, size, seconds, errors]
+        self.totals = {}
+
+    def __call__(self, event):
+        key = (event.source, event.stage, event.record_type)
+        totals = self.totals.get(key)
+        if totals is None:
+            totals = self.totals[key] = [0, 0, 0.0, 0]
+        totals[0] += 1
+        totals[1] += event.size
+        totals[2] += event.seconds
+        if event.error is not None:
+            totals[3] += 1
+
+    def rows(self):
+        "A dict for each (source, stage, record_type), sorted, with its count, size, seconds and errors"
+        for (source, stage, record_type), (count, size, seconds, errors) in sorted(self.totals.items(), key=lambda item: tuple(str(part) for part in item[0])):
+            yield {'source': source, 'stage': stage, 'record_type': record_type,
+                   'count': count, 'size': size, 'seconds': seconds, 'errors': errors}
+
+    def _group(self, key):
+        groups = {}
+        for row in self.rows():
+            group = groups.setdefault(row[key], {'count': 0, 'size': 0, 'seconds': 0.0, 'errors': 0})
+            for name in group:
+                group[name] += row[name]
+        return groups
+
+    def by_record_type(self):
+        "Parsing totals (counts, size, seconds and errors) by record type"
+        return dict((record_type, totals) for record_type, totals in self._group('record_type').items() if record_type is not None)
+
+    def by_source(self):
+        "Totals by file, reading and parsing together"
+        return self._group('source')
+
+    def clear(self):
+        self.totals.clear()
+
+    def __str__(self):
+        lines = ["%-12s %-6s %-8s %10s %12s %10s %8s" % ("file", "stage", "type", "count", "size", "seconds", "errors")]
+        for row in self.rows():
+            lines.append("%-12s %-6s %-8s %10d %12d %10.3f %8d" % (row['source'] or '', row['stage'], row['record_type'] or '',
+                                                                  row['count'], row['size'], row['seconds'], row['errors']))
+        return '\n'.join(lines)
+
+class instrumented(object):
+    "Context manager that observes parsing with a ParseStats (or the given callback) for the duration of the block"
+
+    def __init__(self, callback=None):
+        self.callback = callback if callback is not None else ParseStats()
+
+    def __enter__(self):
+        add_observer(self.callback)
+        return self.callback
+
+    def __exit__(self, *exc_info):
+        remove_observer(self.callback)
+
+import unittest
+
+class InstrumentTests(unittest.TestCase):
+    def test_disabled(self):
+        calls = []
+        parse = instrument('TEST.txt', 'T')(lambda line: calls.append(line) or line.upper())
+        self.assertEqual(False, enabled())
+        self.assertEqual('AB', parse('ab'))
+        self.assertEqual(['ab'], calls)
+        self.assertEqual('<lambda>', for_stream(parse).__name__)
+        self.assertTrue(for_stream(parse) is parse.__wrapped__)
+
+    def test_stats(self):
+        def parse(line):
+            if line == 'bad':
+                raise ValueError(line)
+            return line
+        parse = instrument('TEST.txt', lambda line: line[:1].upper())(parse)
+        events = []
+        with instrumented() as stats:
+            with instrumented(events.append):
+                parse('abc')
+                parse('abcd')
+                self.assertRaises(ValueError, parse, 'bad')
+            parse('x')
+        parse('not counted')
+        self.assertEqual(False, enabled())
+        self.assertEqual(3, len(events))
+        self.assertTrue(isinstance(events[2].error, ValueError))
+        self.assertEqual({'count': 2, 'size': 7, 'errors': 0}, dict((k, v) for k, v in stats.by_record_type()['A'].items() if k != 'seconds'))
+        self.assertEqual(1, stats.by_record_type()['B']['errors'])
+        self.assertEqual(4, stats.by_source()['TEST.txt']['count'])
+        self.assertTrue(str(stats).splitlines()[1].startswith('TEST.txt'))
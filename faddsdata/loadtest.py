@@ -0,0 +1,209 @@
+"""Load test for faddsdata.server on localhost.
+
+A number of kept-alive connections send a mix of airport, runway and remark lookups, nearest
+airport queries and searches for a fixed time, and the throughput and latency percentiles are
+reported. The airports asked for are found first with /nearest queries, so any cycle works.
+
+    python -m faddsdata.loadtest --port 8080 --connections 32 --duration 10
+
+With --synthetic SCALE a synthetic cycle (see faddsdata.synthetic) is written to a temporary
+directory and served by a server started just for the test."""
+
+import asyncio
+import json
+import random
+import subprocess
+import sys
+import time
+
+from faddsdata.server import MAX_RESULTS
+
+# (weight, kind) of each request in the mix
+MIX = ((40, 'airport'), (15, 'runways'), (10, 'remarks'), (20, 'nearest'), (15, 'search'))
+
+async def _open(host, port, unix):
+    if unix:
+        return await asyncio.open_unix_connection(unix)
+    return await asyncio.open_connection(host, port)
+
+async def request(reader, writer, target):
+    "GET target on an open connection, returning (status, body bytes)"
+    writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % target).encode('latin-1'))
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+    return status, await reader.readexactly(length)
+
+def _random_point(generator):
+    # somewhere over the lower 48
+    return generator.uniform(25, 49), generator.uniform(-125, -67)
+
+async def discover(host, port, unix, points=20, seed=0):
+    "Identifiers of airports served, found with /nearest queries around random points"
+    generator = random.Random(seed)
+    reader, writer = await _open(host, port, unix)
+    identifiers = set()
+    try:
+        for _ in range(points):
+            status, body = await request(reader, writer, '/nearest?lat=%.4f&lon=%.4f&k=%d' % (_random_point(generator) + (MAX_RESULTS,)))
+            if status == 200:
+                for result in json.loads(body):
+                    identifiers.add(result['airport']['location_identifier'] or result['airport']['facility_site_number'])
+    finally:
+        writer.close()
+    return sorted(identifiers)
+
+def _target(generator, kinds, identifiers):
+    kind = generator.choice(kinds)
+    identifier = generator.choice(identifiers)
+    if kind == 'airport':
+        return kind, '/airports/%s' % identifier
+    if kind in ('runways', 'remarks'):
+        return kind, '/airports/%s/%s' % (identifier, kind)
+    if kind == 'nearest':
+        return kind, '/nearest?lat=%.4f&lon=%.4f&k=5' % _random_point(generator)
+    return kind, '/search?q=%s' % identifier[:generator.randint(1, len(identifier))]
+
+async def _connection(host, port, unix, identifiers, deadline, seed, latencies, errors):
+    generator = random.Random(seed)
+    kinds = [kind for weight, kind in MIX for _ in range(weight)]
+    reader, writer = await _open(host, port, unix)
+    try:
+        while time.perf_counter() < deadline:
+            kind, target = _target(generator, kinds, identifiers)
+            start = time.perf_counter()
+            status, _ = await request(reader, writer, target)
+            latencies.setdefault(kind, []).append(time.perf_counter() - start)
+            if status != 200:
+                errors[kind] = errors.get(kind, 0) + 1
+    finally:
+        writer.close()
+
+def percentile(values, fraction):
+    "The value below which the given fraction of the sorted values fall"
+    return values[min(len(values) - 1, int(fraction * len(values)))]
+
+async def run(host='127.0.0.1', port=8080, unix=None, connections=16, duration=10.0, seed=0):
+    """Run the load test, returning a dict of the request count, errors, requests per second and
+    latency percentiles in milliseconds, overall and by kind of request"""
+    identifiers = await discover(host, port, unix, seed=seed)
+    if not identifiers:
+        raise ValueError("The server didn't return any airports")
+    latencies = {}
+    errors = {}
+    start = time.perf_counter()
+    deadline = start + duration
+    await asyncio.gather(*[_connection(host, port, unix, identifiers, deadline, seed + 1 + i, latencies, errors) for i in range(connections)])
+    elapsed = time.perf_counter() - start
+
+    def summary(values, failed):
+        values = sorted(values)
+        return {'requests': len(values), 'errors': failed, 'p50_ms': percentile(values, 0.5) * 1000,
+                'p90_ms': percentile(values, 0.9) * 1000, 'p99_ms': percentile(values, 0.99) * 1000, 'max_ms': values[-1] * 1000}
+    everything = [value for values in latencies.values() for value in values]
+    result = summary(everything, sum(errors.values()))
+    result['requests_per_second'] = len(everything) / elapsed
+    result['connections'] = connections
+    result['kinds'] = dict((kind, summary(values, errors.get(kind, 0))) for kind, values in latencies.items())
+    return result
+
+def print_result(result):
+    print("%d requests on %d connections, %.0f/s, %d errors" % (result['requests'], result['connections'], result['requests_per_second'], result['errors']))
+    print("%-10s %10s %8s %8s %8s %8s %8s" % ("request", "count", "errors", "p50 ms", "p90 ms", "p99 ms", "max ms"))
+    for kind, row in sorted(result['kinds'].items()) + [('all', result)]:
+        print("%-10s %10d %8d %8.2f %8.2f %8.2f %8.2f" % (kind, row['requests'], row['errors'], row['p50_ms'], row['p90_ms'], row['p99_ms'], row['max_ms']))
+
+def _serve(directory, host, port, unix=None):
+    # start a server in its own process, listening where the clients will connect, and wait until it answers
+    command = [sys.executable, '-m', 'faddsdata.server', directory, '--poll', '0']
+    command.extend(['--unix', unix] if unix else ['--host', host, '--port', str(port)])
+    process = subprocess.Popen(command)
+    for _ in range(600):
+        try:
+            async def status():
+                reader, writer = await _open(host, port, unix)
+                try:
+                    return await request(reader, writer, '/status')
+                finally:
+                    writer.close()
+            asyncio.run(status())
+            return process
+        except OSError:
+            if process.poll() is not None:
+                raise RuntimeError("The server exited with code %s" % process.returncode)
+            time.sleep(0.1)
+    process.terminate()
+    raise RuntimeError("The server didn't start")
+
+def main(argv=None):
+    import argparse
+    import shutil
+    import tempfile
+    parser = argparse.ArgumentParser(description="Load test faddsdata.server on localhost")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', help="connect to this Unix socket instead (and serve on it with --serve or --synthetic)")
+    parser.add_argument('--connections', type=int, default=16)
+    parser.add_argument('--duration', type=float, default=10.0, help="seconds to run for")
+    parser.add_argument('--serve', help="start a server on this cycle directory for the test")
+    parser.add_argument('--synthetic', type=float, help="start a server on a synthetic cycle of this scale for the test")
+    parser.add_argument('--json', help="write the results to this file, - for stdout")
+    args = parser.parse_args(argv)
+    directory = process = None
+    try:
+        if args.synthetic:
+            from faddsdata.synthetic import write_cycle
+            directory = tempfile.mkdtemp()
+            write_cycle(directory, args.synthetic)
+            args.serve = directory
+        if args.serve:
+            process = _serve(args.serve, args.host, args.port, args.unix)
+        result = asyncio.run(run(args.host, args.port, args.unix, args.connections, args.duration))
+    finally:
+        if process is not None:
+            process.terminate()
+            process.wait()
+        if directory is not None:
+            shutil.rmtree(directory)
+    if args.json == '-':
+        json.dump(result, sys.stdout, indent=2)
+    else:
+        print_result(result)
+        if args.json:
+            with open(args.json, 'w') as fp:
+                json.dump(result, fp, indent=2)
+    return 1 if result['errors'] else 0
+
+if __name__ == '__main__':
+    sys.exit(main())
+
+import unittest
+import shutil
+import tempfile
+
+class LoadTestTests(unittest.TestCase):
+    def test_run(self):
+        from faddsdata.server import QueryServer
+        from faddsdata.synthetic import write_cycle
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_cycle(directory, 0.002)
+        async def test():
+            server = QueryServer(directory, poll_interval=0)
+            listening = await server.start(port=0)
+            try:
+                return await run(port=listening.sockets[0].getsockname()[1], connections=3, duration=0.3), server.requests
+            finally:
+                await server.close()
+        result, served = asyncio.run(test())
+        self.assertEqual(0, result['errors'])
+        self.assertTrue(result['requests'] > 0)
+        # the /nearest queries finding the airports come first
+        self.assertEqual(result['requests'] + 20, served)
+        self.assertEqual(set(kind for _, kind in MIX), set(result['kinds']))
+        self.assertTrue(result['p50_ms'] <= result['p99_ms'] <= result['max_ms'])
@@ -1,6 +1,8 @@
 # Handle data from NATFIX.txt
 
-from faddsdata.parse import parse_line, convert_dms_to_float
+from faddsdata.instrument import instrument, for_stream
+from faddsdata.format_definitions import register_format
+from faddsdata.parse import LineFilter, compile_layout, convert_dms_to_float, iter_lines, add_derived_fields, intern_fields, open_file
 
 # NATFIX is defined with many 1 column wide blank separator. We roll them in to a data field and rely on strip() to clean it up
 NATFIX_RECORDS = ((None, 2),
@@ -13,29 +15,92 @@ NATFIX_RECORDS = ((None, 2),
                   ("icao_code", 3),
                   ("fix_navaid_type", 7))
 
-def parse_natfix_line(line):
-    r = parse_line(line[:-1], NATFIX_RECORDS)
-    # add in lat/lon converted to a simple float
-    r['lat'] = convert_dms_to_float(r['latitude_string'])
-    r['lon'] = convert_dms_to_float(r['longitude_string'])
+NATFIX_LAYOUT = compile_layout(NATFIX_RECORDS)
+
+# add in lat/lon converted to a simple float
+NATFIX_DERIVED_FIELDS = (('lat', 'latitude_string', convert_dms_to_float, None),
+                         ('lon', 'longitude_string', convert_dms_to_float, None))
+
+# Fields with only a handful of distinct values, shared between records with interned=True
+NATFIX_INTERNED = ('artcc_id', 'state_code', 'icao_code', 'fix_navaid_type')
+
+NatfixRecord = NATFIX_LAYOUT.record_class(NATFIX_DERIVED_FIELDS, 'NatfixRecord')
+
+_interned = {}
+
+def natfix_interned_fields(interned):
+    "The fields to intern: NATFIX_INTERNED if interned is True, or else those of the given names (a tuple) that NATFIX has"
+    try:
+        return _interned[interned]
+    except KeyError:
+        names = _interned[interned] = NATFIX_INTERNED if interned is True else tuple(name for name in interned if name in NATFIX_LAYOUT.names)
+        return names
+
+_record_classes = {}
+
+def natfix_record_class(interned=()):
+    "The LazyRecord class for NATFIX records, interning the given fields"
+    if not interned:
+        return NatfixRecord
+    try:
+        return _record_classes[interned]
+    except KeyError:
+        record_class = _record_classes[interned] = NATFIX_LAYOUT.record_class(NATFIX_DERIVED_FIELDS, 'NatfixRecord', interned=interned)
+        return record_class
+
+_projections = {}
+
+@instrument('NATFIX.txt', 'NATFIX')
+def parse_natfix_line(line, lazy=False, fields=None, typed=False, interned=False):
+    """Parse a single line of NATFIX.txt (see apt.parse_apt_line for the options). NATFIX has no typed
+    fields beyond its coordinates, which are always converted, so typed is only there to match the other parsers.
+    interned shares the strings of NATFIX_INTERNED (or of a list of field names) between records."""
+    if interned:
+        interned = natfix_interned_fields(True if interned is True else tuple(interned))
+    if lazy:
+        if fields is not None:
+            raise ValueError("fields can't be combined with lazy records")
+        return natfix_record_class(interned)(line[:-1])
+    if fields is not None:
+        fields = tuple(fields)
+        projection = _projections.get(fields)
+        if projection is None:
+            projection = _projections[fields] = NATFIX_LAYOUT.project(fields, NATFIX_DERIVED_FIELDS)
+        r = projection.parse(line[:-1])
+    else:
+        r = add_derived_fields(NATFIX_LAYOUT.parse(line[:-1]), NATFIX_DERIVED_FIELDS)
+    if interned:
+        intern_fields(r, interned)
     return r
 
-def parse_natfix_file(fp):
+def iter_natfix(fp, lazy=False, fields=None, where=None, typed=False, interned=False):
+    """Parse an open NATFIX file one record at a time; the file may be opened in text or binary mode.
+    where is a dict of parse.LineFilter conditions, or a function of the raw line, and lines that
+    don't match aren't parsed."""
+    if interned and interned is not True:
+        interned = tuple(interned)
+    if isinstance(where, dict):
+        where = LineFilter(NATFIX_LAYOUT, where)
     # Skip the preamble two lines
-    assert fp.readline().strip() == "NATFIX"
+    assert fp.readline().strip() in ("NATFIX", b"NATFIX")
     fp.readline()
-    r = []
-    for line in fp:
+    parse = for_stream(parse_natfix_line)
+    for line in iter_lines(fp, source='NATFIX.txt'):
         # $ indicates end of file
-        if line[0] == '$':
+        if line[:1] in ('$', b'$'):
             break
-        # XXX(nelson): should probably use an iterator or do useful work instead of making a giant list
-        r.append(parse_natfix_line(line))
-    return r
+        if where is None or where(line):
+            yield parse(line, lazy, fields, typed, interned)
+
+def parse_natfix_file(fp):
+    return list(iter_natfix(fp))
+
+# the file starts with a two line preamble and ends with a $ line
+register_format('NATFIX.txt', NATFIX_RECORDS, NATFIX_DERIVED_FIELDS, {}, NATFIX_INTERNED, reader=iter_natfix, skip=2, end='$')
 
 if __name__ == '__main__':
     path = '/Users/nelson/Downloads/56DySubscription_November_18__2010_-_January_13__2011/'
-    raw = open(path + 'NATFIX.txt')
+    raw = open_file(path + 'NATFIX.txt')
     natfixes = parse_natfix_file(raw)
     print("%d records found in NATFIX.txt" % len(natfixes))
         
@@ -69,5 +134,50 @@ $
         natfixes = parse_natfix_file(test_file)
         self.assertEqual(2, len(natfixes))
         self.assertEqual('ZDC', natfixes[0]["artcc_id"])
+
+    def test_iter_natfix(self):
+        from io import StringIO
+        from faddsdata.parse import format_line
+        lines = ["NATFIX", "'20101118"]
+        lines.append(format_line({"id": "00A", "latitude_string": "400415N", "longitude_string": "0745601W", "artcc_id": "'ZDC"}, NATFIX_RECORDS))
+        lines.append(format_line({"id": "00AK", "latitude_string": "595122N", "longitude_string": "1514147W", "artcc_id": "'ZAN"}, NATFIX_RECORDS))
+        lines.append("$")
+        lines.append(format_line({"id": "AFTER"}, NATFIX_RECORDS))
+        natfixes = iter_natfix(StringIO("\n".join(lines) + "\n"))
+        self.assertEqual("00A", next(natfixes)["id"])
+        self.assertAlmostEqual(-151.6963888888, next(natfixes)["lon"])
+        self.assertRaises(StopIteration, next, natfixes)
+        natfixes = list(iter_natfix(StringIO("\n".join(lines) + "\n"), where={"artcc_id": ("'ZAN", "'ZSE")}))
+        self.assertEqual(["00AK"], [natfix["id"] for natfix in natfixes])
+
+    def test_lazy(self):
+        from faddsdata.parse import format_line
+        line = format_line({"id": "00A", "latitude_string": "400415N", "longitude_string": "0745601W", "artcc_id": "'ZDC"}, NATFIX_RECORDS) + "\n"
+        self.assertEqual(parse_natfix_line(line), parse_natfix_line(line, lazy=True).as_dict())
+        self.assertEqual(parse_natfix_line(line), parse_natfix_line(line.encode('latin-1')))
+        self.assertEqual(parse_natfix_line(line), parse_natfix_line(line.encode('latin-1'), lazy=True).as_dict())
+
+    def test_fields(self):
+        from faddsdata.parse import format_line
+        line = format_line({"id": "00A", "latitude_string": "400415N", "longitude_string": "0745601W", "artcc_id": "'ZDC"}, NATFIX_RECORDS) + "\n"
+        natfix = parse_natfix_line(line, fields=["id", "lat"])
+        self.assertEqual(["id", "lat"], sorted(natfix))
+        self.assertAlmostEqual(40.07083333, natfix["lat"])
+        self.assertRaises(KeyError, parse_natfix_line, line, fields=["latitude"])
+
+    def test_interned(self):
+        from faddsdata.parse import format_line
+        lines = [format_line({"id": id, "latitude_string": "400415N", "longitude_string": "0745601W", "artcc_id": "'ZDC", "state_code": "PA"}, NATFIX_RECORDS) + "\n"
+                 for id in ("00A", "00B")]
+        for lazy in (False, True):
+            first, second = [parse_natfix_line(line, lazy, interned=True) for line in lines]
+            self.assertEqual(parse_natfix_line(lines[0], lazy), first)
+            self.assertTrue(first["artcc_id"] is second["artcc_id"])
+            self.assertTrue(first["state_code"] is second["state_code"])
+            # a list of field names interns only those, as for APT and AWOS
+            first, second = [parse_natfix_line(line, lazy, interned=["state_code", "not_a_field"]) for line in lines]
+            self.assertEqual(parse_natfix_line(lines[0], lazy), first)
+            self.assertTrue(first["state_code"] is second["state_code"])
+            self.assertFalse(first["artcc_id"] is second["artcc_id"])
         
         
\ No newline at end of file
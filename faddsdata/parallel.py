@@ -0,0 +1,98 @@
+"Parse large FADDS files on several cores by splitting them into byte ranges"
+
+import collections
+import multiprocessing
+import os
+
+# Each worker task covers about this many bytes of the file
+CHUNK_SIZE = 8 * 1024 * 1024
+
+def split_file(path, chunk_size=CHUNK_SIZE):
+    """Split a file into (start, end) byte ranges of roughly chunk_size bytes.
+    Every range starts at the beginning of a line and ends just after a newline (or at end of file)."""
+    size = os.path.getsize(path)
+    boundaries = [0]
+    with open(path, 'rb') as fp:
+        position = chunk_size
+        while position < size:
+            # Reading the rest of the line that contains position - 1 leaves us at the start
+            # of the first line beginning at or after position
+            fp.seek(position - 1)
+            fp.readline()
+            boundary = fp.tell()
+            if boundary >= size:
+                break
+            boundaries.append(boundary)
+            position = boundary + chunk_size
+    boundaries.append(size)
+    return list(zip(boundaries[:-1], boundaries[1:]))
+
+def read_range(path, start, end, encoding='latin-1'):
+    "Return the lines in a byte range of a file, each with its trailing newline"
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        data = fp.read(end - start).decode(encoding)
+    # split on \n only; str.splitlines() would also break on characters like \x85
+    lines = data.split('\n')
+    last = lines.pop()
+    lines = [line + '\n' for line in lines]
+    if last:
+        lines.append(last)
+    return lines
+
+def _parse_range(parse, path, start, end, encoding):
+    return [parse(line) for line in read_range(path, start, end, encoding)]
+
+def iter_parallel_batches(path, parse, workers=None, chunk_size=CHUNK_SIZE, encoding='latin-1'):
+    """Parse every line of a file with parse() in a pool of worker processes, yielding one
+    list of records per byte range in file order. parse must be a module level function so it can be
+    sent to the workers. Only a few ranges per worker are in flight at once, so memory stays bounded."""
+    ranges = split_file(path, chunk_size)
+    pool = multiprocessing.Pool(workers)
+    try:
+        window = 2 * (workers or os.cpu_count() or 1)
+        pending = collections.deque()
+        for start, end in ranges:
+            pending.append(pool.apply_async(_parse_range, (parse, path, start, end, encoding)))
+            if len(pending) >= window:
+                yield pending.popleft().get()
+        while pending:
+            yield pending.popleft().get()
+    finally:
+        pool.terminate()
+        pool.join()
+
+def iter_parallel(path, parse, workers=None, chunk_size=CHUNK_SIZE, encoding='latin-1'):
+    "Like iter_parallel_batches, but yield the records one at a time"
+    for batch in iter_parallel_batches(path, parse, workers, chunk_size, encoding):
+        for record in batch:
+            yield record
+
+import unittest
+import shutil
+import tempfile
+class ParallelTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.path = os.path.join(self.directory, 'lines.txt')
+        with open(self.path, 'wb') as fp:
+            fp.write(b''.join(b'line %04d \xd1\n' % i for i in range(500)))
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def test_split_file(self):
+        ranges = split_file(self.path, chunk_size=100)
+        self.assertEqual(0, ranges[0][0])
+        self.assertEqual(os.path.getsize(self.path), ranges[-1][1])
+        lines = []
+        for start, end in ranges:
+            self.assertTrue(end > start)
+            lines.extend(read_range(self.path, start, end))
+        with open(self.path, encoding='latin-1') as fp:
+            self.assertEqual(fp.readlines(), lines)
+
+    def test_iter_parallel(self):
+        records = list(iter_parallel(self.path, str.upper, workers=2, chunk_size=64))
+        with open(self.path, encoding='latin-1') as fp:
+            self.assertEqual([line.upper() for line in fp], records)
@@ -4,36 +4,341 @@
 "Utility functions for parsing FADDS fixed width data"
 
 import datetime
+import operator
+import sys
+import time
+from collections.abc import Mapping
+
+from faddsdata import instrument
+
+# How much to read from a file at a time when streaming records
+READ_BUFFER_SIZE = 1024 * 1024
 
 class ParseException(Exception): pass
 
+def clean_field(value):
+    "Strip a raw field and remove or replace the stray non-ASCII characters found in FADDS data"
+    return value.strip().replace('\xfa', '').replace('\xd1', 'N').replace('\xbf', '').replace('\xb4', '').replace('\xb0', '')
+
+# clean_field's replacements as a single bytes.translate call: \xd1 becomes N and the rest are deleted
+CLEANUP_TABLE = bytes.maketrans(b'\xd1', b'N')
+CLEANUP_DELETE = b'\xfa\xbf\xb4\xb0'
+# Everything str.strip() removes from latin-1 text (bytes.strip() alone misses \x1c-\x1f, \x85 and \xa0)
+LATIN1_WHITESPACE = b'\t\n\x0b\x0c\r\x1c\x1d\x1e\x1f \x85\xa0'
+
+def clean_bytes_field(value):
+    "clean_field for a raw latin-1 field in bytes, returning the same str"
+    return bytes(value).strip(LATIN1_WHITESPACE).translate(CLEANUP_TABLE, CLEANUP_DELETE).decode('latin-1')
+
+def _strip_newline(data):
+    "Drop the line ending from a bytes or memoryview line without copying the rest"
+    end = len(data)
+    while end and data[end - 1] in (10, 13):
+        end -= 1
+    return data[:end]
+
+class Layout(object):
+    """A fixed width definition compiled once for parsing many lines.
+    The field offsets are computed up front and the named slices are pulled out of
+    each line with a single itemgetter call, instead of being recalculated per line."""
+
+    def __init__(self, definition):
+        self.definition = definition
+        names = []
+        slices = []
+        start = 0
+        for name, width in definition:
+            if name is not None:
+                names.append(name)
+                slices.append(slice(start, start + width))
+            start += width
+        self.length = start
+        self.names = tuple(names)
+        self.slices = tuple(slices)
+        if not slices:
+            self._extract = lambda data: ()
+        elif len(slices) == 1:
+            # itemgetter with a single item returns the value rather than a tuple
+            self._extract = lambda data, _s=slices[0]: (data[_s],)
+        else:
+            self._extract = operator.itemgetter(*slices)
+
+    def check_length(self, data):
+        if len(data) != self.length:
+            raise ParseException("Expected length %d, got length %d" % (self.length, len(data)))
+
+    def parse(self, data):
+        "Parse a line into a dictionary of stripped tokens, like parse_line"
+        if not isinstance(data, str):
+            return self.parse_bytes(data)
+        data = data.replace('\r', '').replace('\n', '')
+        if len(data) != self.length:
+            raise ParseException("Expected length %d, got length %d" % (self.length, len(data)))
+        # The cleanup characters are all non-ASCII, so most lines only need strip()
+        if data.isascii():
+            return dict(zip(self.names, map(str.strip, self._extract(data))))
+        return dict(zip(self.names, map(clean_field, self._extract(data))))
+
+    def parse_bytes(self, data):
+        """Parse a latin-1 line given as bytes or a memoryview, returning the same dictionary parse
+        would for the decoded line. ASCII lines are decoded in one go; on anything else only the named
+        fields are decoded, each cleaned with one bytes.translate call."""
+        data = _strip_newline(data)
+        if len(data) != self.length:
+            raise ParseException("Expected length %d, got length %d" % (self.length, len(data)))
+        data = bytes(data)
+        if data.isascii():
+            return dict(zip(self.names, map(str.strip, self._extract(data.decode('ascii')))))
+        return dict(zip(self.names, map(clean_bytes_field, self._extract(data))))
+
+    def project(self, fields, derived=(), strict=True):
+        "A Projection of this layout that only extracts the given fields (see Projection)"
+        return Projection(self, fields, derived, strict)
+
+    def record_class(self, derived=(), name='Record', types=(), interned=()):
+        """Build a LazyRecord subclass for this layout, with the given derived fields (see add_derived_fields).
+        types are (field, converter) pairs from compile_types, applied to those fields as they are read,
+        and the values of the interned fields are shared between records (see intern_fields)."""
+        return type(name, (LazyRecord,), {
+            '__slots__': (),
+            'layout': self,
+            '_slices': dict(zip(self.names, self.slices)),
+            '_derived': dict((entry[0], entry) for entry in derived),
+            '_extra': tuple(entry[0] for entry in derived if entry[0] not in self.names),
+            '_types': dict(types),
+            '_interned': frozenset(interned),
+        })
+
+def intern_fields(record, names):
+    """Replace the values of the named fields of a parsed record with interned strings, so that every
+    record holding the same value shares one string instead of its own copy. Values that have already
+    been converted from strings are left alone."""
+    for name in names:
+        value = record.get(name)
+        if type(value) is str:
+            record[name] = sys.intern(value)
+    return record
+
+def if_present(record, value):
+    "Condition for derived fields that are only added when their source field isn't blank"
+    return bool(value)
+
+def add_derived_fields(record, derived):
+    """Add computed values to a parsed record. derived is a sequence of (key, source field, converter,
+    condition) tuples; the converted source is stored under key unless condition(record, source value)
+    is false. A condition of None always applies. key may be the source field itself to convert in place."""
+    for key, source, convert, condition in derived:
+        value = record[source]
+        if condition is None or condition(record, value):
+            record[key] = convert(value)
+    return record
+
+class Projection(object):
+    """A layout narrowed to a few fields: only their slices are extracted and cleaned, and only the
+    derived fields asked for are computed. Source fields needed just for a derived value are dropped
+    from the result. With strict=False, fields the layout doesn't have are ignored instead of raising KeyError."""
+
+    def __init__(self, layout, fields, derived=(), strict=True):
+        fields = set(fields)
+        self.derived = tuple(entry for entry in derived if entry[0] in fields)
+        needed = set(fields)
+        for _, source, _, condition in self.derived:
+            needed.add(source)
+            needed.update(getattr(condition, 'fields', ()))
+        unknown = fields - set(layout.names) - set(entry[0] for entry in self.derived)
+        if strict and unknown:
+            raise KeyError(', '.join(sorted(unknown)))
+        self.layout = Layout(tuple((name if name in needed else None, width) for name, width in layout.definition))
+        self.extra = tuple(name for name in self.layout.names if name not in fields)
+
+    def parse(self, data):
+        r = add_derived_fields(self.layout.parse(data), self.derived)
+        for name in self.extra:
+            del r[name]
+        return r
+
+class Prefix(object):
+    "A LineFilter condition matching fields that start with the given text"
+    def __init__(self, value):
+        self.value = value
+
+    def __repr__(self):
+        return 'Prefix(%r)' % self.value
+
+def _condition_test(expected, encode):
+    if isinstance(expected, Prefix):
+        start = encode(expected.value)
+        return lambda value: value.startswith(start)
+    if isinstance(expected, (set, frozenset, list, tuple)):
+        choices = frozenset(encode(choice) for choice in expected)
+        return lambda value: value in choices
+    expected = encode(expected)
+    return lambda value: value == expected
+
+class LineFilter(object):
+    """Test raw lines against conditions on a layout's fields without parsing them, so lines that
+    don't match can be skipped cheaply. conditions maps field names to a string (equality), a Prefix,
+    or a set, list or tuple of strings (membership). Values are compared stripped but before the
+    character cleanup parse_line does. Works on str and on latin-1 bytes lines."""
+
+    def __init__(self, layout, conditions):
+        layout = compile_layout(layout)
+        slices = dict(zip(layout.names, layout.slices))
+        unknown = set(conditions) - set(slices)
+        if unknown:
+            raise KeyError(', '.join(sorted(unknown)))
+        self.conditions = dict(conditions)
+        self._str_tests = tuple((slices[name], _condition_test(expected, str)) for name, expected in conditions.items())
+        self._bytes_tests = tuple((slices[name], _condition_test(expected, lambda value: value.encode('latin-1')))
+                                  for name, expected in conditions.items())
+
+    def __call__(self, line):
+        if isinstance(line, str):
+            for where, test in self._str_tests:
+                if not test(line[where].strip()):
+                    return False
+        else:
+            for where, test in self._bytes_tests:
+                if not test(bytes(line[where]).strip(LATIN1_WHITESPACE)):
+                    return False
+        return True
+
+class LazyRecord(Mapping):
+    """A read-only, dict-like record that keeps the raw line and only strips and cleans a field the
+    first time it is read. Subclasses for each layout are built by Layout.record_class."""
+    __slots__ = ('_line', '_cache')
+    layout = None
+    _slices = {}
+    _derived = {}
+    _extra = ()
+    _types = {}
+    _interned = frozenset()
+
+    def __init__(self, line):
+        if isinstance(line, str):
+            line = line.replace('\r', '').replace('\n', '')
+        else:
+            # bytes and memoryviews are decoded one field at a time, as they are read
+            line = _strip_newline(line)
+        self.layout.check_length(line)
+        self._line = line
+        self._cache = None
+
+    def _decode(self, name):
+        entry = self._derived.get(name)
+        if entry is not None:
+            _, source, convert, condition = entry
+            value = self._raw(source)
+            if condition is not None and not condition(self, value):
+                raise KeyError(name)
+            return convert(value)
+        value = self._raw(name)
+        if name in self._interned:
+            value = sys.intern(value)
+        convert = self._types.get(name)
+        if convert is not None:
+            return convert(value)
+        return value
+
+    def _raw(self, name):
+        value = self._line[self._slices[name]]
+        if not isinstance(value, str):
+            return clean_bytes_field(value)
+        value = value.strip()
+        if value.isascii():
+            return value
+        return clean_field(value)
+
+    def __getitem__(self, name):
+        cache = self._cache
+        if cache is None:
+            cache = self._cache = {}
+        elif name in cache:
+            return cache[name]
+        value = cache[name] = self._decode(name)
+        return value
+
+    def __contains__(self, name):
+        if name in self._slices:
+            return True
+        try:
+            self[name]
+        except KeyError:
+            return False
+        return True
+
+    def __iter__(self):
+        for name in self.layout.names:
+            yield name
+        for name in self._extra:
+            if name in self:
+                yield name
+
+    def __len__(self):
+        return sum(1 for _ in self)
+
+    def __repr__(self):
+        return '%s(%r)' % (type(self).__name__, bytes(self._line) if isinstance(self._line, memoryview) else self._line)
+
+    def as_dict(self):
+        "Decode every field into a plain dict, the same one the eager parser returns"
+        return dict(self.items())
+
+_layout_cache = {}
+
+def compile_layout(definition):
+    "Return the compiled Layout for a definition, building it only the first time it is seen"
+    if isinstance(definition, Layout):
+        return definition
+    try:
+        return _layout_cache[definition]
+    except KeyError:
+        layout = _layout_cache[definition] = Layout(definition)
+        return layout
+    except TypeError:
+        # unhashable definitions (lists) can't be cached
+        return Layout(definition)
+
+@instrument.instrument(None)
 def parse_line(data, definition):
     """Parse a line of fixed width text according to a definition, returning a dictionary of stripped tokens
-    Definition is a list of tuples: ("key", width)
+    Definition is a list of tuples: ("key", width), or a compiled Layout
     
     parse_fixed_width_line("abcdefghij", (("first", 2), ("second", 3), (None, 1), ("third", 4)))
     >>> { "first": "ab", "second": "cde", "third": "ghij" }"""
+    return compile_layout(definition).parse(data)
 
-    data = data.replace('\r', '').replace('\n', '')
-    # Calculate the start and end of every field
-    splits = []
-    start = 0
-    end = 0
-    for width in list(zip(*definition))[1]:
-        end += width
-        splits.append((start, end))
-        start += width
-
-    # Check that the input line is exactly the right length, or right length plus a newline
-    if not (len(data) == end):
-        raise ParseException("Expected length %d, got length %d" % (end, len(data)))
-    
-    # Return a dictionary of each extracted field
-    r = {}
-    for (name, _), (start, end) in zip(definition, splits):
-        if name is not None:
-            r[name] = data[start:end].strip().replace('\xfa', '').replace('\xd1', 'N').replace('\xbf', '').replace('\xb4', '').replace('\xb0', '')
-    return r
+def open_file(path, binary=False):
+    "Open a FADDS text file, which is latin-1, either as text or as bytes for the byte-level parsers"
+    if binary:
+        return open(path, 'rb')
+    return open(path, encoding='latin-1')
+
+def iter_lines(fp, buffer_size=READ_BUFFER_SIZE, source=None):
+    """Yield the lines of an open file, reading roughly buffer_size at a time so memory stays constant.
+    source names the file in the 'read' events sent to faddsdata.instrument observers."""
+    while True:
+        if instrument.enabled():
+            start = time.perf_counter()
+            lines = fp.readlines(buffer_size)
+            instrument.notify(instrument.ParseEvent(source, None, 'read', sum(map(len, lines)), time.perf_counter() - start, None))
+        else:
+            lines = fp.readlines(buffer_size)
+        if not lines:
+            return
+        for line in lines:
+            yield line
+
+def format_line(record, definition):
+    """The inverse of parse_line: lay the values of a dictionary out as a fixed width line.
+    Missing and unnamed fields are left blank; values longer than their field raise ParseException."""
+    out = []
+    for name, width in definition:
+        value = record.get(name, '') if name is not None else ''
+        if len(value) > width:
+            raise ParseException("Value %r is wider than %d for %s" % (value, width, name))
+        out.append(value.ljust(width))
+    return ''.join(out)
 
 def convert_dms_to_float(c):
     "Convert a string coordinate like 0844402W or 335303N to a float like 33.8841666"
@@ -71,20 +376,116 @@ def convert_boolean(c):
         return True
     return False
 
+# Dates repeat a lot (every record of a cycle shares its effective date), so conversions are memoized
+_DATE_CACHE_SIZE = 4096
+_date_cache = {}
+
+def _memoized_date(c, fmt, fast):
+    key = (c, fmt)
+    try:
+        return _date_cache[key]
+    except (KeyError, TypeError):
+        pass
+    try:
+        value = fast(c)
+    except (TypeError, ValueError):
+        value = None
+    if value is False:
+        # not in the usual zero padded layout, let strptime have a go
+        try:
+            value = datetime.datetime.strptime(c, fmt).date()
+        except (TypeError, ValueError):
+            value = None
+    try:
+        if len(_date_cache) >= _DATE_CACHE_SIZE:
+            _date_cache.clear()
+        _date_cache[key] = value
+    except TypeError:
+        pass
+    return value
+
+def _fast_month_year(c):
+    if len(c) == 7 and c[2] == '/' and c[:2].isdigit() and c[3:].isdigit():
+        return datetime.date(int(c[3:]), int(c[:2]), 1)
+    return False
+
+def _fast_date(c):
+    if len(c) == 10 and c[2] == '/' and c[5] == '/' and c[:2].isdigit() and c[3:5].isdigit() and c[6:].isdigit():
+        return datetime.date(int(c[6:]), int(c[:2]), int(c[3:5]))
+    return False
+
+def _fast_compact_date(c):
+    if len(c) == 8 and c.isdigit():
+        return datetime.date(int(c[4:]), int(c[:2]), int(c[2:4]))
+    return False
+
 def convert_month_year(c):
     "Convert the MM/YYYY from the FAA into a Python Date object."
-    try:
-        return datetime.datetime.strptime(c, "%m/%Y").date()
-    except:
-        return None
+    return _memoized_date(c, "%m/%Y", _fast_month_year)
 
 def convert_date(c):
     "Convert the MM/DD/YYYY from the FAA into a Python Date object."
+    return _memoized_date(c, "%m/%d/%Y", _fast_date)
+
+def convert_compact_date(c):
+    "Convert the MMDDYYYY from the FAA into a Python Date object."
+    return _memoized_date(c, "%m%d%Y", _fast_compact_date)
+
+def convert_int(c):
+    "Convert a numeric field to an int, or None if it is blank or not a number"
     try:
-        return datetime.datetime.strptime(c, "%m/%d/%Y").date()
-    except:
+        return int(c)
+    except ValueError:
         return None
 
+def convert_float(c):
+    "Convert a numeric field to a float, or None if it is blank or not a number"
+    try:
+        return float(c)
+    except ValueError:
+        return None
+
+def convert_yes_no(c):
+    "Convert a Y/N flag to True/False, keeping a blank (unknown) flag as None"
+    if c == 'Y':
+        return True
+    if c == 'N':
+        return False
+    return None
+
+def _optional(convert):
+    def converter(c):
+        if not c:
+            return None
+        try:
+            return convert(c)
+        except (AssertionError, IndexError, ValueError):
+            return None
+    return converter
+
+# The field types that format definitions can declare, and their converters
+CONVERTERS = {
+    'int': convert_int,
+    'float': convert_float,
+    'yes_no': convert_yes_no,
+    'date': convert_date,
+    'month_year': convert_month_year,
+    'compact_date': convert_compact_date,
+    'dms': _optional(convert_dms_to_float),
+    'dashed_dms': _optional(convert_dashed_dms_to_float),
+}
+
+def compile_types(types):
+    "Turn a field type table from the format definitions into (field, converter) pairs for convert_types"
+    return tuple((name, CONVERTERS[kind]) for name, kind in sorted(types.items()))
+
+def convert_types(record, converters):
+    "Convert the fields of a parsed record in place with (field, converter) pairs from compile_types"
+    for name, convert in converters:
+        if name in record:
+            record[name] = convert(record[name])
+    return record
+
 import unittest
 class ParseTests(unittest.TestCase):
     def test_parse_line(self):
@@ -99,7 +500,130 @@ class ParseTests(unittest.TestCase):
         # broken input
         self.assertRaises(ParseException, parse_line, "abc", (("first", 2), ("second", 2)))
         self.assertRaises(ParseException, parse_line, "abcde", (("first", 2), ("second", 2)))
+
+    def test_layout(self):
+        definition = (("first", 2), (None, 1), ("second", 3))
+        layout = compile_layout(definition)
+        self.assertTrue(layout is compile_layout(definition))
+        self.assertEqual(6, layout.length)
+        self.assertEqual({ "first": "ab", "second": "de" }, layout.parse("ab-de \r\n"))
+        self.assertEqual({ "first": "N" }, compile_layout([("first", 3)]).parse(" \xd1\xb0"))
+        self.assertEqual(parse_line("ab-de ", definition), layout.parse("ab-de "))
+
+    def test_lazy_record(self):
+        definition = (("first", 2), (None, 1), ("second", 3), ("coordinate", 7))
+        derived = (("second", "second", int, None), ("lat", "coordinate", convert_dms_to_float, if_present))
+        Record = compile_layout(definition).record_class(derived)
+        record = Record("ab- 42335303N\r\n")
+        self.assertEqual(42, record["second"])
+        self.assertAlmostEqual(33.884166666, record["lat"])
+        self.assertEqual(["first", "second", "coordinate", "lat"], list(record))
+        self.assertEqual(add_derived_fields(parse_line("ab- 42335303N", definition), derived), record.as_dict())
+        self.assertEqual(record.as_dict(), record)
+        blank = Record("\xd1b- 42       ")
+        self.assertEqual("Nb", blank["first"])
+        self.assertFalse("lat" in blank)
+        self.assertRaises(KeyError, lambda: blank["lat"])
+        self.assertEqual(3, len(blank))
+        self.assertRaises(ParseException, Record, "too short")
+        self.assertFalse(hasattr(record, "__dict__"))
+
+    def test_projection(self):
+        definition = (("first", 2), (None, 1), ("second", 3), ("coordinate", 7))
+        derived = (("second", "second", int, None), ("lat", "coordinate", convert_dms_to_float, if_present))
+        layout = compile_layout(definition)
+        self.assertEqual({"first": "ab"}, layout.project(["first"], derived).parse("ab- 42335303N\n"))
+        self.assertEqual({"second": 42}, layout.project(["second"], derived).parse("ab- 42335303N"))
+        lat = layout.project(["lat"], derived).parse("ab- 42335303N")
+        self.assertEqual(["lat"], list(lat))
+        self.assertAlmostEqual(33.884166666, lat["lat"])
+        self.assertEqual({}, layout.project(["lat"], derived).parse("ab- 42       "))
+        self.assertRaises(KeyError, layout.project, ["third"])
+        self.assertEqual({"first": "ab"}, layout.project(["first", "third"], strict=False).parse("ab- 42335303N"))
+        self.assertEqual({}, layout.project(["third"], strict=False).parse("ab- 42335303N"))
+        self.assertRaises(ParseException, layout.project(["first"]).parse, "ab-")
+
+    def test_line_filter(self):
+        definition = (("kind", 3), ("state", 3), ("name", 6))
+        lines = ["RWY KS SALINA", "APT KS WICHIT", "RWY MO JOPLIN", "RWY KSK\xd1SAL"]
+        def matching(**conditions):
+            test = LineFilter(definition, conditions)
+            found = [line for line in lines if test(line)]
+            self.assertEqual(found, [line.decode('latin-1') for line in (l.encode('latin-1') for l in lines) if test(line)])
+            return found
+        self.assertEqual([lines[0], lines[3]], matching(kind="RWY", state="KS"))
+        self.assertEqual([lines[0], lines[1], lines[3]], matching(state=("KS", "NE")))
+        self.assertEqual([lines[3]], matching(name=Prefix("K\xd1")))
+        self.assertEqual(lines, matching())
+        self.assertRaises(KeyError, LineFilter, definition, {"county": "DOUGLAS"})
+
+    def test_bytes(self):
+        definition = (("first", 3), (None, 1), ("second", 4))
+        for line in ("ab -de  ", "\xd1\xfa -\xa0\xb0d\x1c", " a\xfab-  \xbf\r\n"):
+            expected = parse_line(line, definition)
+            data = line.encode('latin-1')
+            self.assertEqual(expected, compile_layout(definition).parse_bytes(data))
+            self.assertEqual(expected, parse_line(memoryview(data), definition))
+            self.assertEqual(expected, compile_layout(definition).record_class()(memoryview(data)).as_dict())
+        self.assertRaises(ParseException, parse_line, b"abc", definition)
+        # every latin-1 character str.strip() removes
+        whitespace = ''.join(chr(c) for c in range(256) if chr(c).isspace()).encode('latin-1')
+        self.assertEqual(whitespace, LATIN1_WHITESPACE)
+
+    def test_format_line(self):
+        definition = (("first", 2), (None, 1), ("second", 3))
+        self.assertEqual("ab de ", format_line({ "first": "ab", "second": "de" }, definition))
+        self.assertEqual({ "first": "ab", "second": "de" }, parse_line(format_line({ "first": "ab", "second": "de" }, definition), definition))
+        self.assertRaises(ParseException, format_line, { "first": "abc" }, definition)
        
+    def test_iter_lines(self):
+        from io import StringIO
+        self.assertEqual(["ab\n", "cd\n", "ef"], list(iter_lines(StringIO("ab\ncd\nef"), buffer_size=1)))
+        self.assertEqual([], list(iter_lines(StringIO(""))))
+
+    def test_convert_date(self):
+        self.assertEqual(datetime.date(2013, 10, 17), convert_date('10/17/2013'))
+        self.assertEqual(datetime.date(2013, 1, 7), convert_date('1/7/2013'))
+        self.assertEqual(None, convert_date('13/17/2013'))
+        self.assertEqual(None, convert_date(''))
+        self.assertEqual(None, convert_date(None))
+        self.assertEqual(datetime.date(1940, 4, 1), convert_month_year('04/1940'))
+        self.assertEqual(None, convert_month_year('00/1940'))
+        self.assertEqual(datetime.date(2013, 5, 24), convert_compact_date('05242013'))
+        for value in ('10/17/2013', '1/7/2013', '02/30/2013', '2013-01-01', ' 10/17/2013', '10/17/13'):
+            try:
+                expected = datetime.datetime.strptime(value, "%m/%d/%Y").date()
+            except ValueError:
+                expected = None
+            self.assertEqual(expected, convert_date(value))
+            self.assertEqual(expected, convert_date(value))
+
+    def test_converters(self):
+        self.assertEqual(833, CONVERTERS['int']('833'))
+        self.assertEqual(None, CONVERTERS['int'](''))
+        self.assertEqual(833.3, CONVERTERS['float']('833.3'))
+        self.assertEqual(None, CONVERTERS['float']('N/A'))
+        self.assertEqual([True, False, None], [CONVERTERS['yes_no'](c) for c in ('Y', 'N', '')])
+        self.assertAlmostEqual(39.01111111, CONVERTERS['dashed_dms']('39-00-40.0000N'))
+        self.assertEqual(None, CONVERTERS['dashed_dms'](''))
+        self.assertAlmostEqual(33.884166666, CONVERTERS['dms']('335303N'))
+        record = {'length': '3901', 'name': 'LAWRENCE'}
+        self.assertEqual({'length': 3901, 'name': 'LAWRENCE'}, convert_types(record, compile_types({'length': 'int', 'width': 'int'})))
+        Record = compile_layout((('name', 8), ('length', 5))).record_class(types=compile_types({'length': 'int'}))
+        self.assertEqual({'name': 'LAWRENCE', 'length': 3901}, Record('LAWRENCE 3901').as_dict())
+
+    def test_intern_fields(self):
+        layout = compile_layout((('state', 6), ('name', 6)))
+        first, second = layout.parse('KANSASTOPEKA'), layout.parse(b'KANSASSALINA')
+        self.assertFalse(first['state'] is second['state'])
+        intern_fields(first, ('state', 'missing'))
+        self.assertEqual({'flag': True}, intern_fields({'flag': True}, ('flag',)))
+        intern_fields(second, ('state',))
+        self.assertTrue(first['state'] is second['state'])
+        self.assertEqual({'state': 'KANSAS', 'name': 'SALINA'}, second)
+        Record = layout.record_class(interned=('state',))
+        self.assertTrue(Record('KANSASTOPEKA')['state'] is first['state'])
+
     def test_convert_dms_to_float(self):
         self.assertAlmostEqual(33.884166666, convert_dms_to_float('335303N'))
         self.assertAlmostEqual(-33.884166666, convert_dms_to_float('335303S'))
@@ -0,0 +1,183 @@
+"""Parse every registered file of a subscription directory in one pass, across a pool of worker processes.
+
+Each file is parsed whole by one worker with the reader registered for it in
+faddsdata.format_definitions. The files are handed out largest first, so the longest job starts
+straight away and the small ones fill in around it, and progress is reported as each file is done:
+
+    results = parse_directory('cycle_2013_10_17/', handle=count_records, progress=print)
+
+handle is applied to the records of each file in the worker, and what it returns is sent back;
+by default that is the list of records. Formats registered outside the built-in parser modules
+reach the workers as long as they are registered before parse_directory is called and the
+workers are forked, the default on Linux.
+
+Run "python -m faddsdata.schedule DIRECTORY" to parse a cycle and print the throughput of each file."""
+
+import multiprocessing
+import os
+import time
+from collections import namedtuple
+
+from faddsdata.format_definitions import registered_formats, get_format
+from faddsdata.parse import open_file
+
+class FileResult(namedtuple('FileResult', 'name records bytes seconds result')):
+    "What parsing one file gave: its record count, size, the seconds it took and what handle returned"
+    __slots__ = ()
+
+    @property
+    def throughput(self):
+        "Bytes parsed per second"
+        return self.bytes / self.seconds if self.seconds else 0.0
+
+    def __str__(self):
+        return "%-12s %9d records %8.1f MB %7.2fs %7.1f MB/s" % (self.name, self.records, self.bytes / 1e6, self.seconds, self.throughput / 1e6)
+
+def find_files(directory, names=None):
+    """(name, path, size) of each registered file present in directory, largest first. Names are
+    matched ignoring case; names limits the result to those files."""
+    formats = registered_formats()
+    known = dict((name.lower(), name) for name in formats if names is None or name in names)
+    files = []
+    for entry in os.listdir(directory):
+        name = known.get(entry.lower())
+        path = os.path.join(directory, entry)
+        if name is not None and os.path.isfile(path):
+            files.append((name, path, os.path.getsize(path)))
+    files.sort(key=lambda f: (-f[2], f[0]))
+    return files
+
+def count_records(records):
+    "A handle for parse_directory that only counts the records; they're counted anyway, so it returns None"
+    for _ in records:
+        pass
+
+def _counted(records, counter):
+    for record in records:
+        counter[0] += 1
+        yield record
+
+def _parse_file(job):
+    # runs in a worker process, or in this one with workers=0
+    name, path, size, handle, options = job
+    counter = [0]
+    start = time.perf_counter()
+    with open_file(path) as fp:
+        result = handle(_counted(get_format(name).records(fp, **options), counter))
+    return FileResult(name, counter[0], size, time.perf_counter() - start, result)
+
+def parse_directory(directory, workers=None, handle=list, progress=None, names=None, **options):
+    """Parse the registered files in a subscription directory, returning a dict of FileResult by file
+    name. workers is the size of the process pool; by default one per core, up to the number of files,
+    and with one core (or workers=0) the files are parsed in this process. handle must be a module level
+    function when there are workers. progress is called with each FileResult as its file is done, and
+    options (typed, interned, ...) go to the readers."""
+    files = find_files(directory, names)
+    if workers is None:
+        workers = min(len(files), os.cpu_count() or 1)
+        if workers == 1:
+            workers = 0
+    if options.get('lazy') and workers:
+        raise ValueError("lazy records can't be sent from worker processes; use workers=0")
+    jobs = [(name, path, size, handle, options) for name, path, size in files]
+    results = {}
+    if workers == 0:
+        done = map(_parse_file, jobs)
+        pool = None
+    else:
+        pool = multiprocessing.Pool(workers)
+        # one file per task, handed out in order, so the largest files are started first
+        done = pool.imap_unordered(_parse_file, jobs, 1)
+    try:
+        for result in done:
+            results[result.name] = result
+            if progress is not None:
+                progress(result)
+    finally:
+        if pool is not None:
+            pool.terminate()
+            pool.join()
+    return results
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Parse every known file of a subscription directory and report the throughput")
+    parser.add_argument('directory')
+    parser.add_argument('--workers', type=int, help="worker processes; 0 parses in this process")
+    parser.add_argument('--typed', action='store_true', help="convert field types as well")
+    args = parser.parse_args(argv)
+    start = time.perf_counter()
+    results = parse_directory(args.directory, args.workers, count_records, print, typed=args.typed)
+    elapsed = time.perf_counter() - start
+    size = sum(result.bytes for result in results.values())
+    print("%d files, %d records, %.1f MB in %.2fs, %.1f MB/s" % (len(results), sum(result.records for result in results.values()),
+                                                               size / 1e6, elapsed, size / 1e6 / elapsed if elapsed else 0.0))
+
+if __name__ == '__main__':
+    main()
+
+import unittest
+import shutil
+import tempfile
+
+class ScheduleTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.synthetic import write_cycle
+        self.directory = tempfile.mkdtemp()
+        write_cycle(self.directory, 0.002)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parsed(self, name, **options):
+        with open_file(os.path.join(self.directory, name)) as fp:
+            return list(get_format(name).records(fp, **options))
+
+    def test_registry(self):
+        from faddsdata.cache import READERS
+        formats = registered_formats()
+        self.assertEqual(sorted(READERS), sorted(formats))
+        self.assertTrue(get_format('natfix.txt') is formats['NATFIX.txt'])
+        self.assertRaises(KeyError, get_format, 'NAV.txt')
+        # the layouts alone parse the files the same way the registered readers do
+        for name, file_format in formats.items():
+            for options in ({}, {'typed': True}, {'interned': True}):
+                with open_file(os.path.join(self.directory, name)) as fp:
+                    self.assertEqual(self.parsed(name, **options), list(file_format.parse_lines(fp, **options)))
+        with open(os.path.join(self.directory, 'APT.txt'), 'rb') as fp:
+            line = fp.readline()
+        self.assertEqual('APT', formats['APT.txt'].record_type(line))
+        self.assertEqual(self.parsed('APT.txt')[0], formats['APT.txt'].parse_line(line))
+        from faddsdata.parse import ParseException
+        self.assertRaises(ParseException, formats['APT.txt'].parse_line, 'XYZ' + line[3:].decode('latin-1'))
+
+    def test_register(self):
+        from faddsdata.format_definitions import register_format, registry
+        from faddsdata.parse import convert_int
+        self.addCleanup(registry.FORMATS.pop, 'NAV.txt', None)
+        definition = (('record_type', 4), ('id', 4), (None, 1), ('elevation', 5))
+        register_format('NAV.txt', {'NAV1': definition, 'NAV2': (('record_type', 4), ('id', 4), ('remark', 6))},
+                        {'NAV1': (('height', 'elevation', convert_int, None),)}, {'NAV1': {'elevation': 'int'}})
+        with open(os.path.join(self.directory, 'NAV.txt'), 'w') as fp:
+            fp.write('NAV1ABC   1234\nNAV2ABC OTHER \n')
+        self.assertEqual([{'record_type': 'NAV1', 'id': 'ABC', 'elevation': 1234, 'height': 1234},
+                          {'record_type': 'NAV2', 'id': 'ABC', 'remark': 'OTHER'}], self.parsed('NAV.txt', typed=True))
+        self.assertEqual(4, len(find_files(self.directory)))
+        self.assertEqual(2, parse_directory(self.directory, 0, names=('NAV.txt',))['NAV.txt'].records)
+
+    def test_parse_directory(self):
+        files = find_files(self.directory)
+        self.assertEqual(['APT.txt', 'NATFIX.txt', 'AWOS.txt'], [name for name, _, _ in files])
+        self.assertEqual(files, sorted(files, key=lambda f: -f[2]))
+        for workers in (0, 2):
+            reported = []
+            results = parse_directory(self.directory, workers, progress=reported.append)
+            self.assertEqual(sorted(results), sorted(result.name for result in reported))
+            for name, path, size in files:
+                self.assertEqual(self.parsed(name), results[name].result)
+                self.assertEqual((len(results[name].result), size), (results[name].records, results[name].bytes))
+        results = parse_directory(self.directory, 2, count_records, typed=True)
+        self.assertEqual(len(self.parsed('AWOS.txt')), results['AWOS.txt'].records)
+        self.assertEqual(None, results['AWOS.txt'].result)
+        self.assertTrue('records' in str(results['APT.txt']))
+        self.assertRaises(ValueError, parse_directory, self.directory, 2, lazy=True)
@@ -0,0 +1,360 @@
+"""Type-ahead search over airport and fix identifiers, facility names and cities.
+
+A SearchIndex is built from parsed records and holds three structures:
+
+- a sorted array of identifiers (location_identifier, icao_identifier, NATFIX id), searched
+  by prefix with bisect,
+- a sorted array of the words of names and cities, for prefixes of words,
+- a trigram index of the names and cities, for fuzzy matching of misspelled names.
+
+Each of them points at Documents, which carry just enough to go back to the full record (the
+site number of a facility can be looked up with faddsdata.index). The index saves to a single
+marshal file that loads in a fraction of the time it takes to parse the files again. Fuzzy
+matching counts the trigrams in common with numpy when it is installed, and in Python otherwise.
+
+    index = build_search_index('cycle_2013_10_17/')
+    index.save('search.idx')
+    for document in SearchIndex.load('search.idx').search('LAWRNCE'):
+        print(document.identifiers, document.names)"""
+
+import bisect
+import heapq
+import marshal
+import os
+import re
+from array import array
+from collections import Counter, namedtuple
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from faddsdata.apt import iter_apt
+from faddsdata.natfix import iter_natfix
+from faddsdata.parse import open_file
+
+SEARCH_VERSION = 1
+
+# Fuzzy matches ranked in the first go; more are only sorted if they are needed
+RANK_BATCH = 64
+
+# What is searched in each file: the records kept, the field identifying a record,
+# the identifier fields and the name fields
+SEARCH_FIELDS = {
+    'APT.txt': ({'record_type': 'APT'}, 'facility_site_number', ('location_identifier', 'icao_identifier'),
+                ('facility_name', 'associated_city')),
+    'NATFIX.txt': (None, 'id', ('id',), ()),
+}
+
+READERS = {
+    'APT.txt': iter_apt,
+    'NATFIX.txt': iter_natfix,
+}
+
+# file is the file the record came from and key the value of its identifying field; identifiers
+# and names are the values searched, without blanks
+Document = namedtuple('Document', 'file key identifiers names')
+
+_SEPARATORS = re.compile(r'[^0-9A-Z]+')
+
+def normalize(text):
+    "Upper case words of letters and digits separated by single spaces"
+    return ' '.join(_SEPARATORS.split(text.upper())).strip()
+
+def trigrams(text):
+    "The set of trigrams of normalized text, each word padded with two spaces in front and one behind"
+    found = set()
+    for word in normalize(text).split():
+        word = '  ' + word + ' '
+        for i in range(len(word) - 2):
+            found.add(word[i:i + 3])
+    return found
+
+def documents_from_records(name, records):
+    "A Document for each record of the named file that SEARCH_FIELDS keeps"
+    conditions, key, identifiers, names = SEARCH_FIELDS[name]
+    for record in records:
+        if conditions and any(record.get(field) != value for field, value in conditions.items()):
+            continue
+        yield Document(name, record[key], tuple(record[field] for field in identifiers if record.get(field)),
+                       tuple(record[field] for field in names if record.get(field)))
+
+def _sorted_terms(pairs):
+    # parallel arrays of the terms, sorted, and the document of each
+    pairs.sort()
+    return [term for term, _ in pairs], array('I', [document for _, document in pairs])
+
+def _prefix_range(terms, prefix):
+    start = bisect.bisect_left(terms, prefix)
+    return start, bisect.bisect_left(terms, prefix + '\uffff', start)
+
+class SearchIndex(object):
+    """Identifier prefixes, name word prefixes and name trigrams over a list of Documents.
+    Queries are normalized the same way as the indexed values, so case and punctuation don't matter."""
+
+    def __init__(self, documents=()):
+        self.documents = [tuple(document) for document in documents]
+        identifiers = []
+        words = []
+        # each name or city is an entry of the trigram index
+        entries = array('I')
+        sizes = array('H')
+        postings = {}
+        for number, (file, key, document_identifiers, names) in enumerate(self.documents):
+            for identifier in set(document_identifiers):
+                identifiers.append((normalize(identifier), number))
+            for name in names:
+                for word in set(normalize(name).split()):
+                    words.append((word, number))
+                grams = trigrams(name)
+                entry = len(entries)
+                entries.append(number)
+                sizes.append(len(grams))
+                for gram in grams:
+                    postings.setdefault(gram, array('I')).append(entry)
+        self._identifiers, self._identifier_documents = _sorted_terms(identifiers)
+        self._words, self._word_documents = _sorted_terms(words)
+        self._entries = entries
+        self._sizes = sizes
+        self._postings = postings
+
+    def __len__(self):
+        return len(self.documents)
+
+    def document(self, number):
+        return Document._make(self.documents[number])
+
+    def _prefix(self, terms, documents, text, limit, seen):
+        start, end = _prefix_range(terms, text)
+        found = []
+        for i in range(start, end):
+            number = documents[i]
+            if number not in seen:
+                seen.add(number)
+                found.append(number)
+                if len(found) >= limit:
+                    break
+        return found
+
+    def prefix(self, text, limit=10):
+        "Documents with an identifier starting with text, in identifier order (so an exact match comes first)"
+        return [self.document(number) for number in self._prefix(self._identifiers, self._identifier_documents, normalize(text), limit, set())]
+
+    def word_prefix(self, text, limit=10):
+        "Documents with a word of a name or city starting with text, in word order"
+        return [self.document(number) for number in self._prefix(self._words, self._word_documents, normalize(text), limit, set())]
+
+    def _fuzzy(self, text, limit, threshold, seen):
+        grams = trigrams(text)
+        if not grams:
+            return []
+        postings = [self._postings[gram] for gram in grams if gram in self._postings]
+        if not postings:
+            return []
+        count = len(grams)
+        # the similarity is at most common / count, so anything under threshold has fewer than this in common
+        minimum = max(1, int(threshold * count))
+        if np is not None:
+            ranked = self._rank_numpy(postings, count, minimum, threshold)
+        else:
+            ranked = self._rank(postings, count, minimum, threshold)
+        found = []
+        for similarity, entry in ranked:
+            number = self._entries[entry]
+            if number not in seen:
+                seen.add(number)
+                found.append((similarity, number))
+                if len(found) >= limit:
+                    break
+        return found
+
+    def _rank(self, postings, count, minimum, threshold):
+        # (similarity, entry) best first, ties in entry order
+        shared = Counter()
+        for entries in postings:
+            shared.update(entries)
+        sizes = self._sizes
+        scored = []
+        for entry, common in shared.items():
+            if common >= minimum:
+                similarity = common / float(count + sizes[entry] - common)
+                if similarity >= threshold:
+                    scored.append((-similarity, entry))
+        # pop only as many as are needed instead of sorting them all
+        heapq.heapify(scored)
+        while scored:
+            similarity, entry = heapq.heappop(scored)
+            yield -similarity, entry
+
+    def _rank_numpy(self, postings, count, minimum, threshold):
+        # the same as _rank, counting with bincount over the posting arrays without copying them
+        shared = np.bincount(np.concatenate([np.frombuffer(entries, dtype=np.uint32) for entries in postings]))
+        entries = np.flatnonzero(shared >= minimum)
+        common = shared[entries]
+        similarity = common / (count + np.frombuffer(self._sizes, dtype=np.uint16)[entries] - common).astype(np.float64)
+        keep = similarity >= threshold
+        entries, similarity = entries[keep], similarity[keep]
+        if len(entries) > RANK_BATCH:
+            # usually only the first few are wanted: sort everything at least as good as the
+            # RANK_BATCH-th best (ties included, so the order matches _rank) before the rest
+            cutoff = -np.partition(-similarity, RANK_BATCH - 1)[RANK_BATCH - 1]
+            best = similarity >= cutoff
+            for batch in (best, ~best):
+                order = np.lexsort((entries[batch], -similarity[batch]))
+                for pair in zip(similarity[batch][order].tolist(), entries[batch][order].tolist()):
+                    yield pair
+        else:
+            order = np.lexsort((entries, -similarity))
+            for pair in zip(similarity[order].tolist(), entries[order].tolist()):
+                yield pair
+
+    def fuzzy(self, text, limit=10, threshold=0.3):
+        """(similarity, Document) for the names and cities most like text, best first. Similarity is the
+        share of trigrams in common (Jaccard) from 0 to 1, and matches under threshold are left out."""
+        return [(similarity, self.document(number)) for similarity, number in self._fuzzy(text, limit, threshold, set())]
+
+    def search(self, text, limit=10, threshold=0.3):
+        """The Documents for a type-ahead box: identifiers starting with text, then for a single word names
+        with a word starting with it, then fuzzy matches of the names, up to limit in all"""
+        query = normalize(text)
+        if not query:
+            return []
+        seen = set()
+        numbers = self._prefix(self._identifiers, self._identifier_documents, query, limit, seen)
+        if len(numbers) < limit and ' ' not in query:
+            numbers.extend(self._prefix(self._words, self._word_documents, query, limit - len(numbers), seen))
+        if len(numbers) < limit:
+            numbers.extend(number for _, number in self._fuzzy(query, limit - len(numbers), threshold, seen))
+        return [self.document(number) for number in numbers]
+
+    def save(self, path):
+        "Write the index to path, under a temporary name renamed into place"
+        data = {'version': SEARCH_VERSION, 'documents': self.documents,
+                'identifiers': (self._identifiers, self._identifier_documents.tobytes()),
+                'words': (self._words, self._word_documents.tobytes()),
+                'entries': self._entries.tobytes(), 'sizes': self._sizes.tobytes(),
+                'postings': dict((gram, entries.tobytes()) for gram, entries in self._postings.items())}
+        temporary = path + '.%d.tmp' % os.getpid()
+        with open(temporary, 'wb') as out:
+            marshal.dump(data, out)
+        os.replace(temporary, path)
+
+    @classmethod
+    def load(cls, path):
+        "Load an index written by save, raising ValueError if it is from another version"
+        with open(path, 'rb') as fp:
+            # much faster than marshal.load, which reads the file in small pieces
+            data = marshal.loads(fp.read())
+        if not isinstance(data, dict) or data.get('version') != SEARCH_VERSION:
+            raise ValueError("%s is not a search index of version %d" % (path, SEARCH_VERSION))
+        index = cls.__new__(cls)
+        index.documents = data['documents']
+        index._identifiers, index._identifier_documents = data['identifiers'][0], _array('I', data['identifiers'][1])
+        index._words, index._word_documents = data['words'][0], _array('I', data['words'][1])
+        index._entries = _array('I', data['entries'])
+        index._sizes = _array('H', data['sizes'])
+        index._postings = dict((gram, _array('I', entries)) for gram, entries in data['postings'].items())
+        return index
+
+def _array(typecode, data):
+    values = array(typecode)
+    values.frombytes(data)
+    return values
+
+def build_search_index(directory):
+    "A SearchIndex of the APT.txt and NATFIX.txt of a subscription directory, reading only the fields searched"
+    documents = []
+    for name in sorted(SEARCH_FIELDS):
+        path = os.path.join(directory, name)
+        if not os.path.exists(path):
+            continue
+        conditions, key, identifiers, names = SEARCH_FIELDS[name]
+        fields = (key,) + identifiers + names + tuple(conditions or ())
+        with open_file(path, binary=True) as fp:
+            documents.extend(documents_from_records(name, READERS[name](fp, fields=fields, where=conditions)))
+    return SearchIndex(documents)
+
+if __name__ == '__main__':
+    import sys
+    import time
+    start = time.perf_counter()
+    index = build_search_index(sys.argv[1])
+    print("indexed %d records in %.1fs" % (len(index), time.perf_counter() - start))
+    for query in sys.argv[2:]:
+        start = time.perf_counter()
+        found = index.search(query)
+        print("%s (%.3f ms)" % (query, (time.perf_counter() - start) * 1000))
+        for document in found:
+            print("  %s %s %s" % (document.key, '/'.join(document.identifiers), ', '.join(document.names)))
+
+import unittest
+import shutil
+import tempfile
+
+class SearchTests(unittest.TestCase):
+    def setUp(self):
+        self.index = SearchIndex([
+            Document('APT.txt', '04508.*A', ('LWC', 'KLWC'), ('LAWRENCE MUNI', 'LAWRENCE')),
+            Document('APT.txt', '04509.*A', ('LXT',), ('LEE\'S SUMMIT MUNI', 'LEE\'S SUMMIT')),
+            Document('APT.txt', '04510.*A', ('MCI', 'KMCI'), ('KANSAS CITY INTL', 'KANSAS CITY')),
+            Document('NATFIX.txt', 'LWCAA', ('LWCAA',), ()),
+            Document('NATFIX.txt', 'LAWRE', ('LAWRE',), ()),
+        ])
+
+    def keys(self, documents):
+        return [document.key for document in documents]
+
+    def test_prefix(self):
+        self.assertEqual(['04508.*A', 'LWCAA'], self.keys(self.index.prefix('lwc')))
+        self.assertEqual(['04508.*A'], self.keys(self.index.prefix('LWC', limit=1)))
+        self.assertEqual(['04508.*A'], self.keys(self.index.prefix('KL')))
+        self.assertEqual([], self.index.prefix('ZZZ'))
+        self.assertEqual(['04509.*A'], self.keys(self.index.word_prefix('summ')))
+        self.assertEqual(['04508.*A', '04509.*A'], self.keys(self.index.word_prefix('Muni')))
+
+    def test_fuzzy(self):
+        found = self.index.fuzzy('LAWRNCE MUNI')
+        self.assertEqual('04508.*A', found[0][1].key)
+        self.assertEqual(1, len(found))
+        self.assertTrue(0.3 < found[0][0] < 1)
+        self.assertEqual(1.0, self.index.fuzzy('kansas city intl')[0][0])
+        self.assertEqual([], self.index.fuzzy('--'))
+        self.assertEqual([], self.index.fuzzy('QQQ'))
+        if np is not None:
+            import sys
+            from unittest import mock
+            with_numpy = [self.index.fuzzy(query, threshold=0.1) for query in ('LAWRNCE MUNI', 'CITY', 'LEES SUMIT')]
+            # the pure Python ranking gives the same results
+            with mock.patch.object(sys.modules[__name__], 'np', None):
+                self.assertEqual(with_numpy, [self.index.fuzzy(query, threshold=0.1) for query in ('LAWRNCE MUNI', 'CITY', 'LEES SUMIT')])
+
+    def test_search(self):
+        # identifiers, then words of names, then fuzzy matches, each document once
+        self.assertEqual(['LAWRE', '04508.*A'], self.keys(self.index.search('LAW')))
+        self.assertEqual(['04508.*A', '04510.*A'], self.keys(self.index.search('K')))
+        self.assertEqual(['04510.*A'], self.keys(self.index.search('kansas citty')))
+        self.assertEqual([], self.index.search(' '))
+
+    def test_build_and_save(self):
+        from faddsdata.synthetic import write_cycle
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        write_cycle(directory, 0.002)
+        index = build_search_index(directory)
+        with open_file(os.path.join(directory, 'APT.txt')) as fp:
+            airports = [r for r in iter_apt(fp) if r['record_type'] == 'APT']
+        with open_file(os.path.join(directory, 'NATFIX.txt')) as fp:
+            fixes = list(iter_natfix(fp))
+        self.assertEqual(len(airports) + len(fixes), len(index))
+        airport = airports[3]
+        self.assertTrue(airport['facility_site_number'] in self.keys(index.search(airport['location_identifier'])))
+        self.assertEqual(airport['facility_site_number'], index.fuzzy(airport['facility_name'], limit=1)[0][1].key)
+        path = os.path.join(directory, 'search.idx')
+        index.save(path)
+        loaded = SearchIndex.load(path)
+        for query in (airport['location_identifier'], airport['facility_name'], fixes[0]['id'], 'CITY'):
+            self.assertEqual(index.search(query), loaded.search(query))
+        with open(path, 'wb') as fp:
+            marshal.dump({'version': 0}, fp)
+        self.assertRaises(ValueError, SearchIndex.load, path)
@@ -0,0 +1,409 @@
+"""A local, read-only query server over one subscription cycle.
+
+The cycle is parsed once, through the usual readers, into a Dataset held by a single process,
+and served as JSON over HTTP on a TCP port or a Unix socket with asyncio:
+
+    GET /status                          the cycle being served and its record counts
+    GET /airports/LWC                    an airport by location identifier, ICAO identifier or site number
+    GET /airports/LWC/runways            its runways (or attendance, arresting_gear, remarks)
+    GET /nearest?lat=39&lon=-95.2&k=5    the airports nearest a point
+    GET /fixes/LAWRE, GET /awos/LWC      NATFIX fixes and AWOS stations by id
+    GET /search?q=LAWRENCE               type-ahead search (see faddsdata.search)
+
+PATH is either a cycle directory or a directory of cycle directories. In the second case the
+newest one (the last by name) is served, and the server polls for a newer one. Once its files
+have stopped changing it is validated with faddsdata.validate and loaded in a thread while the
+current data keeps answering. The new Dataset then replaces the old one in a single assignment.
+Every request reads the Dataset once, so requests in flight finish on the data they started
+with and none are dropped.
+
+Run "python -m faddsdata.server PATH [--port 8080 | --unix SOCKET]"; faddsdata.loadtest
+exercises it."""
+
+import asyncio
+import json
+import logging
+import os
+import time
+from urllib.parse import parse_qs, unquote, urlsplit
+
+from faddsdata.apt import FACILITY_CHILDREN, iter_apt_facilities
+from faddsdata.awos import iter_awos
+from faddsdata.natfix import iter_natfix
+from faddsdata.parse import open_file
+from faddsdata.search import Document, SearchIndex
+from faddsdata.spatial import SpatialIndex
+
+logger = logging.getLogger(__name__)
+
+# Seconds between checks for a new cycle
+POLL_INTERVAL = 30.0
+# Most results of /nearest and /search
+MAX_RESULTS = 100
+CYCLE_FILES = ('APT.txt', 'AWOS.txt', 'NATFIX.txt')
+
+class Dataset(object):
+    "The parsed records of one cycle directory, indexed for the server's queries"
+
+    def __init__(self, directory):
+        self.directory = directory
+        self.loaded = time.time()
+        # identifier, ICAO identifier or site number -> facility
+        self.airports = {}
+        self.fixes = {}
+        self.awos = {}
+        facilities = []
+        path = os.path.join(directory, 'APT.txt')
+        if os.path.exists(path):
+            with open_file(path, binary=True) as fp:
+                for facility in iter_apt_facilities(fp, interned=True):
+                    facilities.append(facility)
+                    for field in ('facility_site_number', 'location_identifier', 'icao_identifier'):
+                        if facility.get(field):
+                            self.airports.setdefault(facility[field], facility)
+        for name, reader, index in (('NATFIX.txt', iter_natfix, self.fixes), ('AWOS.txt', iter_awos, self.awos)):
+            path = os.path.join(directory, name)
+            if os.path.exists(path):
+                with open_file(path, binary=True) as fp:
+                    for record in reader(fp, interned=True):
+                        # fix and station ids are only unique within a type
+                        index.setdefault(record['id'], []).append(record)
+        self.spatial = SpatialIndex(facilities)
+        documents = [Document('APT.txt', f['facility_site_number'], tuple(f[key] for key in ('location_identifier', 'icao_identifier') if f.get(key)),
+                              tuple(f[key] for key in ('facility_name', 'associated_city') if f.get(key))) for f in facilities]
+        documents.extend(Document('NATFIX.txt', id, (id,), ()) for id in self.fixes)
+        self.search = SearchIndex(documents)
+        self.counts = {'airports': len(facilities), 'fixes': sum(map(len, self.fixes.values())),
+                       'awos': sum(map(len, self.awos.values()))}
+
+_CHILD_KEYS = frozenset(FACILITY_CHILDREN.values())
+
+def airport_record(facility):
+    "A facility without its child record lists"
+    return dict((key, value) for key, value in facility.items() if key not in _CHILD_KEYS)
+
+class NotFound(Exception): pass
+class BadRequest(Exception): pass
+
+def _number(query, name, default=None):
+    values = query.get(name)
+    if not values:
+        if default is None:
+            raise BadRequest("%s is required" % name)
+        return default
+    try:
+        return float(values[0])
+    except ValueError:
+        raise BadRequest("%s must be a number" % name)
+
+def answer(dataset, target):
+    "The JSON-ready result of a GET of target (a path with its query string) against a Dataset"
+    url = urlsplit(target)
+    parts = [unquote(part) for part in url.path.split('/') if part]
+    query = parse_qs(url.query)
+    if parts == ['status']:
+        return {'directory': dataset.directory, 'loaded': dataset.loaded, 'counts': dataset.counts}
+    if parts and parts[0] == 'airports' and len(parts) in (2, 3):
+        facility = dataset.airports.get(parts[1].upper())
+        if facility is None:
+            raise NotFound("No airport %s" % parts[1])
+        if len(parts) == 2:
+            return airport_record(facility)
+        if parts[2] not in _CHILD_KEYS:
+            raise NotFound("Airports have no %s" % parts[2])
+        return facility[parts[2]]
+    if parts and parts[0] in ('fixes', 'awos') and len(parts) == 2:
+        records = (dataset.fixes if parts[0] == 'fixes' else dataset.awos).get(parts[1].upper())
+        if not records:
+            raise NotFound("No %s %s" % (parts[0], parts[1]))
+        return records
+    if parts == ['nearest']:
+        lat, lon = _number(query, 'lat'), _number(query, 'lon')
+        if not (-90 <= lat <= 90 and -180 <= lon <= 180):
+            raise BadRequest("lat and lon are out of range")
+        k = int(min(max(_number(query, 'k', 5), 1), MAX_RESULTS))
+        return [{'distance_nm': distance, 'airport': airport_record(facility)} for distance, facility in dataset.spatial.nearest(lat, lon, k)]
+    if parts == ['search']:
+        limit = int(min(max(_number(query, 'limit', 10), 1), MAX_RESULTS))
+        return [document._asdict() for document in dataset.search.search(query.get('q', [''])[0], limit)]
+    raise NotFound("Unknown path %s" % url.path)
+
+def find_cycle(path):
+    "The cycle directory to serve from path: path itself if it holds cycle files, else its last subdirectory by name that does"
+    def is_cycle(directory):
+        return any(os.path.exists(os.path.join(directory, name)) for name in CYCLE_FILES)
+    if is_cycle(path):
+        return path
+    cycles = [os.path.join(path, name) for name in sorted(os.listdir(path)) if os.path.isdir(os.path.join(path, name))]
+    cycles = [directory for directory in cycles if is_cycle(directory)]
+    return cycles[-1] if cycles else None
+
+def _signature(directory):
+    # changes while the files of a new cycle are still being written
+    signature = []
+    for name in CYCLE_FILES:
+        path = os.path.join(directory, name)
+        if os.path.exists(path):
+            stat = os.stat(path)
+            signature.append((name, stat.st_size, stat.st_mtime_ns))
+    return tuple(signature)
+
+def load_dataset(directory, validate=True):
+    "Validate (unless told not to) and load a cycle directory, raising ValueError if it has bad lines"
+    if validate:
+        from faddsdata.validate import validate_cycle
+        bad = [report for report in validate_cycle(directory, workers=0) if not report.ok]
+        if bad:
+            raise ValueError('\n'.join(str(report) for report in bad))
+    return Dataset(directory)
+
+_REASONS = {200: 'OK', 400: 'Bad Request', 404: 'Not Found', 405: 'Method Not Allowed', 500: 'Internal Server Error'}
+
+class QueryServer(object):
+    """Serves a Dataset over HTTP and swaps in newer cycles found under path (see the module docstring).
+    The first cycle is loaded when the server starts."""
+
+    def __init__(self, path, poll_interval=POLL_INTERVAL, validate=True):
+        self.path = path
+        self.poll_interval = poll_interval
+        self.validate = validate
+        self.dataset = None
+        self.requests = 0
+        # (directory, signature) of a new cycle seen once, and of one that failed to load
+        self._pending = None
+        self._rejected = None
+        self._server = None
+        self._watcher = None
+
+    async def start(self, host='127.0.0.1', port=8080, unix=None):
+        "Load the newest cycle and start listening; returns the asyncio server"
+        directory = find_cycle(self.path)
+        if directory is None:
+            raise ValueError("No cycle found in %s" % self.path)
+        loop = asyncio.get_running_loop()
+        self.dataset = await loop.run_in_executor(None, load_dataset, directory, self.validate)
+        if unix:
+            self._server = await asyncio.start_unix_server(self.handle, unix)
+        else:
+            self._server = await asyncio.start_server(self.handle, host, port)
+        if self.poll_interval:
+            self._watcher = asyncio.ensure_future(self._watch())
+        return self._server
+
+    async def close(self):
+        if self._watcher is not None:
+            self._watcher.cancel()
+        if self._server is not None:
+            self._server.close()
+            await self._server.wait_closed()
+
+    async def _watch(self):
+        while True:
+            await asyncio.sleep(self.poll_interval)
+            try:
+                await self.check()
+            except Exception:
+                logger.exception("Checking for a new cycle failed")
+
+    async def check(self):
+        """Look for a newer cycle, loading it if it was also there, unchanged, at the last check.
+        Returns True if the data was replaced."""
+        directory = find_cycle(self.path)
+        if directory is None or directory == self.dataset.directory:
+            self._pending = None
+            return False
+        seen = (directory, _signature(directory))
+        if seen == self._rejected:
+            return False
+        if seen != self._pending:
+            # wait for the files to stop changing
+            self._pending = seen
+            return False
+        self._pending = None
+        loop = asyncio.get_running_loop()
+        try:
+            dataset = await loop.run_in_executor(None, load_dataset, directory, self.validate)
+        except Exception:
+            logger.exception("Not switching to %s", directory)
+            self._rejected = seen
+            return False
+        previous, self.dataset = self.dataset, dataset
+        logger.info("Switched from %s to %s", previous.directory, directory)
+        return True
+
+    def respond(self, method, target):
+        "(status, JSON body bytes) for a request"
+        if method != 'GET':
+            return 405, {'error': "Only GET is supported"}
+        # one read, so a swap part way through a request can't mix two cycles
+        dataset = self.dataset
+        try:
+            return 200, answer(dataset, target)
+        except NotFound as e:
+            return 404, {'error': str(e)}
+        except BadRequest as e:
+            return 400, {'error': str(e)}
+        except Exception:
+            logger.exception("Error answering %s", target)
+            return 500, {'error': "Internal error"}
+
+    async def handle(self, reader, writer):
+        "Answer the requests of one connection, keeping it open between them as HTTP/1.1 allows"
+        try:
+            while True:
+                request_line = await reader.readline()
+                if not request_line.strip():
+                    break
+                headers = {}
+                while True:
+                    line = await reader.readline()
+                    if not line.strip():
+                        break
+                    name, _, value = line.decode('latin-1').partition(':')
+                    headers[name.strip().lower()] = value.strip().lower()
+                try:
+                    method, target, version = request_line.decode('latin-1').split()
+                except ValueError:
+                    status, result = 400, {'error': "Malformed request line"}
+                    version = 'HTTP/1.0'
+                else:
+                    status, result = self.respond(method, target)
+                self.requests += 1
+                keep_alive = version == 'HTTP/1.1' and headers.get('connection') != 'close'
+                body = json.dumps(result).encode('utf-8')
+                writer.write(('%s %d %s\r\nContent-Type: application/json\r\nContent-Length: %d\r\nConnection: %s\r\n\r\n'
+                              % (version if version in ('HTTP/1.0', 'HTTP/1.1') else 'HTTP/1.1', status, _REASONS[status],
+                                 len(body), 'keep-alive' if keep_alive else 'close')).encode('latin-1') + body)
+                await writer.drain()
+                if not keep_alive:
+                    break
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass
+        finally:
+            writer.close()
+
+def main(argv=None):
+    import argparse
+    parser = argparse.ArgumentParser(description="Serve a FADDS cycle over HTTP")
+    parser.add_argument('path', help="a cycle directory, or a directory of cycle directories to watch")
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--unix', help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument('--poll', type=float, default=POLL_INTERVAL, help="seconds between checks for a new cycle, 0 to never check")
+    parser.add_argument('--no-validate', action='store_true', help="load new cycles without validating them first")
+    args = parser.parse_args(argv)
+    logging.basicConfig(level=logging.INFO, format='%(asctime)s %(message)s')
+
+    async def serve():
+        server = QueryServer(args.path, args.poll, not args.no_validate)
+        listening = await server.start(args.host, args.port, args.unix)
+        logger.info("Serving %s (%s) on %s", server.dataset.directory, ', '.join('%d %s' % (count, name) for name, count in sorted(server.dataset.counts.items())),
+                    args.unix or '%s:%d' % (args.host, args.port))
+        async with listening:
+            await listening.serve_forever()
+    try:
+        asyncio.run(serve())
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == '__main__':
+    main()
+
+import unittest
+import shutil
+import tempfile
+
+async def _request(reader, writer, target):
+    # (status, JSON body) of a GET on an open connection
+    writer.write(('GET %s HTTP/1.1\r\nHost: localhost\r\n\r\n' % target).encode('latin-1'))
+    status = int((await reader.readline()).split()[1])
+    length = 0
+    while True:
+        line = await reader.readline()
+        if not line.strip():
+            break
+        if line.lower().startswith(b'content-length:'):
+            length = int(line.split(b':')[1])
+    return status, json.loads(await reader.readexactly(length))
+
+async def _get(port, *targets):
+    # (status, JSON body) of each target, over one kept-alive connection
+    reader, writer = await asyncio.open_connection('127.0.0.1', port)
+    try:
+        return [await _request(reader, writer, target) for target in targets]
+    finally:
+        writer.close()
+
+class ServerTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.synthetic import write_cycle
+        self.root = tempfile.mkdtemp()
+        self.first = os.path.join(self.root, 'cycle_2013_10_17')
+        os.mkdir(self.first)
+        write_cycle(self.first, 0.002)
+
+    def tearDown(self):
+        shutil.rmtree(self.root)
+
+    def test_queries(self):
+        dataset = Dataset(self.first)
+        facility = [f for f in dataset.airports.values() if f['runways'] and f['location_identifier']][0]
+        identifier = facility['location_identifier']
+        self.assertEqual(airport_record(facility), answer(dataset, '/airports/%s' % identifier.lower()))
+        self.assertFalse('runways' in answer(dataset, '/airports/%s' % identifier))
+        self.assertEqual(facility['runways'], answer(dataset, '/airports/%s/runways' % identifier))
+        self.assertEqual(facility['facility_site_number'], answer(dataset, '/airports/%s' % facility['facility_site_number'].replace('*', '%2A'))['facility_site_number'])
+        nearest = answer(dataset, '/nearest?lat=%r&lon=%r&k=3' % (facility['lat'], facility['lon']))
+        self.assertEqual(3, len(nearest))
+        self.assertEqual(0.0, nearest[0]['distance_nm'])
+        fix = next(iter(dataset.fixes))
+        self.assertEqual(fix, answer(dataset, '/fixes/%s' % fix)[0]['id'])
+        self.assertTrue(identifier in answer(dataset, '/search?q=%s' % identifier)[0]['identifiers'])
+        self.assertEqual(dataset.counts, answer(dataset, '/status')['counts'])
+        self.assertRaises(NotFound, answer, dataset, '/airports/NOPE')
+        self.assertRaises(NotFound, answer, dataset, '/airports/%s/hangars' % identifier)
+        self.assertRaises(BadRequest, answer, dataset, '/nearest?lat=91&lon=0')
+        self.assertRaises(BadRequest, answer, dataset, '/nearest?lat=north&lon=0')
+
+    def test_http_and_reload(self):
+        from faddsdata.synthetic import write_cycle
+        async def run():
+            server = QueryServer(self.root, poll_interval=0)
+            listening = await server.start(port=0)
+            port = listening.sockets[0].getsockname()[1]
+            try:
+                (status, body), (missing, error), (bad, _) = await _get(port, '/status', '/airports/NOPE', '/nearest?lat=1')
+                self.assertEqual((200, 404, 400), (status, missing, bad))
+                self.assertEqual(self.first, body['directory'])
+                self.assertTrue('NOPE' in error['error'])
+                # a new cycle is only loaded once it is unchanged between two checks
+                second = os.path.join(self.root, 'cycle_2013_12_12')
+                os.mkdir(second)
+                write_cycle(second, 0.003, seed=1)
+                self.assertFalse(await server.check())
+                # requests are answered while the new cycle loads, and a kept-alive connection carries on across the swap
+                reader, writer = await asyncio.open_connection('127.0.0.1', port)
+                self.assertEqual(self.first, (await _request(reader, writer, '/status'))[1]['directory'])
+                swapped, during = await asyncio.gather(server.check(), _get(port, *['/nearest?lat=39&lon=-95'] * 20))
+                self.assertTrue(swapped)
+                self.assertEqual([200] * 20, [status for status, _ in during])
+                status, body = await _request(reader, writer, '/status')
+                writer.close()
+                self.assertEqual(second, body['directory'])
+                self.assertEqual(Dataset(second).counts, body['counts'])
+                self.assertFalse(await server.check())
+                # a cycle that fails validation is not switched to
+                third = os.path.join(self.root, 'cycle_2014_02_06')
+                os.mkdir(third)
+                with open(os.path.join(third, 'APT.txt'), 'w') as fp:
+                    fp.write('APT too short\n')
+                logging.disable(logging.CRITICAL)
+                try:
+                    self.assertFalse(await server.check())
+                    self.assertFalse(await server.check())
+                finally:
+                    logging.disable(logging.NOTSET)
+                self.assertEqual(second, server.dataset.directory)
+            finally:
+                await server.close()
+        asyncio.run(run())
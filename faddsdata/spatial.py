@@ -0,0 +1,175 @@
+"Find the airports, AWOS stations or fixes near a point without scanning every record"
+
+import heapq
+import math
+
+# Mean radius of the earth in nautical miles
+EARTH_RADIUS_NM = 3440.065
+
+def great_circle_nm(lat1, lon1, lat2, lon2):
+    "Great circle (haversine) distance in nautical miles between two points given in decimal degrees"
+    lat1, lon1, lat2, lon2 = math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2)
+    a = math.sin((lat2 - lat1) / 2) ** 2 + math.cos(lat1) * math.cos(lat2) * math.sin((lon2 - lon1) / 2) ** 2
+    return 2 * EARTH_RADIUS_NM * math.asin(min(1.0, math.sqrt(a)))
+
+def initial_bearing(lat1, lon1, lat2, lon2):
+    "True course in degrees (0 to 360) at the first point of the great circle to the second"
+    lat1, lon1, lat2, lon2 = math.radians(lat1), math.radians(lon1), math.radians(lat2), math.radians(lon2)
+    y = math.sin(lon2 - lon1) * math.cos(lat2)
+    x = math.cos(lat1) * math.sin(lat2) - math.sin(lat1) * math.cos(lat2) * math.cos(lon2 - lon1)
+    return math.degrees(math.atan2(y, x)) % 360.0
+
+class SpatialIndex(object):
+    """A grid of cell_size degree cells over records with decimal degree coordinates, as produced
+    by parse_apt_line, parse_awos_line and parse_natfix_line. Records without coordinates (RMK lines,
+    AWOS2 remarks) are skipped. Queries return (distance in nm, record) pairs, nearest first."""
+
+    def __init__(self, records=(), cell_size=0.5, lat_key='lat', lon_key='lon'):
+        self.cell_size = cell_size
+        self.lat_key = lat_key
+        self.lon_key = lon_key
+        self._lon_cells = int(math.ceil(360.0 / cell_size))
+        self._lat_cells = int(math.ceil(180.0 / cell_size))
+        self._cells = {}
+        self._count = 0
+        for record in records:
+            self.add(record)
+
+    def __len__(self):
+        return self._count
+
+    def _cell(self, lat, lon):
+        row = min(int((lat + 90.0) // self.cell_size), self._lat_cells - 1)
+        column = int(((lon + 180.0) % 360.0) // self.cell_size) % self._lon_cells
+        return row, column
+
+    def add(self, record):
+        "Add a record to the index, returning False if it has no coordinates"
+        lat = record.get(self.lat_key)
+        lon = record.get(self.lon_key)
+        if lat is None or lon is None:
+            return False
+        self._cells.setdefault(self._cell(lat, lon), []).append((lat, lon, record))
+        self._count += 1
+        return True
+
+    def _columns(self, first, last):
+        "Cell columns from the one holding longitude first east to the one holding last, wrapping at 180"
+        start = self._cell(0.0, first)[1]
+        end = self._cell(0.0, last)[1]
+        if end < start:
+            end += self._lon_cells
+        if end - start + 1 >= self._lon_cells:
+            return range(self._lon_cells)
+        return [column % self._lon_cells for column in range(start, end + 1)]
+
+    def _candidates(self, rows, columns):
+        cells = self._cells
+        for row in rows:
+            for column in columns:
+                cell = cells.get((row, column))
+                if cell:
+                    for entry in cell:
+                        yield entry
+
+    def within(self, lat, lon, radius_nm):
+        "Every record within radius_nm nautical miles of the point"
+        angle = math.degrees(radius_nm / EARTH_RADIUS_NM)
+        south, north = lat - angle, lat + angle
+        if south <= -90.0 or north >= 90.0:
+            columns = range(self._lon_cells)
+        else:
+            # the widest longitude span of a spherical cap centered at lat
+            ratio = math.sin(math.radians(angle)) / math.cos(math.radians(lat))
+            if ratio >= 1.0:
+                columns = range(self._lon_cells)
+            else:
+                spread = math.degrees(math.asin(ratio))
+                columns = self._columns(lon - spread, lon + spread)
+        rows = range(self._cell(max(south, -90.0), 0.0)[0], self._cell(min(north, 90.0), 0.0)[0] + 1)
+        found = []
+        for record_lat, record_lon, record in self._candidates(rows, columns):
+            distance = great_circle_nm(lat, lon, record_lat, record_lon)
+            if distance <= radius_nm:
+                found.append((distance, record))
+        found.sort(key=lambda pair: pair[0])
+        return found
+
+    def nearest(self, lat, lon, k=1):
+        "The k records closest to the point"
+        # Widen a radius search until it holds k records; everything inside the radius is
+        # exact, so the k closest of those are the k closest overall
+        radius = self.cell_size * 60.0
+        half_circumference = math.pi * EARTH_RADIUS_NM
+        while True:
+            found = self.within(lat, lon, radius)
+            if len(found) >= k or radius >= half_circumference:
+                return found[:k]
+            radius *= 2
+
+    def in_bbox(self, min_lat, min_lon, max_lat, max_lon):
+        """Every record inside a latitude/longitude box, as a list of records in no particular order.
+        A box with min_lon greater than max_lon crosses the 180th meridian."""
+        rows = range(self._cell(min_lat, 0.0)[0], self._cell(max_lat, 0.0)[0] + 1)
+        crosses = min_lon > max_lon
+        found = []
+        for record_lat, record_lon, record in self._candidates(rows, self._columns(min_lon, max_lon)):
+            if min_lat <= record_lat <= max_lat:
+                if crosses:
+                    if record_lon >= min_lon or record_lon <= max_lon:
+                        found.append(record)
+                elif min_lon <= record_lon <= max_lon:
+                    found.append(record)
+        return found
+
+def brute_force_nearest(records, lat, lon, k=1, lat_key='lat', lon_key='lon'):
+    "The k records closest to the point by scanning all of them, for checking SpatialIndex"
+    distances = ((great_circle_nm(lat, lon, r[lat_key], r[lon_key]), i, r) for i, r in enumerate(records) if r.get(lat_key) is not None)
+    return [(distance, record) for distance, _, record in heapq.nsmallest(k, distances)]
+
+import unittest
+import random
+class SpatialTests(unittest.TestCase):
+    def setUp(self):
+        generator = random.Random(56)
+        self.records = [{'id': i, 'lat': generator.uniform(-89.9, 89.9), 'lon': generator.uniform(-180, 180)} for i in range(2000)]
+        self.records.append({'id': 'no coordinates'})
+        self.index = SpatialIndex(self.records, cell_size=2.0)
+
+    def test_great_circle_nm(self):
+        # one minute of latitude is about a nautical mile
+        self.assertAlmostEqual(1.0, great_circle_nm(39.0, -95.0, 39.0 + 1 / 60.0, -95.0), 2)
+        self.assertAlmostEqual(0.0, great_circle_nm(39.0, -95.0, 39.0, -95.0))
+        self.assertAlmostEqual(great_circle_nm(10, 179.5, 10, -179.5), great_circle_nm(10, -0.5, 10, 0.5))
+
+    def test_initial_bearing(self):
+        self.assertAlmostEqual(0.0, initial_bearing(39.0, -95.0, 40.0, -95.0))
+        self.assertAlmostEqual(180.0, initial_bearing(39.0, -95.0, 38.0, -95.0))
+        self.assertAlmostEqual(90.0, initial_bearing(0.0, 179.5, 0.0, -179.5))
+        self.assertAlmostEqual(270.0, initial_bearing(0.0, 10.0, 0.0, 9.0))
+
+    def test_len(self):
+        self.assertEqual(2000, len(self.index))
+
+    def test_nearest(self):
+        for lat, lon in ((39.0, -95.2), (0, 179.9), (89.5, 10), (-60, -179.99)):
+            expected = brute_force_nearest(self.records, lat, lon, k=5)
+            self.assertEqual([r['id'] for _, r in expected], [r['id'] for _, r in self.index.nearest(lat, lon, k=5)])
+        self.assertEqual(2000, len(self.index.nearest(0, 0, k=5000)))
+
+    def test_within(self):
+        for lat, lon, radius in ((39.0, -95.2, 300), (10, 179.9, 500), (-85, 0, 900)):
+            expected = set(r['id'] for r in self.records if 'lat' in r and great_circle_nm(lat, lon, r['lat'], r['lon']) <= radius)
+            found = self.index.within(lat, lon, radius)
+            self.assertEqual(expected, set(r['id'] for _, r in found))
+            self.assertEqual(sorted(d for d, _ in found), [d for d, _ in found])
+
+    def test_in_bbox(self):
+        for box in ((30, -100, 45, -80), (-20, 170, 20, -170)):
+            min_lat, min_lon, max_lat, max_lon = box
+            if min_lon <= max_lon:
+                inside = lambda r: min_lon <= r['lon'] <= max_lon
+            else:
+                inside = lambda r: r['lon'] >= min_lon or r['lon'] <= max_lon
+            expected = set(r['id'] for r in self.records if 'lat' in r and min_lat <= r['lat'] <= max_lat and inside(r))
+            self.assertEqual(expected, set(r['id'] for r in self.index.in_bbox(*box)))
@@ -0,0 +1,217 @@
+"""Read the files of a FADDS subscription straight out of the ZIP archive the FAA publishes.
+
+Nothing is extracted to disk: each member is decompressed and parsed as it streams. By default
+every member is parsed in its own worker process at the same time, and the records come back
+through a bounded queue, so memory stays flat however far ahead the workers get.
+
+    with open_subscription('56DySubscription_November_18__2010_-_January_13__2011.zip') as subscription:
+        for record in subscription.records('APT.txt'):
+            ..."""
+
+import multiprocessing
+import os
+import queue
+import zipfile
+
+from faddsdata.cache import READERS
+from faddsdata.parse import ParseException
+
+# Records are sent from the workers in lists of this many
+BATCH_SIZE = 2000
+# Batches a worker can get ahead of the reader of its file
+QUEUE_SIZE = 8
+
+def find_members(archive):
+    "Map the file names in READERS to the members of a ZipFile holding them, wherever they are in the archive"
+    known = dict((name.lower(), name) for name in READERS)
+    members = {}
+    for info in archive.infolist():
+        name = known.get(os.path.basename(info.filename).lower())
+        if name is not None and not info.is_dir():
+            members.setdefault(name, info.filename)
+    return members
+
+def iter_member(path, name, member=None, **options):
+    "Parse one file of a subscription archive in this process, streaming it out of the ZIP"
+    with zipfile.ZipFile(path) as archive:
+        if member is None:
+            member = find_members(archive)[name]
+        with archive.open(member) as fp:
+            for record in READERS[name](fp, **options):
+                yield record
+
+def _parse_member(path, name, member, records, batch_size, options):
+    # runs in a worker process
+    try:
+        batch = []
+        for record in iter_member(path, name, member, **options):
+            batch.append(record)
+            if len(batch) >= batch_size:
+                records.put(batch)
+                batch = []
+        if batch:
+            records.put(batch)
+    except Exception as e:
+        # the exception itself might not pickle, so send its description
+        records.put(ParseException("%s while parsing %s: %s" % (type(e).__name__, member, e)))
+    records.put(None)
+
+class Subscription(object):
+    """The files of a subscription ZIP. records(name) streams the records of one file.
+
+    workers is how many files are parsed ahead in worker processes, one process per file. By default
+    it is one less than the number of cores (leaving one for the reader), up to the number of files.
+    A file being read is always parsed, even past that limit. With workers=0, which is the default on
+    a single core, the files are parsed in this process as they are read. options (fields, typed,
+    where, lazy) go to the readers. Records have to be sent between processes, so lazy records are
+    always parsed with workers=0."""
+
+    def __init__(self, path, workers=None, batch_size=BATCH_SIZE, **options):
+        self.path = path
+        self.batch_size = batch_size
+        self.options = options
+        with zipfile.ZipFile(path) as archive:
+            self.members = find_members(archive)
+        if workers is None:
+            workers = 0 if options.get('lazy') else min(len(self.members), (os.cpu_count() or 1) - 1)
+        elif workers and options.get('lazy'):
+            raise ValueError("lazy records can't be sent from worker processes; use workers=0")
+        self.workers = workers
+        self._context = multiprocessing.get_context()
+        # name -> (process, queue) for files being parsed ahead that nobody has started reading
+        self._started = {}
+        self._running = []
+        for name in self.names()[:self.workers]:
+            self._started[name] = self._start(name)
+
+    def names(self):
+        "The known files present in the archive"
+        return sorted(self.members)
+
+    def _start(self, name):
+        records = self._context.Queue(QUEUE_SIZE)
+        process = self._context.Process(target=_parse_member, args=(self.path, name, self.members[name], records, self.batch_size, self.options))
+        process.daemon = True
+        process.start()
+        self._running.append(process)
+        return process, records
+
+    def records(self, name):
+        "Iterate over the records of one file. Each call parses the file again."
+        if name not in self.members:
+            raise KeyError(name)
+        if self.workers == 0:
+            return iter_member(self.path, name, self.members[name], **self.options)
+        started = self._started.pop(name, None)
+        if started is None:
+            started = self._start(name)
+        return self._receive(name, *started)
+
+    def _receive(self, name, process, records):
+        try:
+            while True:
+                try:
+                    batch = records.get(timeout=1)
+                except queue.Empty:
+                    if process.is_alive():
+                        continue
+                    # anything the worker sent before exiting is in the pipe by now
+                    try:
+                        batch = records.get(timeout=1)
+                    except queue.Empty:
+                        raise ParseException("The worker parsing %s exited with code %s" % (name, process.exitcode))
+                if batch is None:
+                    break
+                if isinstance(batch, Exception):
+                    raise batch
+                for record in batch:
+                    yield record
+            process.join()
+        finally:
+            if process.is_alive():
+                process.terminate()
+                process.join()
+            if process in self._running:
+                self._running.remove(process)
+
+    def close(self):
+        "Stop any workers still parsing"
+        for process in self._running:
+            if process.is_alive():
+                process.terminate()
+            process.join()
+        self._running = []
+        self._started = {}
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+def open_subscription(path, workers=None, **options):
+    "Open a subscription ZIP; see Subscription"
+    return Subscription(path, workers, **options)
+
+if __name__ == '__main__':
+    import sys
+    import time
+    start = time.perf_counter()
+    with open_subscription(sys.argv[1]) as subscription:
+        for name in subscription.names():
+            count = sum(1 for record in subscription.records(name))
+            print("%d records found in %s" % (count, name))
+    print("%.1fs" % (time.perf_counter() - start))
+
+import unittest
+import shutil
+import tempfile
+
+class SubscriptionTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.synthetic import write_cycle
+        self.directory = tempfile.mkdtemp()
+        write_cycle(self.directory, 0.002)
+        self.path = os.path.join(self.directory, 'subscription.zip')
+        with zipfile.ZipFile(self.path, 'w', zipfile.ZIP_DEFLATED) as archive:
+            for name in READERS:
+                archive.write(os.path.join(self.directory, name), '56DySubscription/' + name)
+            archive.writestr('56DySubscription/README.txt', 'not parsed')
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def parsed(self, name):
+        from faddsdata.parse import open_file
+        with open_file(os.path.join(self.directory, name)) as fp:
+            return list(READERS[name](fp))
+
+    def test_members(self):
+        with zipfile.ZipFile(self.path) as archive:
+            self.assertEqual({'APT.txt': '56DySubscription/APT.txt', 'AWOS.txt': '56DySubscription/AWOS.txt',
+                              'NATFIX.txt': '56DySubscription/NATFIX.txt'}, find_members(archive))
+
+    def test_records(self):
+        for workers in (None, 1, 0):
+            with open_subscription(self.path, workers, batch_size=7) as subscription:
+                self.assertEqual(['APT.txt', 'AWOS.txt', 'NATFIX.txt'], subscription.names())
+                # read in a different order from the one the workers were started in
+                for name in ('NATFIX.txt', 'APT.txt', 'AWOS.txt'):
+                    self.assertEqual(self.parsed(name), list(subscription.records(name)))
+                self.assertEqual(self.parsed('AWOS.txt'), list(subscription.records('AWOS.txt')))
+                self.assertRaises(KeyError, subscription.records, 'FIX.txt')
+
+    def test_options(self):
+        with open_subscription(self.path, fields=('id', 'lat')) as subscription:
+            self.assertEqual([dict((key, r[key]) for key in ('id', 'lat')) for r in self.parsed('NATFIX.txt')],
+                             list(subscription.records('NATFIX.txt')))
+        self.assertRaises(ValueError, open_subscription, self.path, 2, lazy=True)
+        with open_subscription(self.path, lazy=True) as subscription:
+            self.assertEqual(self.parsed('AWOS.txt'), [r.as_dict() for r in subscription.records('AWOS.txt')])
+
+    def test_error(self):
+        broken = os.path.join(self.directory, 'broken.zip')
+        with zipfile.ZipFile(broken, 'w') as archive:
+            archive.writestr('AWOS.txt', 'AWOS1 too short\n')
+        with open_subscription(broken) as subscription:
+            self.assertRaises(ParseException, list, subscription.records('AWOS.txt'))
@@ -0,0 +1,289 @@
+"""Synthetic FADDS files for benchmarks and tests.
+
+The lines are laid out with the real format definitions and filled with plausible values:
+coordinates in both of the FAA's formats, dates, numbers and flags of the types declared in
+format_definitions, identifiers, names and the odd non-ASCII character. Run
+"python -m faddsdata.synthetic DIRECTORY" to write a cycle of APT.txt, AWOS.txt and NATFIX.txt."""
+
+import os
+import random
+
+from faddsdata.format_definitions import APT_RECORDS, ATT_RECORDS, RWY_RECORDS, RMK_RECORDS, APT_TYPE_MAP, AWOS_RECORDS, AWOS_TYPES
+from faddsdata.natfix import NATFIX_RECORDS
+from faddsdata.parse import format_line
+
+# Roughly the number of each record in a 56 day subscription
+APT_FACILITIES = 20000
+AWOS_STATIONS = 2000
+NATFIX_FIXES = 60000
+
+# The FAA files end their lines with CRLF
+NEWLINE = '\r\n'
+
+STATES = (('KS', 'KANSAS'), ('MO', 'MISSOURI'), ('CO', 'COLORADO'), ('CA', 'CALIFORNIA'), ('TX', 'TEXAS'),
+          ('NY', 'NEW YORK'), ('AK', 'ALASKA'), ('FL', 'FLORIDA'), ('WA', 'WASHINGTON'), ('NM', 'NEW MEXICO'))
+WORDS = ('LAWRENCE', 'MUNICIPAL', 'REGIONAL', 'COUNTY', 'MEMORIAL', 'FIELD', 'VALLEY', 'LAKE', 'RIVER',
+         'MOUNTAIN', 'PRAIRIE', 'SPRINGS', 'CITY', 'AIRPARK', 'RANCH', 'INTERNATIONAL', 'CANON')
+ARTCCS = ('ZKC', 'ZDV', 'ZOA', 'ZAN', 'ZDC', 'ZFW', 'ZNY', 'ZSE', 'ZAB', 'ZJX')
+SOURCES = ('FAA', 'NGS', '3RD PARTY SURVEY', 'OWNER', 'ESTIMATED')
+
+def _text(generator, width, words=2):
+    value = ' '.join(generator.choice(WORDS) for _ in range(words))[:width].strip()
+    # a few names carry the accented characters that parse.clean_field deals with
+    if generator.random() < 0.005:
+        value = value.replace('N', '\xd1', 1)
+    return value
+
+def _identifier(generator, length=3):
+    letters = 'ABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789'
+    return generator.choice('ABCDEFGHIJKLMNOPQRSTUVWXYZ') + ''.join(generator.choice(letters) for _ in range(length - 1))
+
+def _date(generator):
+    return '%02d/%02d/%04d' % (generator.randint(1, 12), generator.randint(1, 28), generator.randint(1940, 2013))
+
+def dashed_dms(value, latitude):
+    "Format decimal degrees the way the FAA does in *_formatted fields, like 39-00-40.0000N"
+    hemisphere = ('N' if value >= 0 else 'S') if latitude else ('E' if value >= 0 else 'W')
+    seconds = round(abs(value) * 3600, 4)
+    degrees, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return '%0*d-%02d-%07.4f%s' % (2 if latitude else 3, degrees, minutes, seconds, hemisphere)
+
+def dms_seconds(value, latitude):
+    "Format decimal degrees as total seconds, as in *_seconds fields, like 140440.0000N"
+    hemisphere = ('N' if value >= 0 else 'S') if latitude else ('E' if value >= 0 else 'W')
+    return '%.4f%s' % (abs(value) * 3600, hemisphere)
+
+def dms(value, latitude):
+    "Format decimal degrees like NATFIX does, 335303N or 0844402W"
+    hemisphere = ('N' if value >= 0 else 'S') if latitude else ('E' if value >= 0 else 'W')
+    seconds = int(round(abs(value) * 3600))
+    degrees, seconds = divmod(seconds, 3600)
+    minutes, seconds = divmod(seconds, 60)
+    return '%0*d%02d%02d%s' % (2 if latitude else 3, degrees, minutes, seconds, hemisphere)
+
+def _typed_value(generator, kind, width):
+    if kind == 'int':
+        return str(generator.randint(0, 10 ** min(width, 4) - 1))
+    if kind == 'float':
+        return ('%.1f' % generator.uniform(0, 10 ** (width - 3)))[:width]
+    if kind == 'date':
+        return _date(generator)
+    if kind == 'month_year':
+        return '%02d/%04d' % (generator.randint(1, 12), generator.randint(1940, 2013))
+    if kind == 'compact_date':
+        return '%02d%02d%04d' % (generator.randint(1, 12), generator.randint(1, 28), generator.randint(2000, 2013))
+    if kind == 'yes_no':
+        return generator.choice('YN ').strip()
+    return ''
+
+def _fill(generator, definition, types, values):
+    "Fill the typed fields of a definition, leaving the values already given alone"
+    record = {}
+    for name, width in definition:
+        if name is None:
+            continue
+        kind = types.get(name)
+        if kind is not None and kind != 'dashed_dms' and generator.random() < 0.9:
+            record[name] = _typed_value(generator, kind, width)
+    record.update(values)
+    return record
+
+def _runway_end(generator, prefix, lat, lon):
+    return {
+        prefix + 'latitude_physical_runway_end_formatted': dashed_dms(lat, True),
+        prefix + 'latitude_physical_runway_end_seconds': dms_seconds(lat, True),
+        prefix + 'longitude_physical_runway_end_formatted': dashed_dms(lon, False),
+        prefix + 'longitude_physical_runway_end_seconds': dms_seconds(lon, False),
+        prefix + 'runway_end_position_source': generator.choice(SOURCES),
+    }
+
+def apt_facility_lines(generator, number):
+    "The APT, ATT, RWY and RMK lines for one facility"
+    state, state_name = generator.choice(STATES)
+    site = '%05d.%s*A' % (number % 100000, generator.choice('0123456789'))
+    lat = generator.uniform(25, 49)
+    lon = generator.uniform(-125, -67)
+    city = _text(generator, 40, 1)
+    apt = _fill(generator, APT_RECORDS, APT_TYPE_MAP['APT'], {
+        'record_type': 'APT',
+        'facility_site_number': site,
+        'facility_type': generator.choice(('AIRPORT', 'AIRPORT', 'AIRPORT', 'HELIPORT', 'SEAPLANE BASE')),
+        'location_identifier': _identifier(generator, generator.choice((3, 4))),
+        'faa_region_code': 'ACE',
+        'associated_state_post_office_code': state,
+        'associated_state_name': state_name,
+        'county_name': _text(generator, 21, 1),
+        'county_state_post_office_code': state,
+        'associated_city': city,
+        'facility_name': _text(generator, 50, 2),
+        'ownership_type': generator.choice(('PU', 'PR')),
+        'use_type': generator.choice(('PU', 'PR')),
+        'owners_name': 'CITY OF ' + city,
+        'owners_phone_number': '785-%03d-%04d' % (generator.randint(0, 999), generator.randint(0, 9999)),
+        'point_latitude_formatted': dashed_dms(lat, True),
+        'point_latitude_seconds': dms_seconds(lat, True),
+        'point_longitude_formatted': dashed_dms(lon, False),
+        'point_longitude_seconds': dms_seconds(lon, False),
+        'point_determination_method': 'E',
+        'magnetic_variation': '%02d%s' % (generator.randint(0, 20), generator.choice('EW')),
+        'sectional': 'KANSAS CITY',
+        'boundary_artcc_identifier': generator.choice(ARTCCS),
+        'responsible_artcc_identifier': generator.choice(ARTCCS),
+        'status_code': 'O',
+        'available_fuels': generator.choice(('100LL', '100LL     A', '', 'A')),
+        'control_tower': generator.choice('YN'),
+        'common_traffic_advisory_frequency': '%.3f' % generator.uniform(118, 136),
+        'position_source': generator.choice(SOURCES),
+        'elevation_source': generator.choice(SOURCES),
+    })
+    lines = [format_line(apt, APT_RECORDS)]
+    if generator.random() < 0.5:
+        lines.append(format_line({'record_type': 'ATT', 'facility_site_number': site, 'state_post_office_code': state,
+                                  'attendace_schedule_sequence': '1', 'attendance_schedule': 'ALL/ALL/0800-2000'}, ATT_RECORDS))
+    for _ in range(generator.choice((1, 1, 2, 3))):
+        heading = generator.randint(1, 18)
+        length = generator.randint(1500, 12000)
+        # the reciprocal end is placed a little way off from the base end
+        end_lat = lat + generator.uniform(-0.02, 0.02)
+        end_lon = lon + generator.uniform(-0.02, 0.02)
+        rwy = _fill(generator, RWY_RECORDS, APT_TYPE_MAP['RWY'], {
+            'record_type': 'RWY',
+            'facility_site_number': site,
+            'state_post_office_code': state,
+            'runway_identification': '%02d/%02d' % (heading, heading + 18),
+            'runway_length': str(length),
+            'surface_type_condition': generator.choice(('ASPH-G', 'CONC-E', 'TURF-F', 'GRVL')),
+            'base_end_identifier': '%02d' % heading,
+            'reciprocal_end_identifer': '%02d' % (heading + 18),
+        })
+        rwy.update(_runway_end(generator, 'base_end_', lat, lon))
+        rwy.update(_runway_end(generator, 'reciprocal_end_', end_lat, end_lon))
+        lines.append(format_line(rwy, RWY_RECORDS))
+    for _ in range(generator.choice((0, 1, 1, 2, 4))):
+        lines.append(format_line({'record_type': 'RMK', 'facility_site_number': site, 'state_post_office_code': state,
+                                  'element_text': ' '.join(generator.choice(WORDS) for _ in range(generator.randint(3, 40)))}, RMK_RECORDS))
+    return lines
+
+def write_apt(fp, facilities=APT_FACILITIES, seed=0):
+    "Write an APT.txt with the given number of facilities to an open text file and return the number of lines"
+    generator = random.Random(seed)
+    count = 0
+    for number in range(facilities):
+        lines = apt_facility_lines(generator, number)
+        fp.write(NEWLINE.join(lines) + NEWLINE)
+        count += len(lines)
+    return count
+
+def write_awos(fp, stations=AWOS_STATIONS, seed=0):
+    "Write an AWOS.txt with the given number of stations to an open text file and return the number of lines"
+    generator = random.Random(seed)
+    count = 0
+    for number in range(stations):
+        state, _ = generator.choice(STATES)
+        lat = generator.uniform(25, 49)
+        lon = generator.uniform(-125, -67)
+        identifier = _identifier(generator, 3)
+        awos = _fill(generator, AWOS_RECORDS, AWOS_TYPES, {
+            'record_type': 'AWOS1',
+            'id': identifier,
+            'sensor_type': generator.choice(('ASOS', 'AWOS-3', 'AWOS-3PT', 'AWOS-A')),
+            'commissioning_status': 'Y',
+            'latitude': dashed_dms(lat, True),
+            'longitude': dashed_dms(lon, False),
+            'survey_method': 'E',
+            'frequency': '%.3f' % generator.uniform(118, 136),
+            'telephone_number': '785-%03d-%04d' % (generator.randint(0, 999), generator.randint(0, 9999)),
+            'landing_facility_site_number': '%05d.*A' % number,
+            'city': _text(generator, 40, 1),
+            'state_post_office_code': state,
+        })
+        fp.write(format_line(awos, AWOS_RECORDS) + NEWLINE)
+        count += 1
+        if generator.random() < 0.2:
+            fp.write(format_line({'record_type': 'AWOS2', 'id': identifier, 'sensor_type': awos['sensor_type'],
+                                  'commissioning_status': 'Y'}, AWOS_RECORDS) + NEWLINE)
+            count += 1
+    return count
+
+def write_natfix(fp, fixes=NATFIX_FIXES, seed=0):
+    "Write a NATFIX.txt with the given number of fixes, its preamble and end marker, and return the number of fixes"
+    generator = random.Random(seed)
+    fp.write('NATFIX'.ljust(40) + NEWLINE)
+    fp.write("'20131017".ljust(40) + NEWLINE)
+    for _ in range(fixes):
+        state, _ = generator.choice(STATES)
+        line = format_line({
+            'id': _identifier(generator, generator.choice((3, 4, 5))),
+            'latitude_string': dms(generator.uniform(25, 49), True),
+            'longitude_string': dms(generator.uniform(-125, -67), False),
+            'artcc_id': "'" + generator.choice(ARTCCS),
+            'state_code': state,
+            'icao_code': 'K' + generator.choice('1234567'),
+            'fix_navaid_type': generator.choice(('ARPT', 'REP-PT', 'VORTAC', 'NDB', 'WP')),
+        }, NATFIX_RECORDS)
+        fp.write('I' + line[1:] + NEWLINE)
+    fp.write('$'.ljust(40) + NEWLINE)
+    return fixes
+
+def write_cycle(directory, scale=1.0, seed=0):
+    """Write APT.txt, AWOS.txt and NATFIX.txt to directory, sized as scale times a subscription,
+    and return a dict of file name to line count"""
+    counts = {}
+    for name, write, size in (('APT.txt', write_apt, APT_FACILITIES), ('AWOS.txt', write_awos, AWOS_STATIONS),
+                              ('NATFIX.txt', write_natfix, NATFIX_FIXES)):
+        with open(os.path.join(directory, name), 'w', encoding='latin-1', newline='') as fp:
+            counts[name] = write(fp, max(1, int(size * scale)), seed)
+    return counts
+
+if __name__ == '__main__':
+    import sys
+    directory = sys.argv[1]
+    scale = float(sys.argv[2]) if len(sys.argv) > 2 else 1.0
+    for name, count in sorted(write_cycle(directory, scale).items()):
+        print("%s: %d lines" % (name, count))
+
+import unittest
+
+class SyntheticTests(unittest.TestCase):
+    def test_formats(self):
+        from faddsdata.parse import convert_dashed_dms_to_float, convert_dms_to_float
+        for value in (39.011111, -95.216472, 0.5, -179.999):
+            self.assertAlmostEqual(value, convert_dashed_dms_to_float(dashed_dms(value, abs(value) < 90)), 5)
+            self.assertAlmostEqual(value, convert_dms_to_float(dms(value, abs(value) < 90)), 3)
+        self.assertEqual('39-00-40.0000N', dashed_dms(39 + 40 / 3600.0, True))
+        self.assertEqual('095-12-59.3000W', dashed_dms(-(95 + 12 / 60.0 + 59.3 / 3600.0), False))
+        self.assertEqual('140440.0000N', dms_seconds(39 + 40 / 3600.0, True))
+
+    def test_write_cycle(self):
+        import shutil, tempfile
+        from faddsdata.apt import iter_apt, iter_apt_facilities
+        from faddsdata.awos import iter_awos
+        from faddsdata.natfix import iter_natfix
+        from faddsdata.parse import open_file
+        directory = tempfile.mkdtemp()
+        self.addCleanup(shutil.rmtree, directory)
+        counts = write_cycle(directory, 0.005, seed=3)
+        with open_file(os.path.join(directory, 'APT.txt')) as fp:
+            records = list(iter_apt(fp, typed=True))
+        self.assertEqual(counts['APT.txt'], len(records))
+        facilities = [r for r in records if r['record_type'] == 'APT']
+        self.assertEqual(100, len(facilities))
+        for facility in facilities:
+            self.assertTrue(25 <= facility['lat'] <= 49 and -125 <= facility['lon'] <= -67)
+            self.assertEqual(facility['lat'], facility['point_latitude_formatted'])
+        with open_file(os.path.join(directory, 'APT.txt'), binary=True) as fp:
+            self.assertEqual(100, len(list(iter_apt_facilities(fp))))
+        with open_file(os.path.join(directory, 'AWOS.txt')) as fp:
+            self.assertEqual(counts['AWOS.txt'], len(list(iter_awos(fp, typed=True))))
+        with open_file(os.path.join(directory, 'NATFIX.txt')) as fp:
+            self.assertEqual(300, len(list(iter_natfix(fp))))
+
+    def test_seed(self):
+        from io import StringIO
+        first, second, third = StringIO(), StringIO(), StringIO()
+        write_apt(first, 20, seed=1)
+        write_apt(second, 20, seed=1)
+        write_apt(third, 20, seed=2)
+        self.assertEqual(first.getvalue(), second.getvalue())
+        self.assertNotEqual(first.getvalue(), third.getvalue())
@@ -0,0 +1,275 @@
+"""Check every line of a subscription without parsing it into records.
+
+Each line is checked for the length of its layout, for a record type the layouts know, and for
+the syntax of every coordinate the parsers would convert to lat/lon (the DMS fields of the
+derived field tables). Nothing else is extracted, so a file is scanned several times faster than
+the parsers can read it, and the byte ranges of the files are spread over a pool of processes:
+
+    for report in validate_cycle('cycle_2013_10_17/'):
+        print(report)
+
+Run "python -m faddsdata.validate DIRECTORY" to check a cycle before using it; it exits with
+status 1 if any line has a problem."""
+
+import collections
+import multiprocessing
+import os
+import re
+from collections import namedtuple
+
+from faddsdata.apt import APT_LAYOUTS, APT_DERIVED_FIELDS
+from faddsdata.awos import AWOS_LAYOUT, AWOS_DERIVED_FIELDS
+from faddsdata.natfix import NATFIX_LAYOUT, NATFIX_DERIVED_FIELDS
+from faddsdata.parallel import CHUNK_SIZE, split_file
+from faddsdata.parse import LATIN1_WHITESPACE, CLEANUP_TABLE, CLEANUP_DELETE, clean_bytes_field, if_present, \
+    convert_dms_to_float, convert_dashed_dms_to_float
+
+# Problems kept per file; the rest are only counted
+LIMIT = 20
+
+# The files checked by validate_cycle
+FILES = ('APT.txt', 'AWOS.txt', 'NATFIX.txt')
+
+# The record types of AWOS.txt, which share one layout
+AWOS_RECORD_TYPES = ('AWOS1', 'AWOS2')
+
+# The syntax each coordinate converter accepts, for latitudes and longitudes
+DMS_PATTERNS = {
+    convert_dashed_dms_to_float: (re.compile(rb'\d{1,2}-\d{1,2}-\d{1,2}(\.\d+)?[NS]\Z'),
+                                  re.compile(rb'\d{1,3}-\d{1,2}-\d{1,2}(\.\d+)?[EW]\Z')),
+    convert_dms_to_float: (re.compile(rb'\d{6}[NS]\Z'), re.compile(rb'\d{7}[EW]\Z')),
+}
+
+# line is the line number in the file, counting from 1. kind is 'length', 'record_type' or 'coordinate'.
+Problem = namedtuple('Problem', 'file line kind message')
+
+class Report(object):
+    """The result of validating one file: the number of lines checked, lines by record type,
+    problems by kind and the first few Problems in file order"""
+
+    def __init__(self, name, limit=LIMIT):
+        self.name = name
+        self.limit = limit
+        self.lines = 0
+        self.record_types = {}
+        self.counts = {'length': 0, 'record_type': 0, 'coordinate': 0}
+        self.problems = []
+
+    @property
+    def ok(self):
+        return not any(self.counts.values())
+
+    def add(self, lines, record_types, counts, problems):
+        "Add the results of the next range of the file, whose line numbers start after the lines seen so far"
+        for problem in problems:
+            if len(self.problems) < self.limit:
+                self.problems.append(problem._replace(line=problem.line + self.lines))
+        self.lines += lines
+        for record_type, count in record_types.items():
+            self.record_types[record_type] = self.record_types.get(record_type, 0) + count
+        for kind, count in counts.items():
+            self.counts[kind] += count
+
+    def __str__(self):
+        lines = ["%s: %d lines, %s" % (self.name, self.lines, 'OK' if self.ok else ', '.join(
+            '%d %s' % (count, kind) for kind, count in sorted(self.counts.items()) if count))]
+        for problem in self.problems:
+            lines.append("  line %d: %s" % (problem.line, problem.message))
+        return '\n'.join(lines)
+
+def _coordinate_checks(layout, derived):
+    # (source field, slice, pattern, condition, (name, slice) of the fields the condition reads) for each DMS field converted by the derived fields
+    checks = []
+    for key, source, convert, condition in derived:
+        patterns = DMS_PATTERNS.get(convert)
+        if patterns is None:
+            continue
+        pattern = patterns[1] if key.endswith('lon') else patterns[0]
+        fields = tuple((name, layout.slices[layout.names.index(name)]) for name in getattr(condition, 'fields', ()))
+        checks.append((source, layout.slices[layout.names.index(source)], pattern, condition, fields))
+    return tuple(checks)
+
+def _checks(name):
+    # (length of the record type prefix, {prefix: (line length, coordinate checks)}, preamble lines, end marker)
+    if name == 'APT.txt':
+        return 3, dict((record_type.encode('latin-1'), (layout.length, _coordinate_checks(layout, APT_DERIVED_FIELDS.get(record_type, ()))))
+                       for record_type, layout in APT_LAYOUTS.items()), 0, None
+    if name == 'AWOS.txt':
+        check = (AWOS_LAYOUT.length, _coordinate_checks(AWOS_LAYOUT, AWOS_DERIVED_FIELDS))
+        return 5, dict((record_type.encode('latin-1'), check) for record_type in AWOS_RECORD_TYPES), 0, None
+    if name == 'NATFIX.txt':
+        # every line is a fix, whatever its first column holds
+        return 0, {b'': (NATFIX_LAYOUT.length, _coordinate_checks(NATFIX_LAYOUT, NATFIX_DERIVED_FIELDS))}, 2, b'$'
+    raise KeyError(name)
+
+def validate_lines(lines, name, limit=LIMIT, first=True):
+    """Check raw lines (bytes) of the named file. first says whether they start the file, so NATFIX's
+    preamble is skipped. Returns (lines, lines by record type, problems by kind, the first limit
+    Problems numbered from 1, whether the end marker was reached)."""
+    prefix, checks, preamble, end = _checks(name)
+    record_types = {}
+    counts = {'length': 0, 'record_type': 0, 'coordinate': 0}
+    problems = []
+    number = 0
+    for line in lines:
+        number += 1
+        if first and number <= preamble:
+            continue
+        if end is not None and line[:1] == end:
+            return number, record_types, counts, problems, True
+        record_type = line[:prefix]
+        check = checks.get(record_type)
+        if check is None:
+            counts['record_type'] += 1
+            if len(problems) < limit:
+                problems.append(Problem(name, number, 'record_type', "Unknown record type %r" % record_type.decode('latin-1')))
+            continue
+        record_types[record_type] = record_types.get(record_type, 0) + 1
+        length, coordinates = check
+        data = line.rstrip(b'\r\n')
+        if len(data) != length:
+            counts['length'] += 1
+            if len(problems) < limit:
+                problems.append(Problem(name, number, 'length', "Expected length %d, got length %d" % (length, len(data))))
+            continue
+        for source, field, pattern, condition, fields in coordinates:
+            value = data[field].strip(LATIN1_WHITESPACE)
+            if pattern.match(value):
+                continue
+            if condition is not None:
+                if condition is if_present:
+                    if not value:
+                        continue
+                elif not condition(dict((key, clean_bytes_field(data[s])) for key, s in fields), clean_bytes_field(value)):
+                    continue
+            if not value.isascii() and pattern.match(value.translate(CLEANUP_TABLE, CLEANUP_DELETE)):
+                continue
+            counts['coordinate'] += 1
+            if len(problems) < limit:
+                problems.append(Problem(name, number, 'coordinate', "Bad coordinate %r in %s" % (value.decode('latin-1'), source)))
+    return number, record_types, counts, problems, False
+
+def _validate_range(path, name, start, end, limit):
+    # runs in a worker process
+    with open(path, 'rb') as fp:
+        fp.seek(start)
+        data = fp.read(end - start)
+    # split on \n only, as the file readers do
+    lines = data.split(b'\n')
+    last = lines.pop()
+    lines = [line + b'\n' for line in lines]
+    if last:
+        lines.append(last)
+    return validate_lines(lines, name, limit, start == 0)
+
+def _decoded(record_types):
+    return dict((record_type.decode('latin-1'), count) for record_type, count in record_types.items())
+
+def validate_file(path, name=None, limit=LIMIT):
+    "Validate one file in this process, returning a Report. name is the file's name in FILES, by default that of path."
+    name = name or os.path.basename(path)
+    report = Report(name, limit)
+    with open(path, 'rb') as fp:
+        lines, record_types, counts, problems, _ = validate_lines(fp, name, limit)
+    report.add(lines, _decoded(record_types), counts, problems)
+    return report
+
+def validate_cycle(directory, workers=None, chunk_size=CHUNK_SIZE, limit=LIMIT, names=FILES):
+    """Validate each of the named files in a subscription directory, returning a Report for each that exists.
+    The ranges of all the files are checked in one pool of worker processes, one per core unless workers
+    is given; workers=0 checks them in this process."""
+    paths = [(name, os.path.join(directory, name)) for name in names if os.path.exists(os.path.join(directory, name))]
+    if workers == 0:
+        return [validate_file(path, name, limit) for name, path in paths]
+    pool = multiprocessing.Pool(workers)
+    try:
+        results = collections.OrderedDict()
+        for name, path in paths:
+            results[name] = [pool.apply_async(_validate_range, (path, name, start, end, limit))
+                             for start, end in split_file(path, chunk_size)]
+        reports = []
+        for name, ranges in results.items():
+            report = Report(name, limit)
+            for result in ranges:
+                lines, record_types, counts, problems, ended = result.get()
+                report.add(lines, _decoded(record_types), counts, problems)
+                if ended:
+                    # nothing after the end marker is a record
+                    break
+            reports.append(report)
+        return reports
+    finally:
+        pool.terminate()
+        pool.join()
+
+if __name__ == '__main__':
+    import sys
+    reports = validate_cycle(sys.argv[1])
+    for report in reports:
+        print(report)
+    sys.exit(0 if all(report.ok for report in reports) else 1)
+
+import unittest
+import shutil
+import tempfile
+
+class ValidateTests(unittest.TestCase):
+    def setUp(self):
+        from faddsdata.synthetic import write_cycle
+        self.directory = tempfile.mkdtemp()
+        self.counts = write_cycle(self.directory, 0.002)
+
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+
+    def edit(self, name, edit):
+        path = os.path.join(self.directory, name)
+        with open(path, 'rb') as fp:
+            lines = fp.readlines()
+        edit(lines)
+        with open(path, 'wb') as fp:
+            fp.writelines(lines)
+
+    def test_valid(self):
+        for workers in (0, 2):
+            reports = validate_cycle(self.directory, workers, chunk_size=4096)
+            self.assertEqual(list(FILES), [report.name for report in reports])
+            self.assertTrue(all(report.ok for report in reports))
+            self.assertEqual(self.counts['APT.txt'], reports[0].lines)
+            self.assertEqual(self.counts['NATFIX.txt'], sum(reports[2].record_types.values()))
+            self.assertTrue(str(reports[1]).endswith('OK'))
+
+    def test_problems(self):
+        latitude = APT_LAYOUTS['APT'].slices[APT_LAYOUTS['APT'].names.index('point_latitude_formatted')]
+        def apt(lines):
+            lines[0] = lines[0][:latitude.start] + b'39-00-4O.00N '.ljust(latitude.stop - latitude.start) + lines[0][latitude.stop:]
+            lines[3] = lines[3][:40] + b'\r\n'
+            lines.insert(5, b'XYZ' + lines[5][3:])
+            for i in range(10, len(lines), 2):
+                lines[i] = b'XYZ' + lines[i][3:]
+        self.edit('APT.txt', apt)
+        # NATFIX lines are numbered from the top of the file, preamble included
+        self.edit('NATFIX.txt', lambda lines: lines.__setitem__(4, lines[4][:8] + b'4004X5N ' + lines[4][16:]))
+        for workers in (0, 2):
+            apt_report, awos_report, natfix_report = validate_cycle(self.directory, workers, chunk_size=4096, limit=3)
+            self.assertEqual([(1, 'coordinate'), (4, 'length'), (6, 'record_type')], [(p.line, p.kind) for p in apt_report.problems])
+            self.assertEqual("Bad coordinate '39-00-4O.00N' in point_latitude_formatted", apt_report.problems[0].message)
+            self.assertEqual(len(range(10, self.counts['APT.txt'] + 1, 2)) + 1, apt_report.counts['record_type'])
+            self.assertTrue(awos_report.ok)
+            self.assertEqual([(5, 'coordinate')], [(p.line, p.kind) for p in natfix_report.problems])
+            self.assertFalse(natfix_report.ok)
+
+    def test_optional_coordinates(self):
+        from faddsdata.parse import format_line
+        from faddsdata.format_definitions.awos import AWOS_RECORDS
+        # blank runway end and AWOS2 coordinates are allowed, a blank airport reference point isn't
+        with open(os.path.join(self.directory, 'AWOS.txt'), 'wb') as fp:
+            fp.write(format_line({'record_type': 'AWOS2', 'id': 'ABC', 'latitude': 'remark'}, AWOS_RECORDS).encode('latin-1') + b'\n')
+            fp.write(format_line({'record_type': 'AWOS1', 'id': 'ABC'}, AWOS_RECORDS).encode('latin-1') + b'\n')
+            fp.write(format_line({'record_type': 'AWOS1', 'id': 'ABC', 'latitude': '39-00-40.0000N', 'longitude': '95-12-59.30W'},
+                                 AWOS_RECORDS).encode('latin-1') + b'\n')
+            fp.write(format_line({'record_type': 'AWOS1', 'id': 'ABC', 'latitude': '39-00-40.0000\xd1', 'longitude': '95-12-59.30W'},
+                                 AWOS_RECORDS).encode('latin-1') + b'\n')
+        report = validate_file(os.path.join(self.directory, 'AWOS.txt'))
+        self.assertTrue(report.ok, str(report))
+        self.assertEqual({'AWOS1': 3, 'AWOS2': 1}, report.record_types)
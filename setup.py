@@ -12,6 +12,10 @@ setup(
     packages=find_packages(),
     package_data={
     },
+    extras_require={
+        # columnar, geodesy and the fast path of search
+        'numpy': ['numpy'],
+    },
     classifiers=[
         'Development Status :: 5 - Production/Stable',
         'Environment :: Web Environment',